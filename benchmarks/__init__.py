@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+#
+# Benchmarks for coda, run with ``python -m benchmarks run``
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+#
+# Benchmark suite for core coda operations
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+from collections import OrderedDict
+
+import coda
+from benchmarks import tree
+
+
+# config
+# ------
+__base__ = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+__cases__ = OrderedDict()
+
+
+def case(name, cli=False, budget=None):
+    """
+    Register benchmark case. Cases take the benchmark context, do any
+    setup that shouldn't be timed, and return a function to time along
+    with the number of operations it performs. Cases with a budget (in
+    seconds) fail the run if their median time exceeds it.
+    """
+    def decorator(func):
+        func.cli = cli
+        func.budget = budget
+        __cases__[name] = func
+        return func
+    return decorator
+
+
+# context
+# -------
+class Context(object):
+    """
+    State shared by benchmark cases.
+
+    Args:
+        path (str): Directory with synthetic file tree.
+        files (dict): Mapping of file paths to metadata.
+        config (str): Path to coda config for command line benchmarks.
+        lookups (int): Number of files to use for point lookups.
+        seed (int): Seed for random sampling of files.
+    """
+
+    def __init__(self, path, files, config, lookups=1000, seed=0):
+        self.path = path
+        self.files = files
+        self.config = config
+        rng = random.Random(seed)
+        self.sample = rng.sample(sorted(files), min(lookups, len(files)))
+        self.directories = sorted(set(os.path.dirname(x) for x in self.sample))
+        self._seeded = False
+        return
+
+    def collection(self):
+        """
+        Return collection with metadata for all files in the tree.
+        """
+        return coda.Collection(files=[
+            coda.File(path, metadata=self.files[path], verify=False) for path in self.files
+        ])
+
+    def reset(self):
+        """
+        Remove all records from the database.
+        """
+        coda.db.session.engine.drop()
+        self._seeded = False
+        return
+
+    def seed(self):
+        """
+        Make sure the database has records for all files in the tree.
+        """
+        if not self._seeded:
+            self.reset()
+            coda.add(self.collection())
+            coda.ensure_index('group')
+            self._seeded = True
+        return
+
+    def call(self, *args):
+        """
+        Run coda command line with benchmark configuration.
+        """
+        with open(os.devnull, 'w') as null:
+            subprocess.check_call(
+                [sys.executable, '-m', 'coda', '-c', self.config] + list(args),
+                stdout=null, cwd=__base__
+            )
+        return
+
+
+# ingest
+# ------
+@case('ingest.add')
+def ingest_add(ctx):
+    ctx.reset()
+    cl = ctx.collection()
+    return lambda: coda.add(cl), len(cl)
+
+
+@case('ingest.sync')
+def ingest_sync(ctx):
+    ctx.reset()
+    return lambda: coda.sync(ctx.path), len(ctx.files)
+
+
+@case('ingest.sync_unchanged')
+def ingest_sync_unchanged(ctx):
+    ctx.seed()
+    coda.sync(ctx.path)
+    return lambda: coda.sync(ctx.path), len(ctx.files)
+
+
+# queries
+# -------
+@case('query.find_one')
+def query_find_one(ctx):
+    ctx.seed()
+
+    def run():
+        for path in ctx.sample:
+            coda.find_one({'path': path})
+    return run, len(ctx.sample)
+
+
+@case('query.find')
+def query_find(ctx):
+    ctx.seed()
+    return lambda: coda.find({'group': 'train'}), 1
+
+
+@case('query.find_paths')
+def query_find_paths(ctx):
+    ctx.seed()
+    return lambda: coda.find({'group': 'train'}, fields=[]), 1
+
+
+@case('query.find_unindexed')
+def query_find_unindexed(ctx):
+    ctx.seed()
+    return lambda: coda.find({'qc.passed': False}, fields=[]), 1
+
+
+@case('query.iterate')
+def query_iterate(ctx):
+    ctx.seed()
+    return lambda: sum(1 for fi in coda.iterate({'group': 'train'}, fields=[])), 1
+
+
+@case('query.listdir')
+def query_listdir(ctx):
+    ctx.seed()
+
+    def run():
+        for path in ctx.directories:
+            list(coda.listdir(path, fields=[]))
+    return run, len(ctx.directories)
+
+
+# collections
+# -----------
+@case('collection.filter')
+def collection_filter(ctx):
+    ctx.seed()
+    cl = coda.find({})
+    return lambda: cl.filter(lambda x: x.count < 500000), 1
+
+
+@case('collection.union')
+def collection_union(ctx):
+    ctx.seed()
+    one, two = coda.find({'group': 'train'}), coda.find({'group': 'test'})
+    return lambda: one + two, 1
+
+
+@case('collection.difference')
+def collection_difference(ctx):
+    ctx.seed()
+    one, two = coda.find({}), coda.find({'group': 'test'})
+    return lambda: one - two, 1
+
+
+# command line
+# ------------
+@case('cli.version', cli=True, budget=0.15)
+def cli_version(ctx):
+    return lambda: subprocess.call([sys.executable, '-m', 'coda', 'version'], stderr=subprocess.DEVNULL, cwd=__base__), 1
+
+
+@case('cli.find', cli=True)
+def cli_find(ctx):
+    ctx.seed()
+    return lambda: ctx.call('find', 'group', 'train', '--format', 'null'), 1
+
+
+@case('cli.list', cli=True)
+def cli_list(ctx):
+    ctx.seed()
+    return lambda: ctx.call('list', '-r', ctx.path), 1
+
+
+# running
+# -------
+def measure(func, ctx, repeat=3):
+    """
+    Run benchmark case, returning summary of timings.
+    """
+    times, ops = [], 1
+    for idx in range(repeat):
+        run, ops = func(ctx)
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    ordered = sorted(times)
+    median = ordered[len(ordered) // 2]
+    return OrderedDict([
+        ('ops', ops),
+        ('repeat', repeat),
+        ('min', ordered[0]),
+        ('median', median),
+        ('max', ordered[-1]),
+        ('per_op', median / ops),
+        ('times', times),
+    ])
+
+
+def revision():
+    """
+    Return git revision for working tree, if available.
+    """
+    try:
+        res = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=__base__, stderr=subprocess.DEVNULL)
+        return res.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """
+    Run benchmark suite and write results.
+    """
+    tmp = tempfile.mkdtemp(prefix='coda-bench-')
+    path = args.tree or os.path.join(tmp, 'tree')
+    try:
+        # configure isolated database
+        options = {'backend': args.backend, 'dbname': args.dbname, 'cache': False, 'query_cache': 0}
+        if args.backend == 'sqlite':
+            options['sqlite_path'] = os.path.join(tmp, 'coda.sqlite')
+        config = coda.options(**options)
+        with open(os.path.join(tmp, 'config.json'), 'w') as fh:
+            json.dump(config, fh)
+
+        # generate tree
+        sys.stderr.write('Generating tree with {} files ... '.format(args.files))
+        start = time.perf_counter()
+        files = tree.generate(path, files=args.files, width=args.width, depth=args.depth)
+        sys.stderr.write('{:.2f}s\n'.format(time.perf_counter() - start))
+        ctx = Context(path, files, os.path.join(tmp, 'config.json'), lookups=args.lookups)
+
+        # run cases
+        results = OrderedDict()
+        budgets = dict(args.budget or [])
+        for name, func in __cases__.items():
+            if args.only and not any(name.startswith(x) for x in args.only):
+                continue
+            if func.cli and args.backend == 'memory':
+                continue
+            results[name] = measure(func, ctx, repeat=args.repeat)
+            results[name]['budget'] = budgets.get(name, func.budget)
+            sys.stderr.write('{:<28} {:>10.4f}s {:>12.2f}us/op\n'.format(
+                name, results[name]['median'], 1e6 * results[name]['per_op']
+            ))
+        ctx.reset()
+    finally:
+        shutil.rmtree(tmp)
+
+    report = OrderedDict([
+        ('revision', revision()),
+        ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('backend', args.backend),
+        ('files', args.files),
+        ('results', results),
+    ])
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+    # enforce budgets
+    over = [name for name, res in results.items() if res['budget'] is not None and res['median'] > res['budget']]
+    for name in over:
+        sys.stderr.write('{} exceeded budget: {:.4f}s > {:.4f}s\n'.format(name, results[name]['median'], results[name]['budget']))
+    if len(over):
+        sys.exit(1)
+    return
+
+
+def budget(value):
+    """
+    Parse ``case=seconds`` budget specification.
+    """
+    name, sep, seconds = value.partition('=')
+    try:
+        return name, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError('budget must be specified as case=seconds, not {}'.format(value))
+
+
+def compare(args):
+    """
+    Compare median timings between two benchmark results.
+    """
+    with open(args.baseline, 'r') as fh:
+        baseline = json.load(fh)
+    with open(args.current, 'r') as fh:
+        current = json.load(fh)
+    sys.stdout.write('{:<28} {:>12} {:>12} {:>8}\n'.format('case', baseline['revision'], current['revision'], 'ratio'))
+    for name in current['results']:
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['median'], current['results'][name]['median']
+        sys.stdout.write('{:<28} {:>11.4f}s {:>11.4f}s {:>7.2f}x\n'.format(name, old, new, new / old if old else 0))
+    return
+
+
+# main
+# ----
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks', description='Benchmarks for core coda operations.')
+    subparsers = parser.add_subparsers()
+
+    parser_run = subparsers.add_parser('run', help='Run benchmark suite.')
+    parser_run.add_argument('-n', '--files', help='Number of files in synthetic tree.', type=int, default=10000)
+    parser_run.add_argument('-b', '--backend', help='Storage backend to benchmark.', default='mongo')
+    parser_run.add_argument('-d', '--dbname', help='Database name to use for benchmarks.', default='coda-benchmarks')
+    parser_run.add_argument('-r', '--repeat', help='Number of times to run each case.', type=int, default=3)
+    parser_run.add_argument('-o', '--output', help='File to write JSON results to.', default=None)
+    parser_run.add_argument('--only', help='Only run cases starting with prefix.', nargs='+', default=None)
+    parser_run.add_argument('--lookups', help='Number of files to use for point lookups.', type=int, default=1000)
+    parser_run.add_argument('--width', help='Number of subdirectories per directory.', type=int, default=10)
+    parser_run.add_argument('--depth', help='Number of directory levels in tree.', type=int, default=3)
+    parser_run.add_argument('--tree', help='Directory to generate (or reuse) synthetic tree in.', default=None)
+    parser_run.add_argument('--budget', help='Maximum median time for case, as case=seconds (i.e. cli.version=0.15). '
+                            'The run exits with an error if a budget is exceeded.', type=budget, action='append', default=None)
+    parser_run.set_defaults(func=run)
+
+    parser_compare = subparsers.add_parser('compare', help='Compare two benchmark results.')
+    parser_compare.add_argument('baseline', help='JSON results for baseline.')
+    parser_compare.add_argument('current', help='JSON results to compare against baseline.')
+    parser_compare.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'func'):
+        parser.print_help()
+        return
+    args.func(args)
+    return
+
+
+if __name__ == "__main__":
+    main()
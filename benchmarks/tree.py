@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Synthetic file tree generation for benchmarks
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import os
+import random
+
+
+# config
+# ------
+__groups__ = ['train', 'test', 'validate', 'holdout']
+__extensions__ = ['txt', 'csv', 'json', 'bam', 'fastq']
+
+
+# generation
+# ----------
+def layout(files, width=10, depth=3):
+    """
+    Return relative directory for each file in a synthetic tree, with
+    files spread evenly over ``width ** depth`` leaf directories.
+
+    Args:
+        files (int): Number of files in the tree.
+        width (int): Number of subdirectories per directory.
+        depth (int): Number of directory levels in the tree.
+
+    Examples:
+        >>> layout(3, width=2, depth=2)
+        ['d00/d00', 'd00/d01', 'd01/d00']
+    """
+    leaves = width ** depth
+    res = []
+    for idx in range(files):
+        leaf, parts = idx % leaves, []
+        for level in range(depth):
+            parts.append('d{:02d}'.format(leaf % width))
+            leaf //= width
+        res.append(os.path.join(*reversed(parts)))
+    return res
+
+
+def metadata(rng, idx):
+    """
+    Return random metadata for synthetic file.
+    """
+    return {
+        'group': rng.choice(__groups__),
+        'subject': 'subject-{:05d}'.format(rng.randrange(1000)),
+        'count': rng.randrange(1000000),
+        'score': round(rng.random(), 4),
+        'index': idx,
+        'qc': {
+            'passed': rng.random() > 0.1,
+            'reads': rng.randrange(1000000)
+        }
+    }
+
+
+def generate(path, files=10000, width=10, depth=3, size=16, seed=0):
+    """
+    Generate synthetic file tree with random metadata for files. Files
+    that already exist in the tree are reused, so trees can be shared
+    between benchmark runs.
+
+    Args:
+        path (str): Directory to generate tree in.
+        files (int): Number of files to generate.
+        width (int): Number of subdirectories per directory.
+        depth (int): Number of directory levels in the tree.
+        size (int): Number of bytes written to each file.
+        seed (int): Seed for random metadata, so that trees generated
+            with the same arguments are identical.
+
+    Returns:
+        dict: Mapping of file paths to metadata for files.
+
+    Examples:
+        >>> tree = generate('/tmp/coda-tree', files=100)
+        >>> len(tree)
+        100
+    """
+    rng = random.Random(seed)
+    path = os.path.realpath(path)
+    created, res = set(), {}
+    for idx, sub in enumerate(layout(files, width=width, depth=depth)):
+        directory = os.path.join(path, sub)
+        if directory not in created:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            created.add(directory)
+        meta = metadata(rng, idx)
+        name = os.path.join(directory, 'file-{:07d}.{}'.format(idx, rng.choice(__extensions__)))
+        data = rng.getrandbits(8 * size).to_bytes(size, 'little')
+        if not os.path.exists(name):
+            with open(name, 'wb') as fh:
+                fh.write(data)
+        res[name] = meta
+    return res
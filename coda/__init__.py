@@ -2,11 +2,7 @@
 
 # imports
 # -------
-import os
-
-from coda.db import add, find, find_one, delete
-from coda.db import options
-from coda.db import File, Collection
+import importlib
 
 
 # metadata
@@ -14,3 +10,34 @@ from coda.db import File, Collection
 __author__ = 'Blake Printy'
 __email__ = 'bprinty@gmail.com'
 __version__ = '0.1.0'
+
+
+# api
+# ---
+__api__ = [
+    'add', 'find', 'find_one', 'iterate', 'listdir', 'update', 'tag', 'delete', 'delete_query', 'sync',
+    'checksum', 'duplicates',
+    'options', 'stats',
+    'ensure_index', 'list_indexes', 'drop_index', 'explain',
+    'File', 'Collection', 'LazyCollection',
+]
+__modules__ = ['aio', 'backends', 'cache', 'db', 'metrics', 'objects']
+__all__ = list(__api__)
+
+
+def __getattr__(name):
+    """
+    Import database module the first time the api is used, so that
+    ``import coda`` (and commands like ``coda version``) stay fast.
+    """
+    if name in __modules__:
+        return importlib.import_module('coda.' + name)
+    if name in __api__:
+        value = getattr(importlib.import_module('coda.db'), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __api__ + __modules__)
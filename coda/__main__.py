@@ -10,7 +10,9 @@
 # -------
 import os
 import sys
+import itertools
 from functools import wraps
+from collections import OrderedDict
 import argparse
 import json
 import coda
@@ -36,17 +38,156 @@ def accumulate(func):
     return _
 
 
+# output
+# ------
+__formats__ = ['paths', 'jsonl', 'csv', 'null']
+__header_rows__ = 1000
+
+
+def _fields(value):
+    """
+    Parse comma-separated list of metadata fields.
+    """
+    return [x.strip() for x in value.split(',') if x.strip()]
+
+
+def output_arguments(parser):
+    """
+    Add arguments for formatting query results to parser.
+    """
+    parser.add_argument('-f', '--format', help='Output format for results.', choices=__formats__, default='paths')
+    parser.add_argument('--fields', help='Comma-separated metadata fields to include in jsonl and csv output. Without fields, '
+                        'csv columns are collected from the first {} results, and keys that only appear in later results '
+                        'are left out.'.format(__header_rows__), type=_fields, default=None)
+    parser.add_argument('-n', '--limit', help='Maximum number of results to return.', type=int, default=0)
+    return
+
+
+def projection(args):
+    """
+    Return metadata fields to pull from the database for output format.
+    """
+    if args.format in ['paths', 'null']:
+        return []
+    return args.fields
+
+
+def _row(fi, fields):
+    """
+    Return dictionary with path and metadata for file.
+    """
+    row = OrderedDict([('path', fi.path)])
+    if fields is None:
+        md = fi.metadata.json()
+        md.pop('_id', None)
+        for key in sorted(md):
+            row[key] = md[key]
+        return row
+    for key in fields:
+        try:
+            value = fi[key]
+        except KeyError:
+            value = None
+        row[key] = value.json() if hasattr(value, 'json') else value
+    return row
+
+
+def _csv(files, fields):
+    """
+    Write files to stdout as csv rows. If no fields are specified,
+    columns are collected from the first ``__header_rows__`` files,
+    and keys that only appear in later files are left out.
+    """
+    import csv
+    files = iter(files)
+    rows = [_row(fi, fields) for fi in itertools.islice(files, __header_rows__)]
+    if len(rows) == 0:
+        return
+    if fields is None:
+        fields = sorted(set(key for row in rows for key in row) - set(['path']))
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(['path'] + fields)
+    for row in itertools.chain(rows, (_row(fi, fields) for fi in files)):
+        writer.writerow([
+            json.dumps(x, default=str) if isinstance(x, (dict, list)) else x
+            for x in [row['path']] + [row.get(key) for key in fields]
+        ])
+    return
+
+
+def output(files, args):
+    """
+    Write files to stdout as they are pulled from the database, using
+    the output format specified in arguments.
+    """
+    try:
+        if args.format == 'csv':
+            _csv(files, args.fields)
+        else:
+            for fi in files:
+                if args.format == 'paths':
+                    sys.stdout.write(fi.path + '\n')
+                elif args.format == 'null':
+                    sys.stdout.write(fi.path + '\0')
+                elif args.format == 'jsonl':
+                    sys.stdout.write(json.dumps(_row(fi, args.fields), default=str) + '\n')
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # downstream commands (i.e. head) stopped reading
+        sys.stdout = open(os.devnull, 'w')
+    return
+
+
+# profiling
+# ---------
+def profile_arguments(parser):
+    """
+    Add arguments for profiling database operations to parser. These
+    are accepted before or after the subcommand.
+    """
+    parser.add_argument('--profile', help='Print timings for database operations to stderr.',
+                        action='store_true', default=argparse.SUPPRESS)
+    parser.add_argument('--profile-output', help='Write timings for database operations to JSON file.',
+                        default=argparse.SUPPRESS)
+    return
+
+
+def profile(args):
+    """
+    Report timings for database operations, if requested.
+    """
+    if not getattr(args, 'profile', False) and getattr(args, 'profile_output', None) is None:
+        return
+    from coda.metrics import metrics
+    if getattr(args, 'profile', False):
+        sys.stderr.write(metrics.table() + '\n')
+    if getattr(args, 'profile_output', None) is not None:
+        metrics.dump(args.profile_output)
+    return
+
+
 # args
 # ----
-parser = argparse.ArgumentParser()
-parser.add_argument('-c', '--config', help='Path to config file to use for default coda options.', default=None)
-subparsers = parser.add_subparsers()
+__commands__ = OrderedDict()
+
+
+def command(name):
+    """
+    Register function for configuring argument parser for
+    subcommand. Parsers are only configured for the subcommand
+    being run, so that startup stays fast.
+    """
+    def decorator(func):
+        __commands__[name] = func
+        return func
+    return decorator
 
 
 # version
 # -------
-parser_version = subparsers.add_parser('version')
-parser_version.set_defaults(func=lambda x: sys.exit(coda.__version__))
+@command('version')
+def parser_version(parser):
+    parser.set_defaults(func=lambda x: sys.exit(coda.__version__))
 
 
 # status
@@ -67,8 +208,10 @@ def status(args):
         sys.stderr.write('could not connect!\n\n')
     return
 
-parser_status = subparsers.add_parser('status')
-parser_status.set_defaults(func=status)
+
+@command('status')
+def parser_status(parser):
+    parser.set_defaults(func=status)
 
 
 # list
@@ -77,25 +220,30 @@ def listdir(args):
     """
     List tracked files under the user's current directory.
     """
-    wd = args.path.replace('/', '\/')
-    cl = coda.find({'path': {'$regex': '^' + wd + '.*'}})
-    if os.path.isdir(args.path):
-        if cl is not None:
-            sys.stdout.write('\n'.join(map(str, cl.files)) + '\n')
+    path = os.path.realpath(args.path)
+    if os.path.isdir(path):
+        output(coda.db.listdir(
+            path, recursive=args.recursive,
+            fields=projection(args), limit=args.limit
+        ), args)
     else:
-        fi = cl[0]
-        md = fi.metadata.json()
+        fi = coda.find_one({'path': path})
+        md = {} if fi is None else fi.metadata.json()
+        md.pop('_id', None)
         if len(md) != 0:
-            del md['_id']
             sys.stdout.write(fi.path + '\n')
             sys.stdout.write(json.dumps(md, sort_keys=True, indent=4) + '\n')
         else:
-            sys.stdout.write('No metadata found for {}\n'.format(fi.name))
+            sys.stdout.write('No metadata found for {}\n'.format(os.path.basename(path)))
     return
 
-parser_list = subparsers.add_parser('list')
-parser_list.add_argument('path', nargs='?', help='Directory to list tracked files for.', default=os.getcwd())
-parser_list.set_defaults(func=listdir)
+
+@command('list')
+def parser_list(parser):
+    parser.add_argument('path', nargs='?', help='Directory to list tracked files for.', default=os.getcwd())
+    parser.add_argument('-r', '--recursive', help='Include files in subdirectories.', action='store_true')
+    output_arguments(parser)
+    parser.set_defaults(func=listdir)
 
 
 # find
@@ -104,15 +252,19 @@ def find(args):
     """
     Find files with associated keys and metadata.
     """
-    cl = coda.find({args.key: args.value})
-    if cl is not None:
-        sys.stdout.write('\n'.join(map(str, cl.files)) + '\n')
+    output(coda.db.iterate(
+        {args.key: args.value},
+        fields=projection(args), limit=args.limit
+    ), args)
     return
 
-parser_find = subparsers.add_parser('find')
-parser_find.add_argument('key', help='Metadata key to search with.')
-parser_find.add_argument('value', help='Metadata value to search for.')
-parser_find.set_defaults(func=find)
+
+@command('find')
+def parser_find(parser):
+    parser.add_argument('key', help='Metadata key to search with.')
+    parser.add_argument('value', help='Metadata value to search for.')
+    output_arguments(parser)
+    parser.set_defaults(func=find)
 
 
 # add
@@ -125,9 +277,11 @@ def add(args):
     coda.add(args.collection)
     return
 
-parser_add = subparsers.add_parser('add')
-parser_add.add_argument('files', nargs='+', help='File or collection to add to tracking.')
-parser_add.set_defaults(func=add)
+
+@command('add')
+def parser_add(parser):
+    parser.add_argument('files', nargs='+', help='File or collection to add to tracking.')
+    parser.set_defaults(func=add)
 
 
 # delete
@@ -140,37 +294,280 @@ def delete(args):
     coda.delete(args.collection)
     return
 
-parser_delete = subparsers.add_parser('delete')
-parser_delete.add_argument('files', nargs='+', help='File or collection to add to tracking.')
-parser_delete.set_defaults(func=delete)
+
+@command('delete')
+def parser_delete(parser):
+    parser.add_argument('files', nargs='+', help='File or collection to add to tracking.')
+    parser.set_defaults(func=delete)
+
+
+# sync
+# ----
+def sync(args):
+    """
+    Synchronize database with files in directory.
+    """
+    res = coda.sync(args.path, delete=args.delete, checksum=args.checksum, include=args.include, depth=args.depth)
+    for key in ['inserted', 'updated', 'unchanged', 'deleted', 'hashed']:
+        if key in res:
+            sys.stdout.write('{}: {}\n'.format(key, res[key]))
+    sys.stdout.write('elapsed: {:.2f}s\n'.format(res['elapsed']))
+    return
+
+
+@command('sync')
+def parser_sync(parser):
+    parser.add_argument('path', nargs='?', help='Directory to synchronize.', default=os.getcwd())
+    parser.add_argument('-d', '--delete', action='store_true', help='Delete records for files that no longer exist.')
+    parser.add_argument('-i', '--include', action='append', help='Glob pattern for files to include.', default=None)
+    parser.add_argument('--depth', type=int, help='Maximum depth of subdirectories to crawl.', default=None)
+    parser.add_argument('--checksum', action='store_true', help='Compute checksums for new or modified files.')
+    parser.set_defaults(func=sync)
+
+
+# dupes
+# -----
+def dupes(args):
+    """
+    List groups of tracked files with identical contents.
+    """
+    for item in coda.duplicates():
+        sys.stdout.write('{} ({} bytes)\n'.format(item['digest'], item['size']))
+        for path in item['paths']:
+            sys.stdout.write('    {}\n'.format(path))
+    return
+
+
+@command('dupes')
+def parser_dupes(parser):
+    parser.set_defaults(func=dupes)
 
 
-# tag 
+# tag
 # ---
-@accumulate
+def _split(fh, separator, size=65536):
+    """
+    Stream separated entries from file handle.
+    """
+    buf = ''
+    for block in iter(lambda: fh.read(size), ''):
+        items = (buf + block).split(separator)
+        buf = items.pop()
+        for item in items:
+            if len(item):
+                yield item
+    if len(buf):
+        yield buf
+
+
+def _existing(items):
+    """
+    Stream full paths for existing files, warning about others.
+    """
+    for item in items:
+        if os.path.isfile(item):
+            yield os.path.realpath(item)
+        else:
+            sys.stderr.write('Skipping {} -- not a file.\n'.format(item))
+
+
+def paths(args):
+    """
+    Stream full paths for files specified in arguments, and in
+    file list (or stdin) specified with ``--from``.
+    """
+    for item in args.files:
+        if os.path.isdir(item):
+            for path in coda.db.crawl(os.path.realpath(item)):
+                yield path
+        else:
+            for path in _existing([item]):
+                yield path
+    if args.source is not None:
+        separator = '\0' if args.null else '\n'
+        if args.source == '-':
+            for path in _existing(_split(sys.stdin, separator)):
+                yield path
+        else:
+            with open(args.source, 'r') as fh:
+                for path in _existing(_split(fh, separator)):
+                    yield path
+
+
 def tag(args):
     """
-    Tag file with metadata.
+    Tag files with metadata.
     """
-    args.collection.metadata[args.key] = args.value
-    coda.add(args.collection)
+    if len(args.files) == 0 and args.source is None:
+        sys.exit('No files specified! Specify files to tag, or use --from to read them from a file list.')
+    coda.tag(paths(args), {args.key: args.value}, batch_size=args.batch_size)
+    return
+
+
+@command('tag')
+def parser_tag(parser):
+    parser.add_argument('key', help='Metadata key to tag file with.')
+    parser.add_argument('value', help='Metadata value to tag file with.')
+    parser.add_argument('files', nargs='*', help='File or collection to tag with metadata.')
+    parser.add_argument('--from', dest='source', help='File with list of paths to tag, or - for stdin.', default=None)
+    parser.add_argument('-0', '--null', help='Paths in file list are separated by null characters.', action='store_true')
+    parser.add_argument('-b', '--batch-size', help='Number of files to send per bulk write.', type=int, default=None)
+    parser.set_defaults(func=tag)
+
+
+# index
+# -----
+def index_add(args):
+    """
+    Create index on metadata key(s).
+    """
+    name = coda.ensure_index(args.keys, unique=args.unique)
+    sys.stdout.write(name + '\n')
+    return
+
+
+def index_list(args):
+    """
+    List indexes available in the database.
+    """
+    for item in coda.list_indexes():
+        keys = ', '.join([str(key) for key, direction in item['keys']])
+        sys.stdout.write('{}: {}{}\n'.format(item['name'], keys, ' (unique)' if item['unique'] else ''))
+    return
+
+
+def index_drop(args):
+    """
+    Drop index on metadata key(s).
+    """
+    coda.drop_index(args.keys)
     return
 
-parser_tag = subparsers.add_parser('tag')
-parser_tag.add_argument('key', help='Metadata key to tag file with.')
-parser_tag.add_argument('value', help='Metadata value to tag file with.')
-parser_tag.add_argument('files', nargs='+', help='File or collection to tag with metadata.')
-parser_tag.set_defaults(func=tag)
+
+@command('index')
+def parser_index(parser):
+    index_subparsers = parser.add_subparsers()
+    parser_index_add = index_subparsers.add_parser('add')
+    parser_index_add.add_argument('keys', nargs='+', help='Metadata key(s) to index.')
+    parser_index_add.add_argument('-u', '--unique', action='store_true', help='Require values for the index to be unique.')
+    parser_index_add.set_defaults(func=index_add)
+    profile_arguments(parser_index_add)
+    parser_index_list = index_subparsers.add_parser('list')
+    parser_index_list.set_defaults(func=index_list)
+    profile_arguments(parser_index_list)
+    parser_index_drop = index_subparsers.add_parser('drop')
+    parser_index_drop.add_argument('keys', nargs='+', help='Metadata key(s) for index to drop.')
+    parser_index_drop.set_defaults(func=index_drop)
+    profile_arguments(parser_index_drop)
+
+
+# explain
+# -------
+def explain(args):
+    """
+    Explain how the database would run query for files
+    with associated keys and metadata.
+    """
+    res = coda.explain({args.key: args.value})
+    sys.stdout.write('plan: {}\n'.format(res['plan']))
+    sys.stdout.write('index: {}\n'.format(res['index'] or 'none (full scan)'))
+    for key in ['examined', 'returned']:
+        sys.stdout.write('{}: {}\n'.format(key, 'unknown' if res[key] is None else res[key]))
+    return
+
+
+@command('explain')
+def parser_explain(parser):
+    parser.add_argument('key', help='Metadata key to search with.')
+    parser.add_argument('value', help='Metadata value to search for.')
+    parser.set_defaults(func=explain)
+
+
+# cache
+# -----
+def cache_stats(args):
+    """
+    Show statistics for local cache of database records.
+    """
+    cache = coda.db.session.disk_cache
+    if cache is None:
+        sys.stderr.write('Local cache is disabled -- set `cache` to true in your coda configuration.\n')
+        return
+    res = cache.stats()
+    for key in ['path', 'entries', 'size', 'ttl', 'hits', 'misses', 'bytes']:
+        sys.stdout.write('{}: {}\n'.format(key, res[key]))
+    return
+
+
+def cache_clear(args):
+    """
+    Clear local cache of database records.
+    """
+    cache = coda.db.session.disk_cache
+    if cache is not None:
+        cache.clear()
+    return
+
+
+@command('cache')
+def parser_cache(parser):
+    cache_subparsers = parser.add_subparsers()
+    parser_cache_stats = cache_subparsers.add_parser('stats')
+    parser_cache_stats.set_defaults(func=cache_stats)
+    profile_arguments(parser_cache_stats)
+    parser_cache_clear = cache_subparsers.add_parser('clear')
+    parser_cache_clear.set_defaults(func=cache_clear)
+    profile_arguments(parser_cache_clear)
 
 
 # exec
 # ----
-def main():
-    args = parser.parse_args()
+def _command(argv):
+    """
+    Return first positional argument (the subcommand) from
+    command line arguments.
+    """
+    idx = 0
+    while idx < len(argv):
+        if argv[idx] in ['-c', '--config', '--profile-output']:
+            idx += 2
+            continue
+        if not argv[idx].startswith('-'):
+            return argv[idx]
+        idx += 1
+    return None
+
+
+def build(argv):
+    """
+    Build argument parser for command line arguments. If a known
+    subcommand is being run, only the parser for that subcommand
+    is configured.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', help='Path to config file to use for default coda options.', default=None)
+    profile_arguments(parser)
+    subparsers = parser.add_subparsers()
+    name = _command(argv)
+    for key in __commands__:
+        if name in __commands__ and key != name:
+            continue
+        subparser = subparsers.add_parser(key)
+        __commands__[key](subparser)
+        profile_arguments(subparser)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build(argv).parse_args(argv)
     if args.config:
         coda.db.__user_config__ = args.config
         coda.db.options()
-    args.func(args)
+    try:
+        args.func(args)
+    finally:
+        profile(args)
 
 
 if __name__ == "__main__":
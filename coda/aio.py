@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# Asynchronous interface for querying and updating database
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import os
+import asyncio
+import itertools
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from coda import db
+
+
+# config
+# ------
+__executor__ = None
+
+
+# executor
+# --------
+def _executor():
+    """
+    Return executor for running database calls, sized with the
+    ``aio_workers`` option for the current session. Executors
+    inherited from a parent process are replaced after a fork.
+    """
+    global __executor__
+    key = (os.getpid(), db.session.aio_workers)
+    if __executor__ is None or __executor__[0] != key:
+        if __executor__ is not None and __executor__[0][0] == key[0]:
+            __executor__[1].shutdown(wait=False)
+        __executor__ = (key, ThreadPoolExecutor(max_workers=key[1]))
+    return __executor__[1]
+
+
+async def _run(func, *args, **kwargs):
+    """
+    Run blocking function in executor, without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), partial(func, *args, **kwargs))
+
+
+# searching
+# ---------
+async def find(query, **kwargs):
+    """
+    Search database for files with specified metadata, without
+    blocking the event loop. Takes the same arguments as ``coda.find``.
+
+    Examples:
+        >>> async def main():
+        >>>     cl = await coda.aio.find({'type': 'test'})
+        >>>     print cl
+        '/my/testing/file/one.txt'
+        '/my/testing/file/two.txt'
+    """
+    return await _run(db.find, query, **kwargs)
+
+
+async def find_one(query, **kwargs):
+    """
+    Search database for one file with specified metadata, without
+    blocking the event loop. Takes the same arguments as ``coda.find_one``.
+
+    Examples:
+        >>> async def main():
+        >>>     files = await asyncio.gather(*[
+        >>>         coda.aio.find_one({'path': path}) for path in paths
+        >>>     ])
+    """
+    return await _run(db.find_one, query, **kwargs)
+
+
+class Cursor(object):
+    """
+    Asynchronous iterator over files matching query. Records are
+    pulled from the database in batches as they are needed, and
+    timings are recorded as ``iterate`` operations.
+
+    Args:
+        query (dict): Dictionary with query parameters.
+        fields (list): Metadata fields to pull for each file.
+        sort (str, list): Metadata key, or list of keys to sort results by.
+        limit (int): Maximum number of results to return.
+        skip (int): Number of results to skip before returning results.
+        batch_size (int): Number of records to pull per executor call.
+
+    Examples:
+        >>> async def main():
+        >>>     async for fi in coda.aio.iterate({'type': 'test'}):
+        >>>         print fi
+        '/my/testing/file/one.txt'
+        '/my/testing/file/two.txt'
+    """
+
+    def __init__(self, query, fields=None, sort=None, limit=0, skip=0, batch_size=100):
+        self.query = query
+        self.fields = fields
+        self.sort = None if sort is None else db._keys(sort)
+        self.limit = limit
+        self.skip = skip
+        self.batch_size = batch_size
+        self._items = None
+        self._buffer = deque()
+        return
+
+    def _next(self):
+        return list(itertools.islice(self._items, self.batch_size))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if len(self._buffer) == 0:
+            if self._items is None:
+                # batches are pulled through the synchronous iterator, so that
+                # timings and slow queries are recorded for the cursor
+                self._items = db.iterate(
+                    self.query, fields=self.fields, sort=self.sort,
+                    limit=self.limit, skip=self.skip, batch_size=self.batch_size
+                )
+            self._buffer.extend(await _run(self._next))
+            if len(self._buffer) == 0:
+                raise StopAsyncIteration
+        return self._buffer.popleft()
+
+
+def iterate(query, fields=None, sort=None, limit=0, skip=0, batch_size=100):
+    """
+    Return asynchronous iterator over files matching query. See
+    ``Cursor`` for details on arguments.
+    """
+    return Cursor(query, fields=fields, sort=sort, limit=limit, skip=skip, batch_size=batch_size)
+
+
+# database update methods
+# -----------------------
+async def add(obj, **kwargs):
+    """
+    Add file object or collection object to database, without
+    blocking the event loop. Takes the same arguments as ``coda.add``.
+
+    Examples:
+        >>> async def main():
+        >>>     fi = coda.File('/path/to/test/file.txt')
+        >>>     fi.type = 'test'
+        >>>     await coda.aio.add(fi)
+        {'inserted': 1, 'updated': 0}
+    """
+    return await _run(db.add, obj, **kwargs)
+
+
+async def update(target, **kwargs):
+    """
+    Update metadata keys for files in the database, without blocking
+    the event loop. Takes the same arguments as ``coda.update``.
+
+    Examples:
+        >>> async def main():
+        >>>     await coda.aio.update({'type': 'test'}, inc={'views': 1})
+        {'inserted': 0, 'updated': 12}
+    """
+    return await _run(db.update, target, **kwargs)
+
+
+async def delete(obj, **kwargs):
+    """
+    Delete file or collection of files from database, without
+    blocking the event loop. Takes the same arguments as ``coda.delete``.
+
+    Examples:
+        >>> async def main():
+        >>>     await coda.aio.delete(coda.File('/path/to/test/file.txt'))
+        {'deleted': 1}
+    """
+    return await _run(db.delete, obj, **kwargs)
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# Storage backends for file metadata
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import importlib
+
+
+# registry
+# --------
+__backends__ = {
+    'mongo': 'coda.backends.mongo.MongoBackend',
+    'sqlite': 'coda.backends.sqlite.SQLiteBackend',
+    'memory': 'coda.backends.memory.MemoryBackend',
+}
+__indexes__ = [
+    [('_parent', 1)],
+]
+
+
+def register(name, backend):
+    """
+    Register storage backend under name, so that it can be
+    selected with the ``backend`` config option.
+
+    Args:
+        name (str): Name of backend.
+        backend (type, str): Backend class, or import path to
+            backend class.
+
+    Examples:
+        >>> coda.backends.register('custom', 'mypackage.storage.CustomBackend')
+        >>> coda.options(backend='custom')
+    """
+    __backends__[name] = backend
+    return
+
+
+def load(name):
+    """
+    Return backend class for name. Backend modules are only
+    imported when they're used, so that drivers for unused
+    backends don't need to be installed.
+
+    Args:
+        name (str): Name of registered backend, or import path
+            to backend class.
+    """
+    backend = __backends__.get(name, name)
+    if isinstance(backend, str):
+        module, _, cls = backend.rpartition('.')
+        try:
+            backend = getattr(importlib.import_module(module), cls)
+        except (ImportError, AttributeError, ValueError):
+            raise AssertionError('Could not load storage backend `{}` -- '
+                                 'check the `backend` option in your coda '
+                                 'configuration.'.format(name))
+    return backend
+
+
+# backend
+# -------
+class Backend(object):
+    """
+    Interface for storage backends holding database records for
+    files. Records are dictionaries keyed by file ``path``, and
+    queries use the mongodb query language. Backends maintain a
+    unique index on ``path``, and indexes on the fields coda
+    manages for lookups (``__indexes__``).
+
+    Args:
+        options (dict): Options for the current session.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        return
+
+    @property
+    def db(self):
+        """
+        Underlying database handle for backend.
+        """
+        raise NotImplementedError
+
+    def find(self, query, projection=None, sort=None, limit=0, skip=0, batch_size=0):
+        """
+        Return iterator over records matching query.
+
+        Args:
+            query (dict): Dictionary with query parameters.
+            projection (dict): Fields to include in records.
+            sort (list): List of (key, direction) pairs to sort by.
+            limit (int): Maximum number of records to return.
+            skip (int): Number of records to skip.
+            batch_size (int): Number of records to pull per round trip.
+        """
+        raise NotImplementedError
+
+    def find_one(self, query, projection=None, sort=None, skip=0):
+        """
+        Return first record matching query, or None if no
+        records match the query.
+        """
+        for item in self.find(query, projection=projection, sort=sort, limit=1, skip=skip):
+            return item
+        return None
+
+    def count(self, query, limit=0, skip=0):
+        """
+        Return number of records matching query.
+        """
+        raise NotImplementedError
+
+    def replace(self, records, ordered=False):
+        """
+        Insert records, replacing existing records with the same path.
+
+        Args:
+            records (list): List of records to write.
+            ordered (bool): Whether or not to apply writes serially,
+                stopping at the first error.
+
+        Returns:
+            dict: Summary with counts of inserted and updated records.
+        """
+        raise NotImplementedError
+
+    def update(self, updates, ordered=False, upsert=True):
+        """
+        Apply update documents to records by path, inserting records
+        for paths that don't exist.
+
+        Args:
+            updates (list): List of (path, update) pairs, where updates
+                use the ``$set``, ``$unset``, and ``$inc`` operators.
+            ordered (bool): Whether or not to apply writes serially,
+                stopping at the first error.
+            upsert (bool): Whether or not to insert records for paths
+                that don't exist. If False, those paths are skipped.
+
+        Returns:
+            dict: Summary with counts of inserted and updated records.
+        """
+        raise NotImplementedError
+
+    def update_many(self, query, update):
+        """
+        Apply update document to all records matching query, as a
+        single operation on the database.
+
+        Args:
+            query (dict): Query for records to update.
+            update (dict): Update document using the ``$set``, ``$unset``,
+                and ``$inc`` operators.
+
+        Returns:
+            int: Number of records matching the query.
+        """
+        raise NotImplementedError
+
+    def delete(self, query):
+        """
+        Delete records matching query, returning the number of
+        records deleted.
+        """
+        raise NotImplementedError
+
+    def create_index(self, keys, unique=False, sparse=False):
+        """
+        Create index on list of (key, direction) pairs, returning
+        the name of the index.
+        """
+        raise NotImplementedError
+
+    def list_indexes(self):
+        """
+        Return list of dictionaries with index name, keys, and
+        whether or not the index is unique.
+        """
+        raise NotImplementedError
+
+    def drop_index(self, keys):
+        """
+        Drop index on list of (key, direction) pairs.
+        """
+        raise NotImplementedError
+
+    def explain(self, query, sort=None):
+        """
+        Return summary of how query would be run by the backend.
+
+        Args:
+            query (dict): Dictionary with query parameters.
+            sort (list): List of (key, direction) pairs to sort by.
+
+        Returns:
+            dict: Summary with description of the winning ``plan``, name
+                of the ``index`` used (None for full scans), number of
+                records ``examined`` and ``returned`` (None if the backend
+                can't report them), and backend-specific ``details``.
+        """
+        raise NotImplementedError
+
+    def duplicates(self, query=None):
+        """
+        Return list of dictionaries with checksum digest, algorithm,
+        file size, and paths for groups of records with identical
+        checksums, sorted by number of duplicates.
+        """
+        raise NotImplementedError
+
+    def drop(self):
+        """
+        Remove all records and indexes from backend.
+        """
+        raise NotImplementedError
+
+
+def index_name(keys):
+    """
+    Return conventional name for index on list of (key, direction) pairs.
+    """
+    return '_'.join('{}_{}'.format(key, direction) for key, direction in keys)
+
+
+# updates
+# -------
+def _parent(item, key, create=False):
+    """
+    Return containing dictionary and final key for dotted metadata key.
+    """
+    parts = key.split('.')
+    for part in parts[:-1]:
+        if create:
+            item = item.setdefault(part, {})
+        else:
+            item = item.get(part)
+        if not isinstance(item, dict):
+            return None, parts[-1]
+    return item, parts[-1]
+
+
+def apply_update(item, update):
+    """
+    Apply mongodb update document using the ``$set``, ``$unset``,
+    and ``$inc`` operators to record, returning the record.
+    """
+    for op, fields in update.items():
+        for key, value in fields.items():
+            if op == '$set':
+                parent, name = _parent(item, key, create=True)
+                parent[name] = value
+            elif op == '$unset':
+                parent, name = _parent(item, key)
+                if parent is not None:
+                    parent.pop(name, None)
+            elif op == '$inc':
+                parent, name = _parent(item, key, create=True)
+                parent[name] = parent.get(name, 0) + value
+            else:
+                raise AssertionError('Update operator `{}` is not supported by this backend.'.format(op))
+    return item
@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+#
+# In-memory storage backend
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import re
+import copy
+import itertools
+import threading
+from collections import OrderedDict
+
+from coda.backends import Backend, index_name, apply_update, __indexes__
+
+
+# config
+# ------
+__stores__ = {}
+__missing__ = object()
+
+
+# query matching
+# --------------
+def _resolve(item, key):
+    """
+    Return value for (possibly dotted) metadata key in record.
+    """
+    for part in key.split('.'):
+        if not isinstance(item, dict) or part not in item:
+            return __missing__
+        item = item[part]
+    return item
+
+
+def _kind(value):
+    """
+    Return type class for value, used for restricting comparisons
+    to values of the same type.
+    """
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float)):
+        return float
+    return type(value)
+
+
+def _equal(value, arg):
+    """
+    Check if values are equal, without treating booleans as numbers.
+    """
+    return _kind(value) == _kind(arg) and value == arg
+
+
+def _values(value):
+    """
+    Return candidate values for matching, so that queries on array
+    fields match records where any element matches.
+    """
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _regex(pattern, options):
+    """
+    Compile regular expression for ``$regex`` query.
+    """
+    if hasattr(pattern, 'pattern'):
+        return pattern
+    flags = 0
+    for flag, value in (('i', re.I), ('m', re.M), ('s', re.S), ('x', re.X)):
+        if flag in options:
+            flags |= value
+    return re.compile(pattern, flags)
+
+
+def _equality(value, arg):
+    """
+    Check if value (or any element of array value) equals operand.
+    """
+    if value is __missing__ or value is None:
+        return arg is None
+    return any(_equal(x, arg) for x in _values(value))
+
+
+def _comparison(value, op, arg):
+    """
+    Check if value (or any element of array value) compares to
+    operand of the same type.
+    """
+    if value is __missing__:
+        return False
+    compare = {
+        '$lt': lambda x: x < arg,
+        '$lte': lambda x: x <= arg,
+        '$gt': lambda x: x > arg,
+        '$gte': lambda x: x >= arg,
+    }[op]
+    return any(_kind(x) == _kind(arg) and compare(x) for x in _values(value))
+
+
+def _search(value, pattern, options):
+    """
+    Check if value (or any string element of array value) matches
+    regular expression.
+    """
+    if value is __missing__:
+        return False
+    regex = _regex(pattern, options)
+    return any(isinstance(x, str) and regex.search(x) is not None for x in _values(value))
+
+
+def _operator(value, op, arg, options):
+    """
+    Check if value matches query operator.
+    """
+    if op == '$eq' and hasattr(arg, 'pattern'):
+        op = '$regex'
+    if op == '$eq':
+        return _equality(value, arg)
+    elif op == '$ne':
+        return not _equality(value, arg)
+    elif op in ('$in', '$nin'):
+        return any(_operator(value, '$eq', x, options) for x in arg) == (op == '$in')
+    elif op in ('$lt', '$lte', '$gt', '$gte'):
+        return _comparison(value, op, arg)
+    elif op == '$regex':
+        return _search(value, arg, options)
+    elif op == '$exists':
+        return (value is not __missing__) == bool(arg)
+    elif op == '$not':
+        return not _condition(value, arg)
+    raise AssertionError('Query operator `{}` is not supported by the memory backend.'.format(op))
+
+
+def _condition(value, cond):
+    """
+    Check if value matches query condition.
+    """
+    if isinstance(cond, dict) and any(x.startswith('$') for x in cond):
+        options = cond.get('$options', '')
+        return all(_operator(value, op, arg, options) for op, arg in cond.items() if op != '$options')
+    return _operator(value, '$eq', cond, '')
+
+
+def _match(item, query):
+    """
+    Check if record matches mongodb query.
+    """
+    for key, cond in query.items():
+        if key == '$and':
+            res = all(_match(item, x) for x in cond)
+        elif key == '$or':
+            res = any(_match(item, x) for x in cond)
+        elif key == '$nor':
+            res = not any(_match(item, x) for x in cond)
+        elif key.startswith('$'):
+            raise AssertionError('Query operator `{}` is not supported by the memory backend.'.format(key))
+        else:
+            res = _condition(_resolve(item, key), cond)
+        if not res:
+            return False
+    return True
+
+
+def _rank(value):
+    """
+    Return sort key for value, ordering values of different types
+    the way mongodb does.
+    """
+    if value is __missing__ or value is None:
+        return (0, 0)
+    kind = _kind(value)
+    if kind is float:
+        return (1, value)
+    if kind is str:
+        return (2, value)
+    if kind is dict:
+        return (3, sorted(value.items()))
+    if kind is list:
+        return (4, value)
+    if kind is bool:
+        return (5, value)
+    return (6, str(value))
+
+
+# indexing
+# --------
+def _freeze(value):
+    """
+    Return hashable representation of value for index entries.
+    """
+    if isinstance(value, bool):
+        return ('$bool', value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(value[key])) for key in value))
+    if isinstance(value, list):
+        return tuple(_freeze(x) for x in value)
+    return value
+
+
+def _entries(item, keys, sparse=False):
+    """
+    Return index entries for record. Array values are indexed
+    by each element, as well as by the whole array.
+    """
+    values = [_resolve(item, key) for key, direction in keys]
+    if sparse and all(x is __missing__ for x in values):
+        return []
+    values = [[None] if x is __missing__ else _values(x) for x in values]
+    return set(itertools.product(*[[_freeze(x) for x in value] for value in values]))
+
+
+def _lookups(cond):
+    """
+    Return list of values a query condition can be looked up
+    with in a hash index, or None if the condition can't use an index.
+    """
+    if hasattr(cond, 'pattern'):
+        return None
+    if isinstance(cond, dict) and any(x.startswith('$') for x in cond):
+        if '$eq' in cond:
+            cond = cond['$eq']
+        elif '$in' in cond and not any(hasattr(x, 'pattern') for x in cond['$in']):
+            return list(cond['$in'])
+        else:
+            return None
+        if hasattr(cond, 'pattern'):
+            return None
+    return [cond]
+
+
+def _equalities(query):
+    """
+    Return mapping of keys to values for conditions in query
+    that can be looked up in hash indexes.
+    """
+    res = {}
+    for key, cond in query.items():
+        if not key.startswith('$'):
+            values = _lookups(cond)
+            if values is not None:
+                res[key] = values
+    return res
+
+
+# store
+# -----
+class Store(object):
+    """
+    Records and indexes for in-memory backend, shared by backends
+    using the same database name within the process.
+    """
+
+    def __init__(self):
+        self.records = OrderedDict()
+        self.order = {}
+        self.counter = itertools.count()
+        self.indexes = OrderedDict()
+        self.lock = threading.RLock()
+        return
+
+
+# backend
+# -------
+class MemoryBackend(Backend):
+    """
+    Storage backend for records held in process memory, for testing
+    and benchmarking without a database server. Records are looked up
+    through hash indexes on path and on keys declared with ``ensure_index``,
+    and other queries are evaluated by scanning records.
+
+    Args:
+        dbname (str): Name of database to use. Backends with the
+            same database name share records within the process.
+
+    Examples:
+        >>> coda.options({'backend': 'memory'})
+        >>> coda.add(coda.Collection('/path/to/test/dir/'))
+        {'inserted': 12, 'updated': 0}
+    """
+
+    def __init__(self, dbname='coda', **options):
+        super(MemoryBackend, self).__init__(**options)
+        self.dbname = dbname
+        self.store = __stores__.setdefault(dbname, Store())
+        self._required()
+        return
+
+    def _required(self):
+        """
+        Create indexes required by coda.
+        """
+        for keys in __indexes__:
+            self.create_index(keys)
+        return
+
+    @property
+    def db(self):
+        """
+        Internal property for accessing in-memory store.
+        """
+        return self.store
+
+    def _candidates(self, query):
+        """
+        Return name of index used and list of records that could
+        match query, using the most selective hash index available
+        for the query.
+        """
+        records = self.store.records
+        name, best = self._narrow(query)
+        if best is None:
+            return None, list(records.values())
+        return name, [records[x] for x in sorted(best, key=self.store.order.get)]
+
+    def _narrow(self, query):
+        """
+        Return name of index and set of paths for records that could
+        match query, or None if no index can narrow the query. Each
+        branch of ``$and`` and ``$or`` queries is looked up separately,
+        and ``$or`` queries can use indexes if every branch can.
+        """
+        lookups = _equalities(query)
+        if 'path' in lookups:
+            return 'path_1', set(x for x in lookups['path'] if isinstance(x, str) and x in self.store.records)
+        options = [self._lookup(lookups)] + [self._narrow(x) for x in query.get('$and', [])]
+        if '$or' in query:
+            branches = [self._narrow(x) for x in query['$or']]
+            if all(paths is not None for name, paths in branches):
+                names = sorted(set(name for name, paths in branches))
+                options.append((', '.join(names), set().union(*[paths for name, paths in branches])))
+        options = [x for x in options if x[1] is not None]
+        if len(options) == 0:
+            return None, None
+        return min(options, key=lambda x: len(x[1]))
+
+    def _lookup(self, lookups):
+        """
+        Return name of index and set of paths for records matching
+        equality lookups, using the most selective usable index, or
+        None if no index can be used for the lookups.
+        """
+        name, best = None, None
+        for key, index in self.store.indexes.items():
+            keys = [key for key, direction in index['keys']]
+            if not all(key in lookups for key in keys):
+                continue
+            if index['sparse'] and any(None in lookups[key] for key in keys):
+                continue
+            paths = set()
+            for entry in itertools.product(*[[_freeze(x) for x in lookups[key]] for key in keys]):
+                paths.update(index['table'].get(entry, ()))
+            if best is None or len(paths) < len(best):
+                name, best = key, paths
+        return name, best
+
+    def _select(self, query, sort=None, limit=0, skip=0):
+        """
+        Return list of records matching query.
+        """
+        with self.store.lock:
+            items = [x for x in self._candidates(query)[1] if _match(x, query)]
+        for key, direction in reversed(sort or []):
+            items.sort(key=lambda x: _rank(_resolve(x, key)), reverse=direction == -1)
+        items = items[skip:]
+        if limit:
+            items = items[:limit]
+        return items
+
+    def _load(self, item, projection=None):
+        """
+        Return copy of stored record.
+        """
+        if projection is not None:
+            keys = set(key.split('.')[0] for key, value in projection.items() if value) | set(['path'])
+            item = {key: item[key] for key in item if key in keys}
+        return copy.deepcopy(item)
+
+    def _put(self, item):
+        """
+        Store record, updating index entries for the record.
+        """
+        path = item['path']
+        entries = {}
+        for name, index in self.store.indexes.items():
+            entries[name] = _entries(item, index['keys'], index['sparse'])
+            if index['unique']:
+                for entry in entries[name]:
+                    if len(index['table'].get(entry, set()) - set([path])):
+                        raise AssertionError('{}: duplicate key for index `{}`'.format(path, name))
+        current = self.store.records.get(path)
+        if current is not None:
+            self._unindex(current)
+        for name, index in self.store.indexes.items():
+            for entry in entries[name]:
+                index['table'].setdefault(entry, set()).add(path)
+        self.store.records[path] = item
+        self.store.order.setdefault(path, next(self.store.counter))
+        return
+
+    def _unindex(self, item):
+        """
+        Remove index entries for record.
+        """
+        for index in self.store.indexes.values():
+            for entry in _entries(item, index['keys'], index['sparse']):
+                paths = index['table'].get(entry)
+                if paths is not None:
+                    paths.discard(item['path'])
+                    if len(paths) == 0:
+                        del index['table'][entry]
+        return
+
+    def _remove(self, path):
+        """
+        Remove record and index entries for the record.
+        """
+        item = self.store.records.pop(path)
+        self.store.order.pop(path)
+        self._unindex(item)
+        return
+
+    def _write(self, items, ordered):
+        """
+        Store records, collecting errors for records that violate
+        unique indexes.
+        """
+        summary = {'inserted': 0, 'updated': 0}
+        errors = []
+        for item in items:
+            exists = item['path'] in self.store.records
+            try:
+                self._put(item)
+            except AssertionError as exe:
+                errors.append(str(exe))
+                if ordered:
+                    break
+                continue
+            summary['updated' if exists else 'inserted'] += 1
+        if len(errors):
+            raise AssertionError('Could not write records -- {}'.format('; '.join(errors)))
+        return summary
+
+    def find(self, query, projection=None, sort=None, limit=0, skip=0, batch_size=0):
+        items = self._select(query, sort=sort, limit=limit, skip=skip)
+        return (self._load(x, projection) for x in items)
+
+    def count(self, query, limit=0, skip=0):
+        return len(self._select(query, limit=limit, skip=skip))
+
+    def replace(self, records, ordered=False):
+        items = []
+        for record in records:
+            item = copy.deepcopy(record)
+            item.pop('_id', None)
+            items.append(item)
+        with self.store.lock:
+            return self._write(items, ordered)
+
+    def update(self, updates, ordered=False, upsert=True):
+        with self.store.lock:
+            items = []
+            for path, update in updates:
+                if not upsert and path not in self.store.records:
+                    continue
+                item = copy.deepcopy(self.store.records.get(path, {'path': path}))
+                items.append(apply_update(item, update))
+            return self._write(items, ordered)
+
+    def update_many(self, query, update):
+        with self.store.lock:
+            items = [apply_update(copy.deepcopy(x), update) for x in self._select(query)]
+            self._write(items, ordered=True)
+        return len(items)
+
+    def delete(self, query):
+        with self.store.lock:
+            items = self._select(query)
+            for item in items:
+                self._remove(item['path'])
+        return len(items)
+
+    def create_index(self, keys, unique=False, sparse=False):
+        name = index_name(keys)
+        if keys == [('path', 1)]:
+            return name
+        with self.store.lock:
+            if name in self.store.indexes:
+                return name
+            table = {}
+            for path, item in self.store.records.items():
+                for entry in _entries(item, keys, sparse):
+                    paths = table.setdefault(entry, set())
+                    if unique and len(paths):
+                        raise AssertionError('Could not create unique index `{}` -- '
+                                             'duplicate key for {}'.format(name, path))
+                    paths.add(path)
+            self.store.indexes[name] = {
+                'keys': [tuple(x) for x in keys],
+                'unique': unique,
+                'sparse': sparse,
+                'table': table
+            }
+        return name
+
+    def list_indexes(self):
+        res = [{'name': 'path_1', 'keys': [('path', 1)], 'unique': True}]
+        with self.store.lock:
+            for name, index in self.store.indexes.items():
+                res.append({'name': name, 'keys': list(index['keys']), 'unique': index['unique']})
+        return res
+
+    def drop_index(self, keys):
+        name = index_name(keys)
+        with self.store.lock:
+            if name not in self.store.indexes:
+                raise AssertionError('Index `{}` does not exist.'.format(name))
+            del self.store.indexes[name]
+        return
+
+    def explain(self, query, sort=None):
+        with self.store.lock:
+            index, candidates = self._candidates(query)
+            returned = sum(1 for x in candidates if _match(x, query))
+        return {
+            'plan': 'SCAN' if index is None else 'LOOKUP {}'.format(index),
+            'index': index,
+            'examined': len(candidates),
+            'returned': returned,
+            'details': {'index': index, 'candidates': len(candidates), 'sort': sort}
+        }
+
+    def duplicates(self, query=None):
+        match = {'_checksum.digest': {'$exists': True}}
+        if query is not None:
+            match = {'$and': [query, match]}
+        groups = OrderedDict()
+        for item in self._select(match):
+            checksum = item['_checksum']
+            group = groups.setdefault((checksum['digest'], checksum.get('algorithm')), {
+                'digest': checksum['digest'],
+                'algorithm': checksum.get('algorithm'),
+                'size': checksum.get('size'),
+                'paths': []
+            })
+            group['paths'].append(item['path'])
+        res = [x for x in groups.values() if len(x['paths']) > 1]
+        return sorted(res, key=lambda x: -len(x['paths']))
+
+    def drop(self):
+        with self.store.lock:
+            self.store.records.clear()
+            self.store.order.clear()
+            self.store.indexes.clear()
+        self._required()
+        return
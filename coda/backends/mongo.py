@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+# MongoDB storage backend
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import pymongo
+from pymongo import monitoring
+
+from coda.backends import Backend, index_name, __indexes__
+from coda.metrics import metrics
+
+
+# monitoring
+# ----------
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Listener recording timings for commands sent to mongodb as
+    ``command.<name>`` operations (see ``coda.stats``). Document
+    counts are taken from cursor batches and write results.
+    """
+
+    def started(self, event):
+        return
+
+    def succeeded(self, event):
+        reply, documents = event.reply, 0
+        if 'cursor' in reply:
+            cursor = reply['cursor']
+            documents = len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+        elif 'n' in reply:
+            documents = reply['n']
+        metrics.record('command.' + event.command_name, event.duration_micros / 1e6, documents)
+        return
+
+    def failed(self, event):
+        metrics.record('command.' + event.command_name, event.duration_micros / 1e6)
+        return
+
+
+# helpers
+# -------
+def _stages(plan):
+    """
+    Return list of stages in query plan, from the root stage down.
+    """
+    res = [plan]
+    if 'inputStage' in plan:
+        res.extend(_stages(plan['inputStage']))
+    for item in plan.get('inputStages', []):
+        res.extend(_stages(item))
+    return res
+
+
+# backend
+# -------
+class MongoBackend(Backend):
+    """
+    Storage backend for records held in a mongodb database.
+
+    Args:
+        host (str): Host with database to connect to.
+        port (int): Port to connect to database with.
+        dbname (str): Name of database to use.
+        pool_size (int): Maximum number of connections in pool.
+        connect_timeout (float): Number of seconds to wait for
+            connections to open.
+        socket_timeout (float): Number of seconds to wait for responses
+            to database operations. If None, operations don't time out.
+        server_selection_timeout (float): Number of seconds to wait for
+            an available server before raising an error.
+        compressors (str, list): Compressors to negotiate with the
+            server for network traffic (i.e. ``zstd``, ``snappy``, ``zlib``).
+        appname (str): Application name reported to the server.
+        command_monitoring (bool): Whether or not to record timings
+            for individual commands sent to the server.
+    """
+
+    def __init__(self, host='localhost', port=27017, dbname='coda', pool_size=100,
+                 connect_timeout=20, socket_timeout=None, server_selection_timeout=30,
+                 compressors=None, appname='coda', command_monitoring=False, **options):
+        super(MongoBackend, self).__init__(**options)
+        self.host = host
+        self.port = port
+        self.dbname = dbname
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.socket_timeout = socket_timeout
+        self.server_selection_timeout = server_selection_timeout
+        self.compressors = compressors
+        self.appname = appname
+        self.command_monitoring = command_monitoring
+        self._db = None
+        return
+
+    @property
+    def client_options(self):
+        """
+        Return keyword arguments for creating mongodb client.
+        """
+        options = {
+            'maxPoolSize': self.pool_size,
+            'connectTimeoutMS': self.connect_timeout,
+            'socketTimeoutMS': self.socket_timeout,
+            'serverSelectionTimeoutMS': self.server_selection_timeout,
+            'compressors': self.compressors,
+            'appname': self.appname
+        }
+        for key in ['connectTimeoutMS', 'socketTimeoutMS', 'serverSelectionTimeoutMS']:
+            if options[key] is not None:
+                options[key] = int(options[key] * 1000)
+        if isinstance(options['compressors'], (list, tuple)):
+            options['compressors'] = ','.join(options['compressors'])
+        if self.command_monitoring:
+            options['event_listeners'] = [CommandMetrics()]
+        return {key: value for key, value in options.items() if value is not None}
+
+    @property
+    def db(self):
+        """
+        Internal property for managing connection to mongodb database.
+        """
+        if self._db is None:
+            try:
+                client = pymongo.MongoClient(self.host, self.port, **self.client_options)
+                db = client[self.dbname]
+                self._required(db)
+                self._db = db
+            except pymongo.errors.ServerSelectionTimeoutError:
+                self._db = None
+                raise AssertionError('Could not connect to database! Try using `mongod` to start mongo server.')
+        return self._db
+
+    def _required(self, db):
+        """
+        Create indexes required by coda.
+        """
+        db.files.create_index([('path', pymongo.ASCENDING)], unique=True)
+        for keys in __indexes__:
+            db.files.create_index(keys)
+        return
+
+    def find(self, query, projection=None, sort=None, limit=0, skip=0, batch_size=0):
+        return self.db.files.find(
+            query, projection=projection, sort=sort,
+            limit=limit, skip=skip, batch_size=batch_size
+        )
+
+    def find_one(self, query, projection=None, sort=None, skip=0):
+        return self.db.files.find_one(query, projection=projection, sort=sort, skip=skip)
+
+    def count(self, query, limit=0, skip=0):
+        options = {'skip': skip}
+        if limit:
+            options['limit'] = limit
+        return self.db.files.count_documents(query, **options)
+
+    def replace(self, records, ordered=False):
+        requests = [pymongo.ReplaceOne({'path': x['path']}, x, upsert=True) for x in records]
+        if len(requests) == 0:
+            return {'inserted': 0, 'updated': 0}
+        res = self.db.files.bulk_write(requests, ordered=ordered)
+        return {'inserted': res.upserted_count, 'updated': res.matched_count}
+
+    def update(self, updates, ordered=False, upsert=True):
+        requests = [pymongo.UpdateOne({'path': path}, update, upsert=upsert) for path, update in updates]
+        if len(requests) == 0:
+            return {'inserted': 0, 'updated': 0}
+        res = self.db.files.bulk_write(requests, ordered=ordered)
+        return {'inserted': res.upserted_count, 'updated': res.matched_count}
+
+    def update_many(self, query, update):
+        return self.db.files.update_many(query, update).matched_count
+
+    def delete(self, query):
+        return self.db.files.delete_many(query).deleted_count
+
+    def create_index(self, keys, unique=False, sparse=False):
+        return self.db.files.create_index(keys, unique=unique, sparse=sparse)
+
+    def list_indexes(self):
+        res = []
+        for item in self.db.files.list_indexes():
+            res.append({
+                'name': item['name'],
+                'keys': list(item['key'].items()),
+                'unique': bool(item.get('unique', False))
+            })
+        return res
+
+    def drop_index(self, keys):
+        try:
+            self.db.files.drop_index(keys)
+        except pymongo.errors.OperationFailure:
+            raise AssertionError('Index `{}` does not exist.'.format(index_name(keys)))
+        return
+
+    def explain(self, query, sort=None):
+        res = self.db.files.find(query, sort=sort).explain()
+        plan = res['queryPlanner']['winningPlan']
+        plan = plan.get('queryPlan', plan)
+        stats = res.get('executionStats', {})
+        stages = _stages(plan)
+        indexes = [x['indexName'] for x in stages if 'indexName' in x]
+        return {
+            'plan': ' <- '.join(x['stage'] for x in stages),
+            'index': indexes[0] if len(indexes) else None,
+            'examined': stats.get('totalDocsExamined'),
+            'returned': stats.get('nReturned'),
+            'details': plan
+        }
+
+    def duplicates(self, query=None):
+        match = {'_checksum.digest': {'$exists': True}}
+        if query is not None:
+            match = {'$and': [query, match]}
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {'digest': '$_checksum.digest', 'algorithm': '$_checksum.algorithm'},
+                'size': {'$first': '$_checksum.size'},
+                'paths': {'$push': '$path'},
+                'count': {'$sum': 1}
+            }},
+            {'$match': {'count': {'$gt': 1}}},
+            {'$sort': {'count': -1}}
+        ]
+        res = []
+        for item in self.db.files.aggregate(pipeline):
+            res.append({
+                'digest': item['_id']['digest'],
+                'algorithm': item['_id']['algorithm'],
+                'size': item['size'],
+                'paths': item['paths']
+            })
+        return res
+
+    def drop(self):
+        self.db.files.drop()
+        self._required(self.db)
+        return
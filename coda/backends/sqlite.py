@@ -0,0 +1,618 @@
+# -*- coding: utf-8 -*-
+#
+# Embedded SQLite storage backend
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import os
+import re
+import json
+import sqlite3
+import threading
+from bson import json_util
+
+from coda.backends import Backend, index_name, apply_update, __indexes__
+
+
+# config
+# ------
+__flags__ = {re.I: 'i', re.M: 'm', re.S: 's', re.X: 'x'}
+__negations__ = {'$ne': '$eq', '$nin': '$in'}
+
+
+# query translation
+# -----------------
+def _jpath(key):
+    """
+    Return JSON path for (possibly dotted) metadata key.
+    """
+    parts = key.split('.')
+    for part in parts:
+        if len(part) == 0 or '"' in part or "'" in part:
+            raise AssertionError('Metadata key `{}` is not supported by the sqlite backend.'.format(key))
+    return '$.' + '.'.join('"{}"'.format(part) for part in parts)
+
+
+def _field(key):
+    """
+    Return SQL expression for metadata key. Expressions are generated
+    consistently so that they match expression indexes on the table.
+    """
+    if key == 'path':
+        return 'path'
+    return "json_extract(data, '{}')".format(_jpath(key))
+
+
+def _exists(key):
+    """
+    Return SQL expression testing if metadata key exists.
+    """
+    if key == 'path':
+        return '1'
+    return "json_type(data, '{}') IS NOT NULL".format(_jpath(key))
+
+
+def _value(value):
+    """
+    Convert query value to SQL parameter.
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, separators=(',', ':'))
+    return value
+
+
+def _element(key):
+    """
+    Return SQL expressions for the value and JSON type of metadata key.
+    """
+    if key == 'path':
+        return 'path', "'text'"
+    return _field(key), "json_type(data, '{}')".format(_jpath(key))
+
+
+def _typed(typ, value):
+    """
+    Return SQL expression restricting matches to values of the same
+    JSON type as the operand, matching mongodb comparison semantics
+    (i.e. booleans don't match numbers, and strings don't match arrays).
+    """
+    if isinstance(value, bool):
+        kinds = ['true', 'false']
+    elif isinstance(value, (int, float)):
+        kinds = ['integer', 'real']
+    elif isinstance(value, str):
+        kinds = ['text']
+    elif isinstance(value, (list, tuple)):
+        kinds = ['array']
+    elif isinstance(value, dict):
+        kinds = ['object']
+    else:
+        return '1'
+    return '{} IN ({})'.format(typ, ', '.join("'{}'".format(x) for x in kinds))
+
+
+def _lists(item, prefix=''):
+    """
+    Return dotted metadata keys with array values in record.
+    """
+    res = set()
+    for key, value in item.items():
+        if isinstance(value, list):
+            res.add(prefix + key)
+        elif isinstance(value, dict):
+            res |= _lists(value, prefix + key + '.')
+    return res
+
+
+def _prefix(pattern):
+    """
+    Return literal prefix for anchored regular expression, and whether
+    or not the prefix is the whole expression. Patterns without a
+    literal prefix return an empty prefix.
+    """
+    if not pattern.startswith('^') or re.search(r'(?<!\\)\|', pattern):
+        return '', False
+    prefix, idx = [], 1
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == '\\' and idx + 1 < len(pattern) and not pattern[idx + 1].isalnum():
+            prefix.append(pattern[idx + 1])
+            idx += 2
+        elif char in '.^$*+?{}[]|()\\':
+            if char in '*?{' and len(prefix):
+                prefix.pop()
+            return ''.join(prefix), False
+        else:
+            prefix.append(char)
+            idx += 1
+    return ''.join(prefix), True
+
+
+def _regex(expr, typ, pattern, options, params):
+    """
+    Return SQL expression for regular expression match. Anchored
+    literal prefixes are translated into range queries that can use
+    indexes on the field.
+    """
+    if hasattr(pattern, 'pattern'):
+        options += ''.join(flag for value, flag in __flags__.items() if pattern.flags & value)
+        pattern = pattern.pattern
+    options = ''.join(sorted(set(options) & set(__flags__.values())))
+    prefix, literal = ('', False) if options else _prefix(pattern)
+    clauses = ["{} = 'text'".format(typ)]
+    if len(prefix):
+        params.extend([prefix, prefix + u'\U0010ffff'])
+        clauses.append('{0} >= ? AND {0} < ?'.format(expr))
+    if not literal:
+        if options:
+            pattern = '(?{}){}'.format(options, pattern)
+        params.append(pattern)
+        clauses.append('{} REGEXP ?'.format(expr))
+    return '({})'.format(' AND '.join(clauses))
+
+
+def _equality(expr, typ, arg, params):
+    """
+    Return SQL expression for ``$eq`` operator.
+    """
+    if arg is None:
+        return '{} IS NULL'.format(expr)
+    params.append(_value(arg))
+    return '({} = ? AND {})'.format(expr, _typed(typ, arg))
+
+
+def _membership(expr, typ, arg, params):
+    """
+    Return SQL expression for ``$in`` operator. Values are grouped
+    by type, so that each group can be looked up with an index.
+    """
+    groups = {}
+    for value in arg:
+        if value is not None:
+            groups.setdefault(_typed(typ, value), []).append(_value(value))
+    clauses = []
+    for typed, values in groups.items():
+        params.extend(values)
+        clauses.append('({} IN ({}) AND {})'.format(expr, ', '.join(['?'] * len(values)), typed))
+    if any(value is None for value in arg):
+        clauses.append('{} IS NULL'.format(expr))
+    return '({})'.format(' OR '.join(clauses)) if len(clauses) else '0'
+
+
+def _comparison(expr, typ, op, arg, params):
+    """
+    Return SQL expression for ``$lt``, ``$lte``, ``$gt``, and ``$gte`` operators.
+    """
+    params.append(_value(arg))
+    sign = {'$lt': '<', '$lte': '<=', '$gt': '>', '$gte': '>='}[op]
+    return '({} {} ? AND {})'.format(expr, sign, _typed(typ, arg))
+
+
+def _clause(expr, typ, op, arg, options, params):
+    """
+    Return SQL expression for value operator on SQL expressions
+    for value and JSON type.
+    """
+    if op == '$eq':
+        return _equality(expr, typ, arg, params)
+    elif op == '$in':
+        return _membership(expr, typ, arg, params)
+    elif op in ('$lt', '$lte', '$gt', '$gte'):
+        return _comparison(expr, typ, op, arg, params)
+    return _regex(expr, typ, arg, options, params)
+
+
+def _operator(key, op, arg, options, params, arrays=()):
+    """
+    Return SQL expression for query operator on metadata key. For
+    keys holding arrays in any record, elements of arrays are also
+    matched, like they are with mongodb.
+    """
+    if op == '$eq' and hasattr(arg, 'pattern'):
+        op = '$regex'
+    if op in ('$ne', '$nin'):
+        return 'NOT COALESCE(({}), 0)'.format(_operator(key, __negations__[op], arg, options, params, arrays))
+    elif op == '$exists':
+        clause = _exists(key)
+        return clause if arg else 'NOT ({})'.format(clause)
+    elif op == '$not':
+        return 'NOT COALESCE(({}), 0)'.format(_condition(key, arg, params, arrays))
+    elif op not in ('$eq', '$in', '$lt', '$lte', '$gt', '$gte', '$regex'):
+        raise AssertionError('Query operator `{}` is not supported by the sqlite backend.'.format(op))
+    expr, typ = _element(key)
+    clause = _clause(expr, typ, op, arg, options, params)
+    if key not in arrays:
+        return clause
+    return "({} OR ({} = 'array' AND EXISTS (SELECT 1 FROM json_each(data, '{}') WHERE {})))".format(
+        clause, typ, _jpath(key), _clause('value', 'type', op, arg, options, params)
+    )
+
+
+def _condition(key, value, params, arrays=()):
+    """
+    Return SQL expression for query on metadata key.
+    """
+    if isinstance(value, dict) and any(x.startswith('$') for x in value):
+        value = dict(value)
+        options = value.pop('$options', '')
+        clauses = [_operator(key, op, arg, options, params, arrays) for op, arg in value.items()]
+        return ' AND '.join(clauses) if len(clauses) else '1'
+    return _operator(key, '$eq', value, '', params, arrays)
+
+
+def _where(query, params, arrays=()):
+    """
+    Translate mongodb query into SQL expression, appending parameters
+    for the expression to ``params``. Conditions on keys in ``arrays``
+    also match elements of arrays.
+
+    Examples:
+        >>> params = []
+        >>> _where({'group': 'train', 'count': {'$lt': 30}}, params)
+        "(json_extract(data, '$.\"group\"') = ? AND ...) AND (json_extract(data, '$.\"count\"') < ? AND ...)"
+        >>> params
+        ['train', 30]
+    """
+    clauses = []
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            if len(value) == 0:
+                raise AssertionError('Arrays for `{}` queries must be nonempty.'.format(key))
+            subs = ['({})'.format(_where(x, params, arrays)) for x in value]
+            if key == '$and':
+                clauses.append(' AND '.join(subs))
+            elif key == '$or':
+                clauses.append('({})'.format(' OR '.join(subs)))
+            else:
+                clauses.append('NOT ({})'.format(' OR '.join(subs)))
+        elif key.startswith('$'):
+            raise AssertionError('Query operator `{}` is not supported by the sqlite backend.'.format(key))
+        else:
+            clauses.append(_condition(key, value, params, arrays))
+    return ' AND '.join(clauses) if len(clauses) else '1'
+
+
+def _order(sort):
+    """
+    Return SQL ordering clause for list of (key, direction) pairs.
+    """
+    if not sort:
+        return ''
+    return ' ORDER BY ' + ', '.join(
+        '{} {}'.format(_field(key), 'DESC' if direction == -1 else 'ASC')
+        for key, direction in sort
+    )
+
+
+def _regexp(pattern, value):
+    """
+    Implementation of SQL REGEXP operator.
+    """
+    if not isinstance(value, str):
+        return False
+    return re.search(pattern, value) is not None
+
+
+def _updated(data, update):
+    """
+    Implementation of SQL function applying update document to
+    serialized record.
+    """
+    return json_util.dumps(apply_update(json_util.loads(data), json_util.loads(update)))
+
+
+# backend
+# -------
+class SQLiteBackend(Backend):
+    """
+    Storage backend for records held in an embedded SQLite database,
+    for using coda without a database server. Records are stored as
+    JSON documents, and mongodb queries are translated to SQL on the
+    documents, so that indexes created with ``ensure_index`` are used
+    for queries on indexed keys. Like mongodb, queries on keys holding
+    arrays match array elements as well as whole arrays, and values
+    only match values of the same type (i.e. ``True`` doesn't match ``1``).
+    Queries on keys that hold arrays in any record can't use indexes
+    on those keys, and dotted keys don't reach into arrays of documents.
+
+    Args:
+        sqlite_path (str): Path to SQLite database.
+
+    Examples:
+        >>> # ~/.coda
+        >>> {
+        >>>     "backend": "sqlite",
+        >>>     "sqlite_path": "~/.coda.sqlite"
+        >>> }
+    """
+
+    def __init__(self, sqlite_path='~/.coda.sqlite', **options):
+        super(SQLiteBackend, self).__init__(**options)
+        if sqlite_path != ':memory:':
+            sqlite_path = os.path.realpath(os.path.expanduser(sqlite_path))
+        self.path = sqlite_path
+        self._db = None
+        self._arrays = None
+        self._lock = threading.RLock()
+        return
+
+    @property
+    def db(self):
+        """
+        Internal property for managing connection to SQLite database.
+        """
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.create_function('regexp', 2, _regexp)
+            db.create_function('coda_update', 2, _updated)
+            with self._lock, db:
+                db.execute('PRAGMA journal_mode = WAL')
+                db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, data TEXT)')
+                db.execute(
+                    'CREATE TABLE IF NOT EXISTS indexes ('
+                    'name TEXT PRIMARY KEY, keys TEXT, is_unique INTEGER, sparse INTEGER)'
+                )
+                self._arrays = self._array_keys(db)
+            self._db = db
+            self._required()
+        return self._db
+
+    @property
+    def arrays(self):
+        """
+        Return set of metadata keys holding arrays in any record, for
+        matching array elements in queries on those keys.
+        """
+        if self._db is None:
+            self.db
+        return self._arrays
+
+    def _array_keys(self, db):
+        """
+        Load metadata keys holding arrays, creating the table
+        tracking them from existing records if necessary.
+        """
+        exists = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'arrays'").fetchone()
+        if exists is None:
+            db.execute('CREATE TABLE arrays (key TEXT PRIMARY KEY)')
+            keys = set()
+            for data, in db.execute('SELECT data FROM files'):
+                keys |= _lists(json_util.loads(data))
+            db.executemany('INSERT INTO arrays (key) VALUES (?)', [(key,) for key in keys])
+        return set(key for key, in db.execute('SELECT key FROM arrays'))
+
+    def _required(self):
+        """
+        Create indexes required by coda.
+        """
+        for keys in __indexes__:
+            self.create_index(keys)
+        return
+
+    def _load(self, path, data, projection=None):
+        """
+        Build record from row in files table.
+        """
+        item = json_util.loads(data)
+        if projection is not None:
+            keys = set(key.split('.')[0] for key, value in projection.items() if value)
+            item = {key: item[key] for key in item if key in keys}
+        item['path'] = path
+        return item
+
+    def _rows(self, paths):
+        """
+        Return mapping of paths to current records for paths.
+        """
+        res = {}
+        for idx in range(0, len(paths), 500):
+            chunk = paths[idx:idx + 500]
+            rows = self.db.execute(
+                'SELECT path, data FROM files WHERE path IN ({})'.format(', '.join(['?'] * len(chunk))), chunk
+            )
+            for path, data in rows:
+                res[path] = json_util.loads(data)
+        return res
+
+    def _write(self, rows, ordered):
+        """
+        Upsert (path, record) rows, collecting errors for rows that
+        violate unique indexes.
+        """
+        errors, keys = [], set()
+        for path, item in rows:
+            try:
+                self.db.execute(
+                    'INSERT INTO files (path, data) VALUES (?, ?) '
+                    'ON CONFLICT (path) DO UPDATE SET data = excluded.data',
+                    (path, json_util.dumps(item))
+                )
+                keys |= _lists(item)
+            except sqlite3.IntegrityError as exe:
+                errors.append('{}: {}'.format(path, exe))
+                if ordered:
+                    break
+        keys -= self.arrays
+        if len(keys):
+            self.db.executemany('INSERT OR IGNORE INTO arrays (key) VALUES (?)', [(key,) for key in keys])
+            self._arrays = self._arrays | keys
+        return errors
+
+    def find(self, query, projection=None, sort=None, limit=0, skip=0, batch_size=0):
+        params = []
+        sql = 'SELECT path, data FROM files WHERE ' + _where(query, params, self.arrays) + _order(sort)
+        if limit or skip:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([limit or -1, skip])
+        with self._lock:
+            cursor = self.db.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size or 1000)
+            if len(rows) == 0:
+                return
+            for path, data in rows:
+                yield self._load(path, data, projection)
+
+    def count(self, query, limit=0, skip=0):
+        params = []
+        sql = 'SELECT 1 FROM files WHERE ' + _where(query, params, self.arrays)
+        if limit or skip:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([limit or -1, skip])
+        with self._lock:
+            return self.db.execute('SELECT COUNT(*) FROM ({})'.format(sql), params).fetchone()[0]
+
+    def replace(self, records, ordered=False):
+        rows = [(x['path'], {key: x[key] for key in x if key not in ('path', '_id')}) for x in records]
+        with self._lock, self.db:
+            current = self._rows([path for path, item in rows])
+            errors = self._write(rows, ordered)
+        if len(errors):
+            raise AssertionError('Could not write records -- {}'.format('; '.join(errors)))
+        inserted = len(set(path for path, item in rows if path not in current))
+        return {'inserted': inserted, 'updated': len(rows) - inserted}
+
+    def update(self, updates, ordered=False, upsert=True):
+        summary = {'inserted': 0, 'updated': 0}
+        with self._lock, self.db:
+            current = self._rows([path for path, update in updates])
+            rows = []
+            for path, update in updates:
+                if path in current:
+                    summary['updated'] += 1
+                elif not upsert:
+                    continue
+                else:
+                    summary['inserted'] += 1
+                current[path] = apply_update(current.get(path, {}), update)
+                rows.append((path, current[path]))
+            errors = self._write(rows, ordered)
+        if len(errors):
+            raise AssertionError('Could not write records -- {}'.format('; '.join(errors)))
+        return summary
+
+    def update_many(self, query, update):
+        params = [json_util.dumps(update)]
+        sql = 'UPDATE files SET data = coda_update(data, ?) WHERE ' + _where(query, params, self.arrays)
+        keys = _lists(update.get('$set', {})) - self.arrays
+        with self._lock, self.db:
+            try:
+                res = self.db.execute(sql, params).rowcount
+            except sqlite3.IntegrityError as exe:
+                raise AssertionError('Could not write records -- {}'.format(exe))
+            if len(keys):
+                self.db.executemany('INSERT OR IGNORE INTO arrays (key) VALUES (?)', [(key,) for key in keys])
+                self._arrays = self._arrays | keys
+        return res
+
+    def delete(self, query):
+        params = []
+        with self._lock, self.db:
+            return self.db.execute('DELETE FROM files WHERE ' + _where(query, params, self.arrays), params).rowcount
+
+    def create_index(self, keys, unique=False, sparse=False):
+        name = index_name(keys)
+        if keys == [('path', 1)]:
+            return name
+        sql = 'CREATE {}INDEX IF NOT EXISTS "files_{}" ON files ({})'.format(
+            'UNIQUE ' if unique else '', name,
+            ', '.join('{} {}'.format(_field(key), 'DESC' if direction == -1 else 'ASC') for key, direction in keys)
+        )
+        if sparse:
+            sql += ' WHERE ' + ' OR '.join(_exists(key) for key, direction in keys)
+        with self._lock, self.db:
+            self.db.execute(sql)
+            self.db.execute(
+                'INSERT OR REPLACE INTO indexes (name, keys, is_unique, sparse) VALUES (?, ?, ?, ?)',
+                (name, json.dumps(keys), int(unique), int(sparse))
+            )
+        return name
+
+    def list_indexes(self):
+        res = [{'name': 'path_1', 'keys': [('path', 1)], 'unique': True}]
+        with self._lock:
+            rows = self.db.execute('SELECT name, keys, is_unique FROM indexes ORDER BY rowid').fetchall()
+        for name, keys, unique in rows:
+            res.append({
+                'name': name,
+                'keys': [tuple(x) for x in json.loads(keys)],
+                'unique': bool(unique)
+            })
+        return res
+
+    def drop_index(self, keys):
+        name = index_name(keys)
+        with self._lock, self.db:
+            if self.db.execute('DELETE FROM indexes WHERE name = ?', (name,)).rowcount == 0:
+                raise AssertionError('Index `{}` does not exist.'.format(name))
+            self.db.execute('DROP INDEX IF EXISTS "files_{}"'.format(name))
+        return
+
+    def explain(self, query, sort=None):
+        params = []
+        where = _where(query, params, self.arrays)
+        with self._lock:
+            plan = [row[-1] for row in self.db.execute(
+                'EXPLAIN QUERY PLAN SELECT path, data FROM files WHERE ' + where + _order(sort), params
+            ).fetchall()]
+            returned = self.db.execute('SELECT COUNT(*) FROM files WHERE ' + where, params).fetchone()[0]
+            total = self.db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        index = None
+        for item in plan:
+            match = re.search(r'USING (?:COVERING )?INDEX (\S+)', item)
+            if match:
+                index = match.group(1)
+            elif 'USING PRIMARY KEY' in item:
+                index = 'sqlite_autoindex_files_1'
+            if index is not None:
+                break
+        if index is not None:
+            index = 'path_1' if index.startswith('sqlite_autoindex_files') else index.replace('files_', '', 1)
+        return {
+            'plan': '; '.join(plan),
+            'index': index,
+            'examined': total if index is None else None,
+            'returned': returned,
+            'details': plan
+        }
+
+    def duplicates(self, query=None):
+        params = []
+        where = '1' if query is None else _where(query, params, self.arrays)
+        sql = (
+            'SELECT {digest} AS digest, {algorithm} AS algorithm, MIN({size}), '
+            'json_group_array(path), COUNT(*) AS count FROM files '
+            'WHERE digest IS NOT NULL AND ({where}) '
+            'GROUP BY digest, algorithm HAVING count > 1 ORDER BY count DESC'
+        ).format(
+            digest=_field('_checksum.digest'),
+            algorithm=_field('_checksum.algorithm'),
+            size=_field('_checksum.size'),
+            where=where
+        )
+        with self._lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [{
+            'digest': digest,
+            'algorithm': algorithm,
+            'size': size,
+            'paths': json.loads(paths)
+        } for digest, algorithm, size, paths, count in rows]
+
+    def drop(self):
+        with self._lock, self.db:
+            for name, in self.db.execute('SELECT name FROM indexes').fetchall():
+                self.db.execute('DROP INDEX IF EXISTS "files_{}"'.format(name))
+            self.db.execute('DELETE FROM indexes')
+            self.db.execute('DELETE FROM files')
+            self.db.execute('DELETE FROM arrays')
+            self._arrays = set()
+        self._required()
+        return
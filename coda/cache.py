@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+#
+# Local caches for database records
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import os
+import time
+import copy
+import atexit
+import sqlite3
+import weakref
+import threading
+from collections import OrderedDict
+from bson import json_util
+
+
+# disk cache
+# ----------
+class DiskCache(object):
+    """
+    Persistent read-through cache for database records, keyed by
+    database namespace and file path and stored in a local SQLite
+    database. Entries expire after a configurable amount of time, and
+    the least recently used entries are evicted when the cache grows
+    past a configurable size.
+
+    Reads don't write to the cache database -- access times and hit
+    and miss counters are kept in memory and written in batches, when
+    records are written to the cache, when enough reads have
+    accumulated, on ``flush()``, and at exit.
+
+    Args:
+        path (str): Path to SQLite database for cache.
+        ttl (float): Number of seconds entries are valid for.
+        size (int): Maximum number of entries to keep in the cache
+            for the namespace.
+        namespace (str): Identifier for the database records are
+            cached from, so that caches for different databases
+            can share the same file. Expiry, eviction, clearing, and
+            statistics only apply to entries for the namespace.
+        flush_size (int): Number of reads to accumulate before
+            writing access times and counters to the cache.
+
+    Examples:
+        >>> cache = DiskCache('/tmp/coda.db', ttl=60, size=1000, namespace='mongo://localhost:27017/coda')
+        >>> cache.put([{'path': '/data/one.txt', 'group': 'test'}])
+        >>> cache.get(['/data/one.txt', '/data/two.txt'])
+        {'/data/one.txt': {'path': '/data/one.txt', 'group': 'test'}}
+    """
+
+    def __init__(self, path, ttl=3600, size=100000, namespace='', flush_size=1000):
+        self.path = os.path.realpath(os.path.expanduser(path))
+        self.ttl = ttl
+        self.size = size
+        self.namespace = namespace
+        self.flush_size = flush_size
+        self._accessed = {}
+        self._counters = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            if self._conn.execute('PRAGMA user_version').fetchone()[0] < 2:
+                # entries and counters in caches from older versions aren't namespaced
+                self._conn.execute('DROP TABLE IF EXISTS records')
+                self._conn.execute('DROP TABLE IF EXISTS counters')
+                self._conn.execute('PRAGMA user_version = 2')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS records ('
+                'namespace TEXT, path TEXT, data TEXT, stored REAL, accessed REAL, '
+                'PRIMARY KEY (namespace, path))'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS records_accessed ON records (namespace, accessed)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS records_stored ON records (namespace, stored)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS counters ('
+                'namespace TEXT, name TEXT, value INTEGER, PRIMARY KEY (namespace, name))'
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO counters (namespace, name, value) VALUES (?, ?, 0)',
+                [(self.namespace, 'hits'), (self.namespace, 'misses')]
+            )
+        atexit.register(_flush, weakref.ref(self))
+        return
+
+    def get(self, paths):
+        """
+        Get cached records for file paths. Expired entries are
+        treated as misses, and are removed from the cache on
+        the next write.
+
+        Args:
+            paths (list): List of file paths to get records for.
+
+        Returns:
+            dict: Mapping of file paths to cached records.
+        """
+        paths = list(paths)
+        now = time.time()
+        res = {}
+        with self._lock:
+            for idx in range(0, len(paths), 500):
+                chunk = paths[idx:idx + 500]
+                rows = self._conn.execute(
+                    'SELECT path, data FROM records WHERE namespace = ? AND stored > ? AND path IN ({})'.format(
+                        ', '.join(['?'] * len(chunk))),
+                    [self.namespace, now - self.ttl] + chunk
+                )
+                for path, data in rows:
+                    res[path] = json_util.loads(data)
+                    self._accessed[path] = now
+            self._counters['hits'] += len(res)
+            self._counters['misses'] += len(paths) - len(res)
+            pending = sum(self._counters.values()) >= self.flush_size
+        if pending:
+            self.flush()
+        return res
+
+    def flush(self):
+        """
+        Write access times and hit and miss counters accumulated from
+        reads to the cache, and remove expired entries.
+        """
+        with self._lock, self._conn:
+            self._flush()
+        return
+
+    def _flush(self):
+        """
+        Write pending access times and counters. Callers must hold
+        the lock and an open transaction.
+        """
+        self._conn.executemany(
+            'UPDATE records SET accessed = ? WHERE namespace = ? AND path = ?',
+            [(accessed, self.namespace, path) for path, accessed in self._accessed.items()]
+        )
+        for name, value in self._counters.items():
+            self._conn.execute(
+                'UPDATE counters SET value = value + ? WHERE namespace = ? AND name = ?', (value, self.namespace, name)
+            )
+        self._conn.execute(
+            'DELETE FROM records WHERE namespace = ? AND stored <= ?', (self.namespace, time.time() - self.ttl)
+        )
+        self._accessed.clear()
+        self._counters = {'hits': 0, 'misses': 0}
+        return
+
+    def put(self, records):
+        """
+        Store records in cache, evicting the least recently used
+        entries if the cache is full.
+
+        Args:
+            records (list): List of database records to cache.
+        """
+        now = time.time()
+        rows = [(self.namespace, x['path'], json_util.dumps(x), now, now) for x in records]
+        if len(rows) == 0:
+            return
+        with self._lock, self._conn:
+            self._flush()
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO records (namespace, path, data, stored, accessed) VALUES (?, ?, ?, ?, ?)', rows
+            )
+            count = self._conn.execute(
+                'SELECT COUNT(*) FROM records WHERE namespace = ?', (self.namespace,)
+            ).fetchone()[0]
+            if count > self.size:
+                self._conn.execute(
+                    'DELETE FROM records WHERE rowid IN '
+                    '(SELECT rowid FROM records WHERE namespace = ? ORDER BY accessed LIMIT ?)',
+                    (self.namespace, count - self.size)
+                )
+        return
+
+    def delete(self, paths):
+        """
+        Remove entries for file paths from cache.
+
+        Args:
+            paths (list): List of file paths to remove.
+        """
+        paths = list(paths)
+        with self._lock, self._conn:
+            for idx in range(0, len(paths), 500):
+                chunk = paths[idx:idx + 500]
+                self._conn.execute(
+                    'DELETE FROM records WHERE namespace = ? AND path IN ({})'.format(', '.join(['?'] * len(chunk))),
+                    [self.namespace] + chunk
+                )
+                for path in chunk:
+                    self._accessed.pop(path, None)
+        return
+
+    def clear(self, counters=True):
+        """
+        Remove all entries for the namespace from cache.
+
+        Args:
+            counters (bool): Whether or not to also reset hit
+                and miss counters.
+        """
+        with self._lock, self._conn:
+            self._accessed.clear()
+            self._conn.execute('DELETE FROM records WHERE namespace = ?', (self.namespace,))
+            if counters:
+                self._counters = {'hits': 0, 'misses': 0}
+                self._conn.execute('UPDATE counters SET value = 0 WHERE namespace = ?', (self.namespace,))
+        return
+
+    def stats(self):
+        """
+        Return statistics about cache usage.
+        """
+        self.flush()
+        with self._lock:
+            entries = self._conn.execute(
+                'SELECT COUNT(*) FROM records WHERE namespace = ?', (self.namespace,)
+            ).fetchone()[0]
+            counters = dict(self._conn.execute(
+                'SELECT name, value FROM counters WHERE namespace = ?', (self.namespace,)
+            ).fetchall())
+        return {
+            'path': self.path,
+            'entries': entries,
+            'size': self.size,
+            'ttl': self.ttl,
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'bytes': os.path.getsize(self.path)
+        }
+
+
+def _flush(ref):
+    """
+    Flush disk cache at exit, if it's still open.
+    """
+    cache = ref()
+    if cache is not None:
+        try:
+            cache.flush()
+        except sqlite3.Error:
+            pass
+    return
+
+
+# query cache
+# -----------
+class QueryCache(object):
+    """
+    In-memory least recently used cache for query results. Results are
+    keyed on a canonical representation of the query and query options,
+    and the cache is bounded by both the number of entries and the total
+    number of documents held across entries.
+
+    Args:
+        size (int): Maximum number of queries to cache results for.
+        documents (int): Maximum number of documents to hold across
+            all cached results.
+
+    Examples:
+        >>> cache = QueryCache(size=100, documents=10000)
+        >>> key = cache.key('find', {'group': 'train'})
+        >>> cache.put(key, [{'path': '/data/one.txt', 'group': 'train'}])
+        >>> cache.get(key)
+        [{'path': '/data/one.txt', 'group': 'train'}]
+    """
+
+    def __init__(self, size=128, documents=100000):
+        self.size = size
+        self.documents = documents
+        self.hits = 0
+        self.misses = 0
+        self._count = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    @staticmethod
+    def key(*args):
+        """
+        Return canonical key for query and query options.
+        """
+        return json_util.dumps(args, sort_keys=True)
+
+    def get(self, key):
+        """
+        Return copy of cached documents for key, or None if the
+        results for the key aren't cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            docs = self._entries[key]
+        return copy.deepcopy(docs)
+
+    def put(self, key, docs):
+        """
+        Cache documents for key, evicting the least recently used
+        entries if the cache is full. Results with more documents
+        than the cache can hold are not cached.
+        """
+        if len(docs) > self.documents or self.size <= 0:
+            return
+        docs = copy.deepcopy(docs)
+        with self._lock:
+            if key in self._entries:
+                self._count -= len(self._entries.pop(key))
+            self._entries[key] = docs
+            self._count += len(docs)
+            while len(self._entries) > self.size or self._count > self.documents:
+                self._count -= len(self._entries.popitem(last=False)[1])
+        return
+
+    def clear(self):
+        """
+        Remove all entries from cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._count = 0
+        return
+
+    def stats(self):
+        """
+        Return statistics about cache usage.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'documents': self._count,
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -9,11 +9,19 @@
 # imports
 # -------
 import os
-from cached_property import cached_property
-import pymongo
+import re
+import json
+import time
+import copy
+import logging
+import itertools
+from functools import partial, wraps
+from concurrent.futures import ThreadPoolExecutor
 from gems import composite, DocRequire, keywords
 
-from coda.objects import File, Collection
+from coda import backends
+from coda.metrics import metrics as _metrics
+from coda.objects import File, Collection, LazyCollection, crawl, digest
 
 
 # config
@@ -21,6 +29,8 @@ from coda.objects import File, Collection
 __base__ = os.path.dirname(os.path.realpath(__file__))
 __default_config__ = os.path.join(__base__, '.coda')
 __user_config__ = os.path.join(os.path.expanduser("~"), '.coda')
+__reserved__ = ['_stat', '_checksum', '_parent']
+logger = logging.getLogger('coda')
 
 
 # database config
@@ -34,14 +44,88 @@ class Session(object):
         port (int): Port to connect to database with.
         write (bool): Whether or not to allow writing to the database.
         dbname (str): Name of database to use.
+        batch_size (int): Number of records to send per bulk write.
+        ordered (bool): Whether or not bulk writes should be applied
+            serially, stopping at the first error.
+        checksum (str): Name of hashlib algorithm to use for file checksums.
+        cache (bool): Whether or not to use a local on-disk cache for
+            database records.
+        cache_path (str): Path to SQLite database for local cache.
+        cache_ttl (float): Number of seconds local cache entries are valid for.
+        cache_size (int): Maximum number of entries in local cache.
+        query_cache (int): Maximum number of queries to cache results for
+            in memory. If 0, query results are not cached.
+        query_cache_documents (int): Maximum number of documents to hold
+            across all cached query results.
+        backend (str): Name of storage backend to use (``mongo``, ``sqlite``,
+            or ``memory``), or import path to a custom backend class.
+        sqlite_path (str): Path to database for the ``sqlite`` backend.
+        aio_workers (int): Maximum number of threads to use for running
+            database calls from ``coda.aio``.
+        pool_size (int): Maximum number of connections in mongodb
+            connection pool.
+        connect_timeout (float): Number of seconds to wait for database
+            connections to open.
+        socket_timeout (float): Number of seconds to wait for responses to
+            database operations. If None, operations don't time out.
+        server_selection_timeout (float): Number of seconds to wait for an
+            available database server before raising an error.
+        compressors (str, list): Compressors to use for network traffic
+            with the database (i.e. ``zstd``, ``snappy``, ``zlib``).
+        appname (str): Application name reported to the database server.
+        metrics (bool): Whether or not to record timings for database
+            operations (see ``coda.stats``).
+        command_monitoring (bool): Whether or not to also record timings
+            for individual commands sent to mongodb.
+        slow_query (float): Number of seconds after which ``find``,
+            ``find_one``, and ``iterate`` calls are logged as slow queries,
+            with the shape of the query. Iterated queries are timed by
+            the time spent waiting on the database cursor, and logged
+            once the cursor is exhausted. If 0, slow queries aren't logged.
+
+    Connections and caches are opened lazily, and are reopened in child
+    processes after a fork, so that the session can be used by
+    multiprocessing workers.
     """
 
-    def __init__(self, host='localhost', port=27017, write=True, dbname='coda'):
+    def __init__(self, host='localhost', port=27017, write=True, dbname='coda',
+                 batch_size=1000, ordered=False, checksum='sha256',
+                 cache=False, cache_path='~/.coda.db', cache_ttl=3600, cache_size=100000,
+                 query_cache=0, query_cache_documents=100000,
+                 backend='mongo', sqlite_path='~/.coda.sqlite', aio_workers=16,
+                 pool_size=100, connect_timeout=20, socket_timeout=None,
+                 server_selection_timeout=30, compressors=None, appname='coda',
+                 metrics=True, command_monitoring=False, slow_query=0):
         self.host = host
         self.port = port
         self.write = write
         self.dbname = dbname
-        self._db = None
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.checksum = checksum
+        self.cache = cache
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.query_cache = query_cache
+        self.query_cache_documents = query_cache_documents
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        self.aio_workers = aio_workers
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.socket_timeout = socket_timeout
+        self.server_selection_timeout = server_selection_timeout
+        self.compressors = compressors
+        self.appname = appname
+        self.metrics = metrics
+        self.command_monitoring = command_monitoring
+        self.slow_query = slow_query
+        _metrics.enabled = metrics
+        self._pid = os.getpid()
+        self._engine = None
+        self._disk_cache = None
+        self._result_cache = None
         return
 
     @property
@@ -53,22 +137,103 @@ class Session(object):
             'host': self.host,
             'port': self.port,
             'write': self.write,
-            'dbname': self.dbname
+            'dbname': self.dbname,
+            'batch_size': self.batch_size,
+            'ordered': self.ordered,
+            'checksum': self.checksum,
+            'cache': self.cache,
+            'cache_path': self.cache_path,
+            'cache_ttl': self.cache_ttl,
+            'cache_size': self.cache_size,
+            'query_cache': self.query_cache,
+            'query_cache_documents': self.query_cache_documents,
+            'backend': self.backend,
+            'sqlite_path': self.sqlite_path,
+            'aio_workers': self.aio_workers,
+            'pool_size': self.pool_size,
+            'connect_timeout': self.connect_timeout,
+            'socket_timeout': self.socket_timeout,
+            'server_selection_timeout': self.server_selection_timeout,
+            'compressors': self.compressors,
+            'appname': self.appname,
+            'metrics': self.metrics,
+            'command_monitoring': self.command_monitoring,
+            'slow_query': self.slow_query
         }
 
+    def _fork(self):
+        """
+        Drop connections and caches inherited from a parent process,
+        so that they're reopened in the current process when used.
+        """
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._engine = None
+            self._disk_cache = None
+            self._result_cache = None
+        return
+
+    @property
+    def namespace(self):
+        """
+        Return identifier for the database used by the session, for
+        scoping entries in local caches. Databases that only live in
+        the current process are scoped to the process.
+        """
+        if self.backend == 'sqlite' and self.sqlite_path != ':memory:':
+            return 'sqlite://{}'.format(os.path.realpath(os.path.expanduser(self.sqlite_path)))
+        res = '{}://{}:{}/{}'.format(self.backend, self.host, self.port, self.dbname)
+        if self.backend in ['memory', 'sqlite']:
+            res += '?pid={}'.format(os.getpid())
+        return res
+
+    @property
+    def disk_cache(self):
+        """
+        Internal property for managing local on-disk cache of
+        database records. If the cache is disabled, this is None.
+        """
+        self._fork()
+        if not self.cache:
+            return None
+        namespace = self.namespace
+        if self._disk_cache is None or self._disk_cache.namespace != namespace:
+            from coda.cache import DiskCache
+            self._disk_cache = DiskCache(self.cache_path, ttl=self.cache_ttl, size=self.cache_size, namespace=namespace)
+        return self._disk_cache
+
+    @property
+    def result_cache(self):
+        """
+        Internal property for managing in-memory cache of query
+        results. If the cache is disabled, this is None.
+        """
+        self._fork()
+        if self.query_cache and self._result_cache is None:
+            from coda.cache import QueryCache
+            self._result_cache = QueryCache(size=self.query_cache, documents=self.query_cache_documents)
+        return self._result_cache
+
+    @property
+    def engine(self):
+        """
+        Internal property for managing storage backend for session.
+        """
+        self._fork()
+        if self._engine is None:
+            self._engine = backends.load(self.backend)(**self.options)
+            if self.write:
+                _backfill(self._engine, self.batch_size)
+        return self._engine
+
     @property
     def db(self):
         """
-        Internal property for managing connection to mongodb database.
+        Internal property for accessing underlying database
+        handle for storage backend.
         """
-        if self._db is None:
-            try:
-                client = pymongo.MongoClient(self.host, self.port)
-                self._db = client[self.dbname]
-            except pymongo.errors.ServerSelectionTimeoutError:
-                self._db = None
-                raise AssertionError('Could not connect to database! Try using `mongod` to start mongo server.')
-        return self._db
+        return self.engine.db
 
 
 @keywords
@@ -89,8 +254,14 @@ def options(*args, **kwargs):
         >>> coda.options({'host': 'remote'})
         >>> coda.find_one({'name': 'test'}).path
         '/file/on/remote/server'
+        >>>
+        >>> # use in-memory storage, without a database server
+        >>> coda.options({'backend': 'memory'})
     """
     global session, __default_config__, __user_config__
+    for arg in args:
+        for key in arg:
+            kwargs.setdefault(key, arg[key])
     with open(__default_config__, 'r') as cfig:
         config = composite(cfig)
     if os.path.exists(__user_config__):
@@ -106,37 +277,318 @@ def options(*args, **kwargs):
     return config.json()
 
 
-session = Session()
-options()
+def _session():
+    """
+    Return session for module, loading configuration
+    the first time the session is used.
+    """
+    if 'session' not in globals():
+        options()
+    return globals()['session']
+
+
+def __getattr__(name):
+    """
+    Load session lazily when accessed as ``coda.db.session``, so
+    that importing coda doesn't read configuration files.
+    """
+    if name == 'session':
+        return _session()
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
+# metrics
+# -------
+def _found(res):
+    """
+    Return number of files in query result, without pulling
+    results for lazy collections.
+    """
+    if res is None or isinstance(res, LazyCollection):
+        return 0
+    if isinstance(res, File):
+        return 1
+    return len(res)
+
+
+def _written(res):
+    """
+    Return number of files written from write summary.
+    """
+    return res['inserted'] + res['updated']
+
+
+def _deleted(res):
+    """
+    Return number of files deleted from delete summary.
+    """
+    return res['deleted']
+
+
+def _shape(query):
+    """
+    Return shape of query, with values replaced by placeholders.
+    """
+    if isinstance(query, dict):
+        return {key: _shape(query[key]) for key in query}
+    if isinstance(query, (list, tuple)) and len(query) and all(isinstance(x, dict) for x in query):
+        return [_shape(x) for x in query]
+    return '?'
+
+
+def _slow(name):
+    """
+    Decorator for logging queries that take longer than the
+    ``slow_query`` option for the session.
+    """
+    def decorator(func):
+        @wraps(func)
+        def _(query, *args, **kwargs):
+            start = time.perf_counter()
+            res = func(query, *args, **kwargs)
+            _logged(name, query, time.perf_counter() - start, _found(res))
+            return res
+        return _
+    return decorator
+
+
+def _logged(name, query, elapsed, documents):
+    """
+    Log query if it took longer than the ``slow_query`` option
+    for the session.
+    """
+    threshold = _session().slow_query
+    if threshold and elapsed > threshold:
+        logger.warning('Slow query ({:.3f}s, {} documents): {} {}'.format(
+            elapsed, documents, name, json.dumps(_shape(query), sort_keys=True)
+        ))
+    return
+
+
+def stats(reset=False):
+    """
+    Return timings for database operations run in this process, with
+    counts, total, mean, percentile (p50, p90, p99), and max latency in
+    seconds, and the number of documents involved for each operation.
+    Lazy loading of metadata for files is recorded as ``load``, and
+    commands sent to mongodb are recorded as ``command.<name>`` if the
+    ``command_monitoring`` option is set.
+
+    Args:
+        reset (bool): Whether or not to clear timings after returning them.
+
+    Examples:
+        >>> cl = coda.find({'type': 'test'})
+        >>> coda.stats()['find']
+        {'count': 1, 'total': 0.0021, 'mean': 0.0021, 'p50': 0.0021,
+         'p90': 0.0021, 'p99': 0.0021, 'max': 0.0021, 'documents': 2}
+        >>>
+        >>> # write timings to file
+        >>> coda.metrics.metrics.dump('/path/to/stats.json')
+    """
+    res = _metrics.summary()
+    if reset:
+        _metrics.reset()
+    return res
 
 
 # extensions
 # ----------
+def _clean(item):
+    """
+    Remove path and fields managed by coda from database record,
+    returning the removed fields.
+    """
+    return {key: item.pop(key) for key in ['path'] + __reserved__ if key in item}
+
+
+def _pending(fi):
+    """
+    Return boolean describing if metadata for file still needs
+    to be pulled from the database.
+    """
+    return fi._fields is not None or (not fi._synced and len(fi._metadata) == 0)
+
+
+def _load(fi, item):
+    """
+    Populate file metadata from database record, keeping any
+    metadata already set on the file.
+    """
+    fi._checksum = _clean(item).get('_checksum')
+    fi._loaded = (_session().engine, item)
+    metadata = composite(item)
+    for key in fi._metadata:
+        metadata[key] = fi._metadata[key]
+    fi._metadata = metadata
+    fi._fields = None
+    fi._synced = True
+    return
+
+
+def _changed(paths=None, records=None):
+    """
+    Update local caches after records in the database have been
+    written. Written records are stored in the disk cache, records
+    for changed paths are removed from it, and cached query
+    results are discarded. If no paths or records are specified,
+    the disk cache is cleared.
+    """
+    session = _session()
+    if session.result_cache is not None:
+        session.result_cache.clear()
+    cache = session.disk_cache
+    if cache is not None:
+        if records is None and paths is None:
+            cache.clear(counters=False)
+        if records:
+            cache.put(records)
+        if paths:
+            cache.delete(paths)
+    return
+
+
+def _lookup(paths):
+    """
+    Pull database records for file paths, consulting the local
+    disk cache (if enabled) before querying the database.
+    """
+    session = _session()
+    cache = session.disk_cache
+    res = {} if cache is None else cache.get(paths)
+    missing = [x for x in paths if x not in res]
+    if len(missing) != 0:
+        items = list(session.engine.find({'path': {'$in': missing}}))
+        if cache is not None:
+            cache.put(items)
+        for item in items:
+            res[item['path']] = item
+    return res
+
+
 def _metadata(self):
     """
     Proxy for returning metadata -- if the file exists in the database,
     then pull metadata for it if none already exists. If metadata exists
-    for the object, then return that.
+    for the object, then return that. If only a subset of fields was
+    loaded for the file, pull the remaining fields from the database.
+    Files loaded from disk as part of a collection pull metadata for
+    the whole collection at once.
     """
-    if len(self._metadata) == 0:
-        obj = find_one({'path': self.path})
-        if obj is not None:
-            self._metadata = obj._metadata
+    if _pending(self) and self._collection is not None:
+        self._collection.prefetch()
+    if _pending(self):
+        with _metrics.timer('load') as timer:
+            item = _lookup([self.path]).get(self.path)
+            if item is not None:
+                _load(self, item)
+                timer.documents = 1
+        self._fields = None
     return self._metadata
 
 
+def _prefetch(self):
+    """
+    Pull metadata for all files in the collection that haven't been
+    loaded from the database, using chunked ``$in`` queries on path.
+
+    Examples:
+        >>> # load metadata for directory in one pass
+        >>> cl = coda.Collection('/path/to/test/dir/').prefetch()
+        >>> print cl.filter(lambda x: x.group == 'test')
+        '/path/to/test/dir/one.txt'
+    """
+    session = _session()
+    pending = {}
+    for fi in self.files:
+        if _pending(fi):
+            pending.setdefault(fi.path, []).append(fi)
+    for chunk in _chunks(list(pending), session.batch_size):
+        with _metrics.timer('prefetch') as timer:
+            items = _lookup(chunk)
+            timer.documents = len(items)
+        for path, item in items.items():
+            for fi in pending[path]:
+                _load(fi, item)
+    for path in pending:
+        for fi in pending[path]:
+            fi._fields = None
+            fi._synced = True
+            fi._collection = None
+    return self
+
+
 File.metadata = property(_metadata)
+Collection.prefetch = _prefetch
 Collection.__file_base__ = File
 
 
 # searching
 # ---------
-def find(query):
+def _keys(key):
+    """
+    Normalize key specification into list of (key, direction) pairs.
+    """
+    if isinstance(key, str):
+        return [(key, 1)]
+    if isinstance(key, (list, tuple)):
+        return [(x, 1) if isinstance(x, str) else tuple(x) for x in key]
+    raise TypeError('unsupported type for key specification {}'.format(type(key)))
+
+
+def _projection(fields):
+    """
+    Return projection for querying specified metadata fields.
+    """
+    if fields is None:
+        return None
+    projection = {key: True for key in fields}
+    projection['path'] = True
+    return projection
+
+
+def _file(item, fields=None):
+    """
+    Build File object from database record. If the record only
+    contains a subset of fields, the File object will pull the
+    remaining fields from the database when they are accessed.
+    """
+    reserved = _clean(item)
+    path = reserved.get('path')
+    if path is None:
+        raise AssertionError('Path information for file not available -- '
+                             'your database is in a weird state. Please '
+                             'ensure that each record in the database has '
+                             'an associated path.')
+    fi = File(path=path, metadata=item)
+    fi._checksum = reserved.get('_checksum')
+    fi._loaded = (_session().engine, item)
+    if fields is not None:
+        fi._fields = set(fields) | set(item.keys())
+    else:
+        fi._synced = True
+    return fi
+
+
+@_metrics.timed('find', _found)
+@_slow('find')
+def find(query, fields=None, sort=None, limit=0, skip=0, batch_size=0, lazy=False):
     """
     Search database for files with specified metadata.
 
     Args:
         query (dict): Dictionary with query parameters.
+        fields (list): Metadata fields to pull for each file. Other
+            fields are pulled from the database if they are accessed.
+        sort (str, list): Metadata key, or list of keys (or (key, direction)
+            pairs) to sort results by.
+        limit (int): Maximum number of results to return.
+        skip (int): Number of results to skip before returning results.
+        batch_size (int): Number of records to pull from the database
+            per network round trip.
+        lazy (bool): Whether or not to return a LazyCollection that
+            pulls files from the database cursor as they are needed,
+            instead of loading all results up front.
 
     Returns:
         Collection: Collection object with results.
@@ -154,28 +606,59 @@ def find(query):
         >>> # using the filter() method on collections instead
         >>> print coda.find({'type': 'test'}).filter(lambda x: x.count < 30)
         '/my/testing/file/two.txt'
+        >>>
+        >>> # stream results for a broad query
+        >>> for fi in coda.find({'type': 'test'}, lazy=True):
+        >>>     print fi
+        '/my/testing/file/one.txt'
+        '/my/testing/file/two.txt'
+        >>>
+        >>> # page through results, only pulling paths
+        >>> print coda.find({'type': 'test'}, fields=[], sort='path', skip=1, limit=1)
+        '/my/testing/file/two.txt'
     """
-    files = []
-    for item in session.db.files.find(query):
-        path = item.get('path')
-        if path is None:
-            raise AssertionError('Path information for file not available -- '
-                                 'your database is in a weird state. Please '
-                                 'ensure that each record in the database has '
-                                 'an associated path.')
-        item.pop('path', None)
-        files.append(File(path=path, metadata=item))
+    session = _session()
+    sort = None if sort is None else _keys(sort)
+    cache, key, items = None if lazy else session.result_cache, None, None
+    if cache is not None:
+        key = cache.key('find', query, None if fields is None else sorted(fields), sort, limit, skip)
+        items = cache.get(key)
+    if items is None:
+        items = session.engine.find(
+            query, projection=_projection(fields), sort=sort,
+            limit=limit, skip=skip, batch_size=batch_size
+        )
+        if cache is not None:
+            items = list(items)
+            cache.put(key, items)
+    files = (_file(item, fields=fields) for item in items)
+    if lazy:
+        first = next(files, None)
+        if first is None:
+            return None
+        return LazyCollection(
+            files=itertools.chain([first], files),
+            count=lambda: session.engine.count(query, limit=limit, skip=skip)
+        )
+    files = list(files)
     if len(files) == 0:
         return None
     return Collection(files=files)
 
 
-def find_one(query):
+@_metrics.timed('find_one', _found)
+@_slow('find_one')
+def find_one(query, fields=None, sort=None, skip=0):
     """
     Search database for one file with specified metadata.
 
     Args:
         query (dict): Dictionary with query parameters.
+        fields (list): Metadata fields to pull for the file. Other
+            fields are pulled from the database if they are accessed.
+        sort (str, list): Metadata key, or list of keys (or (key, direction)
+            pairs) to sort results by before selecting a file.
+        skip (int): Number of results to skip before selecting a file.
 
     Returns:
         File: File object with results.
@@ -188,28 +671,325 @@ def find_one(query):
         >>> # assuming 'count' represents line count in the file
         >>> print coda.find({'type': 'test', 'count': {'$lt': 30}})
         '/my/testing/file/two.txt'
+        >>>
+        >>> # file with the most lines, only pulling the count
+        >>> fi = coda.find_one({'type': 'test'}, fields=['count'], sort=[('count', -1)])
+        >>> print fi.count
+        48
     """
-    item = session.db.files.find_one(query)
+    session = _session()
+    sort = None if sort is None else _keys(sort)
+    cache, key, items = session.result_cache, None, None
+    if cache is not None:
+        key = cache.key('find_one', query, None if fields is None else sorted(fields), sort, skip)
+        items = cache.get(key)
+    if items is None:
+        if fields is None and sort is None and skip == 0 and \
+           list(query.keys()) == ['path'] and isinstance(query['path'], str):
+            item = _lookup([query['path']]).get(query['path'])
+        else:
+            item = session.engine.find_one(query, projection=_projection(fields), sort=sort, skip=skip)
+        items = [] if item is None else [item]
+        if cache is not None:
+            cache.put(key, items)
+    item = items[0] if len(items) != 0 else None
     if item is None:
         return None
-    path = item.get('path')
-    if path is None:
-        raise AssertionError('Path information for file not available -- '
-                             'your database is in a weird state. Please '
-                             'ensure that each record in the database has '
-                             'an associated path.')
-    item.pop('path', None)
-    return File(path=path, metadata=item)
+    return _file(item, fields=fields)
+
+
+def iterate(query, fields=None, sort=None, limit=0, skip=0, batch_size=0):
+    """
+    Iterate over files with specified metadata, pulling records from
+    the database cursor as they are needed. Unlike ``find``, results
+    are never cached or held in memory, which makes this suited for
+    streaming large result sets.
+
+    Args:
+        query (dict): Dictionary with query parameters.
+        fields (list): Metadata fields to pull for each file. Other
+            fields are pulled from the database if they are accessed.
+        sort (str, list): Metadata key, or list of keys (or (key, direction)
+            pairs) to sort results by.
+        limit (int): Maximum number of results to return.
+        skip (int): Number of results to skip before returning results.
+        batch_size (int): Number of records to pull from the database
+            per network round trip.
+
+    Examples:
+        >>> for fi in coda.iterate({'type': 'test'}, fields=[]):
+        >>>     print fi
+        '/my/testing/file/one.txt'
+        '/my/testing/file/two.txt'
+    """
+    session = _session()
+    sort = None if sort is None else _keys(sort)
+    # only time spent waiting on the database cursor is recorded
+    start = time.perf_counter()
+    items = iter(session.engine.find(
+        query, projection=_projection(fields), sort=sort,
+        limit=limit, skip=skip, batch_size=batch_size
+    ))
+    elapsed, documents = time.perf_counter() - start, 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            documents += 1
+            yield _file(item, fields=fields)
+        _logged('iterate', query, elapsed, documents)
+    finally:
+        _metrics.record('iterate', elapsed, documents)
+
+
+def _directory(path, recursive=False):
+    """
+    Return query for records of files in directory. Recursive queries
+    match on an anchored path prefix, and non-recursive queries match
+    on the indexed parent directory of files.
+    """
+    if recursive:
+        return {'path': {'$regex': '^' + re.escape(os.path.join(path, ''))}}
+    return {'_parent': path}
+
+
+def listdir(path, recursive=False, fields=None, limit=0):
+    """
+    Iterate over files in directory that have records in the database.
+
+    Args:
+        path (str): Directory to list files for.
+        recursive (bool): Whether or not to include files in
+            subdirectories of the directory.
+        fields (list): Metadata fields to pull for each file.
+        limit (int): Maximum number of results to return.
+
+    Examples:
+        >>> for fi in coda.listdir('/my/testing/file'):
+        >>>     print fi
+        '/my/testing/file/one.txt'
+        '/my/testing/file/two.txt'
+    """
+    return iterate(_directory(os.path.realpath(path), recursive=recursive), fields=fields, limit=limit)
+
+
+# indexing
+# --------
+def ensure_index(key, unique=False, sparse=False):
+    """
+    Create index on metadata key(s) in the database, if it
+    doesn't already exist.
+
+    Args:
+        key (str, list): Metadata key to index, or list of keys
+            (or (key, direction) pairs) for a compound index.
+        unique (bool): Whether or not values for the index must be unique.
+        sparse (bool): Whether or not to skip records without the key.
+
+    Returns:
+        str: Name of the index.
+
+    Examples:
+        >>> # index files by group for faster querying
+        >>> coda.ensure_index('group')
+        'group_1'
+        >>>
+        >>> # compound index on group and cohort
+        >>> coda.ensure_index(['group', 'cohort'])
+        'group_1_cohort_1'
+    """
+    session = _session()
+    return session.engine.create_index(_keys(key), unique=unique, sparse=sparse)
+
+
+def list_indexes():
+    """
+    List indexes available for the database.
+
+    Returns:
+        list: List of dictionaries with index name, keys, and
+            whether or not the index is unique.
+
+    Examples:
+        >>> coda.list_indexes()
+        [{'name': '_id_', 'keys': [('_id', 1)], 'unique': False},
+         {'name': 'path_1', 'keys': [('path', 1)], 'unique': True}]
+    """
+    session = _session()
+    return session.engine.list_indexes()
+
+
+def drop_index(key):
+    """
+    Drop index on metadata key(s) in the database.
+
+    Args:
+        key (str, list): Metadata key (or keys) for the index to drop.
+
+    Examples:
+        >>> coda.drop_index('group')
+    """
+    session = _session()
+    keys = _keys(key)
+    if keys == [('path', 1)] or keys in backends.__indexes__:
+        raise AssertionError('The index on `{}` is required by coda and cannot be dropped.'.format(
+            '`, `'.join(x[0] for x in keys)
+        ))
+    session.engine.drop_index(keys)
+    return
+
+
+def explain(query, sort=None):
+    """
+    Explain how the database would run query, reporting the plan,
+    the index used (if any), and the number of documents examined
+    versus returned.
+
+    Args:
+        query (dict): Query to explain.
+        sort (str, list): Metadata key (or list of keys) to sort
+            results by.
+
+    Returns:
+        dict: Dictionary with ``plan``, ``index``, ``examined``, and
+            ``returned`` keys, the shape of the ``query`` (with values
+            replaced by placeholders), and backend-specific ``details``.
+
+    Examples:
+        >>> coda.ensure_index('group')
+        >>> res = coda.explain({'group': 'train'})
+        >>> print res['index'], res['examined'], res['returned']
+        group_1 12 12
+    """
+    session = _session()
+    sort = None if sort is None else _keys(sort)
+    res = session.engine.explain(query, sort=sort)
+    res['query'] = _shape(query)
+    return res
 
 
 # database update methods
 # -----------------------
-def add(obj):
+def _chunks(iterable, size):
+    """
+    Split iterable into lists of at most ``size`` items.
+    """
+    iterable = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterable, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def _backfill(engine, batch_size):
+    """
+    Store parent directories for records written before they were
+    stored, so that directory listings can query them directly.
+    Records are found with an indexed lookup, so this is cheap
+    once every record has a parent directory.
+    """
+    paths = [x['path'] for x in engine.find({'_parent': None}, projection={'path': True})]
+    for chunk in _chunks(paths, batch_size):
+        engine.update([(x, {'$set': {'_parent': os.path.dirname(x)}}) for x in chunk], upsert=False)
+    return
+
+
+def _stat(stat):
+    """
+    Return summary of stat result stored with database records,
+    used for detecting changes to files.
+    """
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'inode': stat.st_ino
+    }
+
+
+def _record(obj):
+    """
+    Return database record for File object.
+    """
+    if not isinstance(obj, File):
+        raise TypeError('unsupported type for add {}'.format(type(obj)))
+    dat = obj.metadata.json()
+    dat.pop('_id', None)
+    dat['path'] = obj.path
+    dat['_parent'] = os.path.dirname(obj.path)
+    try:
+        obj._stat = None
+        dat['_stat'] = _stat(obj.stat)
+    except OSError:
+        pass
+    if obj._checksum is not None:
+        dat['_checksum'] = obj._checksum
+    return dat
+
+
+def _snapshot(fi):
+    """
+    Return metadata for file as it was last loaded from (or written to)
+    the database for the current session, or None if it hasn't been.
+    """
+    if fi._loaded is None or fi._loaded[0] is not _session().engine:
+        return None
+    return fi._loaded[1]
+
+
+def _changes(record, loaded):
+    """
+    Return update document for writing record, with metadata keys
+    that have changed since the record was loaded from the database.
+    If the record wasn't loaded, all metadata keys are set.
+    """
+    update = {'$set': {}}
+    for key, value in record.items():
+        if key == 'path':
+            continue
+        if loaded is None or key in __reserved__ or key not in loaded or loaded[key] != value:
+            update['$set'][key] = value
+    if loaded is not None:
+        unset = {key: True for key in loaded if key not in record and key != '_id'}
+        if len(unset):
+            update['$unset'] = unset
+    return update
+
+
+def _writable(key):
+    """
+    Check that metadata key can be written by users.
+    """
+    if key in ['path', '_id'] or key.split('.')[0] in __reserved__:
+        raise AssertionError('Metadata key `{}` is managed by coda and cannot be set.'.format(key))
+    return
+
+
+@_metrics.timed('add', _written)
+def add(obj, batch_size=None, ordered=None):
     """
-    Add file object or collection object to database.
+    Add file object or collection object to database. Collections
+    are sent to the database as chunked bulk upserts keyed on file path.
+    Only metadata keys that have changed since files were loaded from
+    the database are written, so concurrent updates to other keys of
+    the same files are preserved. Keys removed from loaded files are
+    removed from their records.
 
     Args:
         obj (File, Collection): File or collection of files to add.
+        batch_size (int): Number of files to send per bulk write. Defaults
+            to the ``batch_size`` option for the session.
+        ordered (bool): Whether or not to apply writes serially, stopping
+            at the first error. Defaults to the ``ordered`` option for the
+            session.
+
+    Returns:
+        dict: Summary with counts of inserted and updated files.
 
     Examples:
         >>> # instantiate File object and add metadata
@@ -218,50 +998,528 @@ def add(obj):
         >>> 
         >>> # add file to database
         >>> coda.add(fi)
+        {'inserted': 1, 'updated': 0}
         >>>
         >>> # instantiate directory as Collection with common metadata
         >>> cl = coda.Collection('/path/to/test/dir/')
         >>> cl.type = 'test'
         >>> coda.add(cl)
+        {'inserted': 12, 'updated': 0}
     """
-    global session
-    if isinstance(obj, (Collection, list, tuple)):
-        return list(map(add, obj))
-    if not isinstance(obj, File):
+    session = _session()
+    if isinstance(obj, File):
+        obj = [obj]
+    if not isinstance(obj, (Collection, list, tuple)):
         raise TypeError('unsupported type for add {}'.format(type(obj)))
-    ret = session.db.files.find_one({'path': obj.path})
-    dat = obj.metadata.json()
-    dat['path'] = obj.path
-    if ret is None:
-        return session.db.files.insert_one(dat)
-    else:
-        return session.db.files.update({'path': dat['path']}, dat)
+    batch_size = session.batch_size if batch_size is None else batch_size
+    ordered = session.ordered if ordered is None else ordered
+    summary = {'inserted': 0, 'updated': 0}
+    for chunk in _chunks(obj, batch_size):
+        # pull records for files that haven't been loaded in one pass
+        Collection(files=[x for x in chunk if isinstance(x, File)]).prefetch()
+        updates, records, paths = [], [], []
+        for item in chunk:
+            record = _record(item)
+            loaded = _snapshot(item)
+            updates.append((item.path, _changes(record, loaded)))
+            # records are only known in full for files loaded from the database
+            if loaded is not None:
+                records.append(record)
+            else:
+                paths.append(item.path)
+            item._loaded = (session.engine, {
+                key: value for key, value in record.items()
+                if key != 'path' and key not in __reserved__
+            })
+        res = session.engine.update(updates, ordered=ordered)
+        summary['inserted'] += res['inserted']
+        summary['updated'] += res['updated']
+        _changed(paths=paths, records=records)
+    return summary
+
+
+def _apply(fi, update):
+    """
+    Apply update document to local metadata for file. Files that
+    haven't been loaded from the database pull the updated record
+    when their metadata are accessed.
+    """
+    if fi._fields is not None:
+        fi._metadata = composite({})
+        fi._fields = set()
+    elif not _pending(fi):
+        fi._metadata = composite(backends.apply_update(fi._metadata.json(), update))
+    loaded = _snapshot(fi)
+    if loaded is not None:
+        fi._loaded = (fi._loaded[0], backends.apply_update(copy.deepcopy(loaded), update))
+    return
+
+
+@_metrics.timed('update', _written)
+def update(target, set=None, unset=None, inc=None, batch_size=None, ordered=None):
+    """
+    Update metadata keys for files in the database, without reading
+    or replacing their records. Updates for files and collections are
+    applied to the local File objects as well, and records are created
+    for files that aren't in the database yet.
+
+    Args:
+        target (File, Collection, dict): File, collection of files, or
+            query for records to update.
+        set (dict): Metadata keys and values to set. Nested keys can be
+            specified with dot notation (i.e. ``'stats.count'``).
+        unset (list): Metadata keys to remove.
+        inc (dict): Numeric metadata keys and amounts to increment by.
+        batch_size (int): Number of files to send per bulk write. Defaults
+            to the ``batch_size`` option for the session.
+        ordered (bool): Whether or not to apply writes serially, stopping
+            at the first error. Defaults to the ``ordered`` option for the
+            session.
+
+    Returns:
+        dict: Summary with counts of inserted and updated files.
+
+    Examples:
+        >>> fi = coda.File('/path/to/test/file.txt')
+        >>> coda.update(fi, set={'type': 'test'}, inc={'views': 1})
+        {'inserted': 0, 'updated': 1}
+        >>>
+        >>> # update records matching query
+        >>> coda.update({'type': 'test'}, unset=['stale'])
+        {'inserted': 0, 'updated': 12}
+    """
+    update = _operators(set, unset, inc)
+
+    # records matching query
+    if isinstance(target, dict):
+        res = _session().engine.update_many(target, update)
+        _changed()
+        return {'inserted': 0, 'updated': res}
+
+    # file objects
+    target = _files(target)
+    res = _update([fi.path for fi in target], update, batch_size=batch_size, ordered=ordered)
+    for fi in target:
+        _apply(fi, update)
+    if isinstance(target, Collection):
+        target.invalidate()
+    return res
+
+
+def _operators(set=None, unset=None, inc=None):
+    """
+    Build update document from keys to set, unset, and increment,
+    checking that keys can be written.
+    """
+    update = {}
+    if set:
+        update['$set'] = dict(set)
+    if unset:
+        update['$unset'] = {key: True for key in unset}
+    if inc:
+        update['$inc'] = dict(inc)
+    if len(update) == 0:
+        raise AssertionError('No updates specified! Use set, unset, or inc to specify updates.')
+    for fields in update.values():
+        for key in fields:
+            _writable(key)
+    return update
+
+
+def _files(target):
+    """
+    Normalize file or collection of files to update.
+    """
+    if isinstance(target, File):
+        target = [target]
+    if not isinstance(target, (Collection, list, tuple)):
+        raise TypeError('unsupported type for update {}'.format(type(target)))
+    return target
+
+
+def _update(paths, update, batch_size=None, ordered=None):
+    """
+    Apply update operators to records for paths, as chunked bulk
+    upserts keyed on file path. Existing records aren't pulled from
+    the database before they are updated, and records are created
+    for paths that aren't in the database yet.
+    """
+    session = _session()
+    batch_size = session.batch_size if batch_size is None else batch_size
+    ordered = session.ordered if ordered is None else ordered
+    summary = {'inserted': 0, 'updated': 0}
+    for chunk in _chunks(paths, batch_size):
+        updates = []
+        for path in chunk:
+            item = dict(update)
+            item['$set'] = dict(update.get('$set', {}), _parent=os.path.dirname(path))
+            updates.append((path, item))
+        res = session.engine.update(updates, ordered=ordered)
+        summary['inserted'] += res['inserted']
+        summary['updated'] += res['updated']
+        _changed(paths=chunk)
+    return summary
+
+
+@_metrics.timed('tag', _written)
+def tag(paths, metadata, batch_size=None, ordered=None):
+    """
+    Set metadata for files, without reading or replacing their existing
+    records. Paths are streamed to the database in chunked bulk upserts,
+    so large lists of files can be tagged without loading them first.
+
+    Args:
+        paths (iterable): Full paths for files to tag.
+        metadata (dict): Metadata keys and values to set for files.
+        batch_size (int): Number of files to send per bulk write. Defaults
+            to the ``batch_size`` option for the session.
+        ordered (bool): Whether or not to apply writes serially, stopping
+            at the first error. Defaults to the ``ordered`` option for the
+            session.
+
+    Returns:
+        dict: Summary with counts of inserted and updated files.
+
+    Examples:
+        >>> coda.tag(['/path/to/test/file.txt'], {'type': 'test'})
+        {'inserted': 0, 'updated': 1}
+    """
+    for key in metadata:
+        _writable(key)
+    return _update(paths, {'$set': dict(metadata)}, batch_size=batch_size, ordered=ordered)
 
 
-def delete(obj):
+@_metrics.timed('delete', _deleted)
+def delete(obj, batch_size=None):
     """
-    Delete file or collection of files from database.
+    Delete file or collection of files from database. Collections
+    are removed with chunked ``$in`` queries on file path.
 
     Args:
         obj (File, Collection): File or collection of files to delete.
+        batch_size (int): Number of paths to send per delete query. Defaults
+            to the ``batch_size`` option for the session.
+
+    Returns:
+        dict: Summary with count of deleted files.
 
     Examples:
         >>> # instantiate File object and delete
         >>> fi = coda.File('/path/to/test/file.txt')
         >>> coda.delete(fi)
+        {'deleted': 1}
         >>>
         >>> # instantiate directory and delete
         >>> cl = coda.Collection('/path/to/test/dir/')
         >>> coda.delete(cl)
+        {'deleted': 12}
         >>>
         >>> # query by metadata and delete entries
         >>> cl = coda.find({'type': 'testing'})
         >>> coda.delete(cl)
+        {'deleted': 3}
     """
-    global session
-    if isinstance(obj, (Collection, list, tuple)):
-        return list(map(delete, obj.files))
-    if not isinstance(obj, File):
+    session = _session()
+    if isinstance(obj, File):
+        obj = [obj]
+    if not isinstance(obj, (Collection, list, tuple)):
         raise TypeError('unsupported type for delete {}'.format(type(obj)))
-    return session.db.files.delete_many({'path': obj.path})
+    batch_size = session.batch_size if batch_size is None else batch_size
+    summary = {'deleted': 0}
+    for chunk in _chunks(obj, batch_size):
+        for item in chunk:
+            if not isinstance(item, File):
+                raise TypeError('unsupported type for delete {}'.format(type(item)))
+            item._loaded = None
+        paths = [x.path for x in chunk]
+        summary['deleted'] += session.engine.delete({'path': {'$in': paths}})
+        _changed(paths=paths)
+    return summary
+
+
+@_metrics.timed('delete_query', _deleted)
+def delete_query(query):
+    """
+    Delete files matching metadata query from database, without
+    pulling matching records from the database first.
+
+    Args:
+        query (dict): Dictionary with query parameters.
+
+    Returns:
+        dict: Summary with count of deleted files.
+
+    Examples:
+        >>> # delete all testing files
+        >>> coda.delete_query({'type': 'testing'})
+        {'deleted': 3}
+    """
+    session = _session()
+    if not isinstance(query, dict):
+        raise TypeError('unsupported type for delete_query {}'.format(type(query)))
+    res = session.engine.delete(query)
+    _changed()
+    return {'deleted': res}
+
+
+# syncing
+# -------
+@_metrics.timed('sync', lambda res: res['inserted'] + res['updated'] + res['deleted'])
+def sync(path, delete=False, checksum=False, include=None, exclude=('.*', '_*'), depth=None, workers=None, batch_size=None):
+    """
+    Synchronize database with files in directory. Records for files
+    under the directory (and for files outside of it that are reached
+    through symlinks) are pulled from the database in bulk and compared
+    against the size, modification time, and inode of files on disk, and
+    only new or modified files are written to the database. Metadata for
+    modified files is left untouched.
+
+    Args:
+        path (str): Directory to synchronize.
+        delete (bool): Whether or not to delete records for files under
+            the directory that no longer exist on disk.
+        checksum (bool): Whether or not to compute checksums for new or
+            modified files (see checksum()).
+        include (list): Glob patterns for files to include.
+        exclude (list): Glob patterns for files and directories to skip.
+        depth (int): Maximum depth of subdirectories to crawl.
+        workers (int): Number of threads to use for crawling directory.
+        batch_size (int): Number of files to send per bulk write. Defaults
+            to the ``batch_size`` option for the session.
+
+    Returns:
+        dict: Summary with counts of inserted, updated, unchanged, and
+            deleted (and hashed, if checksums are computed) files, and
+            elapsed time in seconds.
+
+    Examples:
+        >>> # track new and modified files in directory
+        >>> coda.sync('/path/to/test/dir/')
+        {'inserted': 2, 'updated': 1, 'unchanged': 10, 'deleted': 0, 'elapsed': 0.21}
+        >>>
+        >>> # also remove records for files that have been deleted
+        >>> coda.sync('/path/to/test/dir/', delete=True)
+        {'inserted': 0, 'updated': 0, 'unchanged': 12, 'deleted': 1, 'elapsed': 0.18}
+    """
+    session = _session()
+    start = time.time()
+    root = os.path.realpath(path)
+    if not os.path.isdir(root):
+        raise AssertionError('Specified path is not a directory!')
+    batch_size = session.batch_size if batch_size is None else batch_size
+
+    # pull current state from disk and database
+    disk = {}
+    for item, stat in crawl(root, include=include, exclude=exclude, depth=depth, workers=workers, stat=True):
+        disk[item] = _stat(stat)
+    db, checksums = _tracked(root, disk, batch_size)
+
+    # write new and modified files
+    summary, changed = _diff(disk, db)
+    _write_stats(disk, changed, batch_size)
+
+    # hash new and modified files
+    if checksum:
+        res = _checksums(disk, checksums, workers=workers, batch_size=batch_size)
+        summary['hashed'] = res['hashed']
+
+    # remove vanished files
+    if delete:
+        summary['deleted'] = _delete_vanished(disk, db, batch_size)
+
+    summary['elapsed'] = time.time() - start
+    return summary
+
+
+def _tracked(root, disk, batch_size):
+    """
+    Return stored stat summaries and checksums for records under
+    directory, and for crawled files outside of the directory (i.e.
+    files reached through symlinks).
+    """
+    session = _session()
+    prefix = os.path.join(root, '')
+    queries = [{'path': {'$regex': '^' + re.escape(prefix)}}]
+    for chunk in _chunks([x for x in disk if not x.startswith(prefix)], batch_size):
+        queries.append({'path': {'$in': chunk}})
+    db, checksums = {}, {}
+    projection = {'path': True, '_stat': True, '_checksum': True}
+    for query in queries:
+        for item in session.engine.find(query, projection=projection):
+            db[item['path']] = item.get('_stat')
+            if '_checksum' in item:
+                checksums[item['path']] = item['_checksum']
+    return db, checksums
+
+
+def _diff(disk, db):
+    """
+    Compare stat summaries for files on disk against records in the
+    database, returning summary counts and paths that need writing.
+    """
+    summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+    changed = []
+    for item in disk:
+        if item not in db:
+            summary['inserted'] += 1
+        elif db[item] != disk[item]:
+            summary['updated'] += 1
+        else:
+            summary['unchanged'] += 1
+            continue
+        changed.append(item)
+    return summary, changed
 
+
+def _write_stats(disk, changed, batch_size):
+    """
+    Write stat summaries (and parent directories) for changed files.
+    """
+    session = _session()
+    for chunk in _chunks(changed, batch_size):
+        session.engine.update([
+            (x, {'$set': {'_stat': disk[x], '_parent': os.path.dirname(x)}}) for x in chunk
+        ], ordered=session.ordered)
+        _changed(paths=chunk)
+    return
+
+
+def _delete_vanished(disk, db, batch_size):
+    """
+    Delete records for files that no longer exist on disk, returning
+    the number of deleted records.
+    """
+    session = _session()
+    vanished = [x for x in db if x not in disk and not os.path.exists(x)]
+    deleted = 0
+    for chunk in _chunks(vanished, batch_size):
+        deleted += session.engine.delete({'path': {'$in': chunk}})
+        _changed(paths=chunk)
+    return deleted
+
+
+# checksums
+# ---------
+def _current(checksum, stat, algorithm):
+    """
+    Check if stored checksum is still valid for file.
+    """
+    return checksum is not None and \
+        checksum.get('algorithm') == algorithm and \
+        checksum.get('size') == stat['size'] and \
+        checksum.get('mtime') == stat['mtime']
+
+
+def _checksums(stats, checksums=None, algorithm=None, workers=None, processes=False, batch_size=None):
+    """
+    Compute and store checksums for files that don't have a valid
+    checksum in the database.
+
+    Args:
+        stats (dict): Mapping of file paths to stat summaries.
+        checksums (dict): Mapping of file paths to stored checksums. If
+            not specified, stored checksums are pulled from the database.
+
+    Returns:
+        dict: Summary with counts of hashed and skipped files, and
+            mapping of file paths to checksums computed for files.
+    """
+    session = _session()
+    algorithm = session.checksum if algorithm is None else algorithm
+    batch_size = session.batch_size if batch_size is None else batch_size
+    if checksums is None:
+        checksums = {}
+        for chunk in _chunks(list(stats), batch_size):
+            query = {'path': {'$in': chunk}, '_checksum': {'$exists': True}}
+            for item in session.engine.find(query, projection={'path': True, '_checksum': True}):
+                checksums[item['path']] = item['_checksum']
+    todo = [x for x in stats if not _current(checksums.get(x), stats[x], algorithm)]
+
+    # hash files and write results
+    res = {}
+    if processes:
+        from concurrent.futures import ProcessPoolExecutor as executor
+    else:
+        executor = ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        digests = pool.map(partial(digest, algorithm=algorithm), todo)
+        for chunk in _chunks(zip(todo, digests), batch_size):
+            updates = []
+            for path, value in chunk:
+                res[path] = {
+                    'digest': value,
+                    'algorithm': algorithm,
+                    'size': stats[path]['size'],
+                    'mtime': stats[path]['mtime']
+                }
+                updates.append((path, {'$set': {'_checksum': res[path], '_parent': os.path.dirname(path)}}))
+            session.engine.update(updates, ordered=session.ordered)
+            _changed(paths=[path for path, value in chunk])
+    return {'hashed': len(todo), 'skipped': len(stats) - len(todo), 'checksums': res}
+
+
+@_metrics.timed('checksum', lambda res: res['hashed'])
+def checksum(obj, algorithm=None, workers=None, processes=False, batch_size=None):
+    """
+    Compute checksums for contents of file or collection of files, and
+    store them in the database. Files are hashed concurrently, and files
+    with a stored checksum matching their current size and modification
+    time are not hashed again.
+
+    Args:
+        obj (File, Collection): File or collection of files to hash.
+        algorithm (str): Name of hashlib algorithm to use. Defaults to
+            the ``checksum`` option for the session.
+        workers (int): Number of workers to use for hashing files.
+        processes (bool): Whether or not to hash files in a process pool,
+            instead of a thread pool.
+        batch_size (int): Number of files to send per bulk write. Defaults
+            to the ``batch_size`` option for the session.
+
+    Returns:
+        dict: Summary with counts of hashed and skipped files.
+
+    Examples:
+        >>> cl = coda.Collection('/path/to/test/dir/')
+        >>> coda.checksum(cl)
+        {'hashed': 12, 'skipped': 0}
+        >>> coda.checksum(cl)
+        {'hashed': 0, 'skipped': 12}
+    """
+    if isinstance(obj, File):
+        obj = [obj]
+    if not isinstance(obj, (Collection, list, tuple)):
+        raise TypeError('unsupported type for checksum {}'.format(type(obj)))
+    stats = {fi.path: _stat(fi.stat) for fi in obj}
+    res = _checksums(stats, algorithm=algorithm, workers=workers, processes=processes, batch_size=batch_size)
+    for fi in obj:
+        if fi.path in res['checksums']:
+            fi._checksum = res['checksums'][fi.path]
+    return {'hashed': res['hashed'], 'skipped': res['skipped']}
+
+
+@_metrics.timed('duplicates', len)
+def duplicates(query=None):
+    """
+    Find groups of files with identical contents, using checksums
+    stored in the database. Files are grouped by the database server.
+
+    Args:
+        query (dict): Dictionary with query parameters for files to
+            search for duplicates in.
+
+    Returns:
+        list: List of dictionaries with checksum digest, algorithm,
+            file size, and paths for each group of duplicate files,
+            sorted by number of duplicates.
+
+    Examples:
+        >>> coda.duplicates({'group': 'train'})
+        [{'digest': '7d865e959b...', 'algorithm': 'sha256', 'size': 1024,
+          'paths': ['/data/one/train.csv', '/data/two/train.csv']}]
+    """
+    session = _session()
+    res = session.engine.duplicates(query)
+    for item in res:
+        item['paths'] = sorted(item['paths'])
+    return res
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# Timing instrumentation for database operations
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import json
+import math
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict, deque
+
+
+# metrics
+# -------
+class Metrics(object):
+    """
+    Thread-safe registry of timings for named operations. Counts,
+    total latency, and document counts are tracked for every call,
+    and latency percentiles are computed from the most recent calls
+    for each operation.
+
+    Args:
+        samples (int): Number of recent latencies to keep per operation
+            for computing percentiles.
+
+    Examples:
+        >>> metrics = Metrics()
+        >>> with metrics.timer('find') as timer:
+        >>>     timer.documents = 10
+        >>> metrics.summary()['find']['documents']
+        10
+    """
+
+    def __init__(self, samples=10000):
+        self.samples = samples
+        self.enabled = True
+        self._operations = OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    def record(self, name, elapsed, documents=0):
+        """
+        Record call for operation.
+
+        Args:
+            name (str): Name of operation.
+            elapsed (float): Number of seconds the call took.
+            documents (int): Number of documents read or written by the call.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if name not in self._operations:
+                self._operations[name] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'documents': 0,
+                    'latencies': deque(maxlen=self.samples)
+                }
+            item = self._operations[name]
+            item['count'] += 1
+            item['total'] += elapsed
+            item['max'] = max(item['max'], elapsed)
+            item['documents'] += documents
+            item['latencies'].append(elapsed)
+        return
+
+    def timer(self, name):
+        """
+        Return context manager for timing operation. Set the
+        ``documents`` attribute on the timer to record the number
+        of documents involved in the operation.
+        """
+        return Timer(self, name)
+
+    def timed(self, name, documents=None):
+        """
+        Decorator for timing calls to function as operation.
+
+        Args:
+            name (str): Name of operation.
+            documents (callable): Function returning number of documents
+                involved in the operation, from the result of the call.
+        """
+        def decorator(func):
+            @wraps(func)
+            def _(*args, **kwargs):
+                with self.timer(name) as timer:
+                    res = func(*args, **kwargs)
+                    if documents is not None:
+                        timer.documents = documents(res)
+                return res
+            return _
+        return decorator
+
+    def summary(self):
+        """
+        Return summary of timings for each operation, in seconds.
+        """
+        res = {}
+        with self._lock:
+            items = [(name, dict(item), sorted(item['latencies'])) for name, item in self._operations.items()]
+        for name, item, latencies in items:
+            res[name] = {
+                'count': item['count'],
+                'total': item['total'],
+                'mean': item['total'] / item['count'],
+                'p50': _percentile(latencies, 50),
+                'p90': _percentile(latencies, 90),
+                'p99': _percentile(latencies, 99),
+                'max': item['max'],
+                'documents': item['documents']
+            }
+        return res
+
+    def reset(self):
+        """
+        Remove all recorded timings.
+        """
+        with self._lock:
+            self._operations.clear()
+        return
+
+    def dump(self, path):
+        """
+        Write summary of timings to JSON file.
+        """
+        with open(path, 'w') as fh:
+            json.dump(self.summary(), fh, indent=2)
+        return
+
+    def table(self):
+        """
+        Return summary of timings formatted as table, with
+        latencies in milliseconds.
+        """
+        lines = ['{:<24} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9} {:>10}'.format(
+            'operation', 'count', 'total', 'mean', 'p50', 'p90', 'p99', 'documents'
+        )]
+        for name, item in self.summary().items():
+            lines.append('{:<24} {:>8} {:>10.2f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>10}'.format(
+                name, item['count'], 1e3 * item['total'], 1e3 * item['mean'],
+                1e3 * item['p50'], 1e3 * item['p90'], 1e3 * item['p99'], item['documents']
+            ))
+        return '\n'.join(lines)
+
+
+class Timer(object):
+    """
+    Context manager for timing operation, recording the
+    elapsed time on exit.
+    """
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.documents = 0
+        self.start = None
+        return
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.record(self.name, time.perf_counter() - self.start, self.documents)
+        return False
+
+
+def _percentile(values, percent):
+    """
+    Return percentile for sorted list of values, using the
+    nearest-rank method.
+    """
+    if len(values) == 0:
+        return 0.0
+    idx = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(idx, 0), len(values) - 1)]
+
+
+# registry
+# --------
+metrics = Metrics()
@@ -9,7 +9,143 @@
 # imports
 # -------
 import os
-from gems import composite, filetree, DocRequire, keywords
+import glob
+import hashlib
+import fnmatch
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from gems import composite, DocRequire, keywords
+
+
+# crawling
+# --------
+def _match(name, relpath, patterns):
+    """
+    Check if file matches any of the specified glob patterns. Patterns
+    containing a path separator are matched against the path relative
+    to the crawl root, and other patterns are matched against the name.
+    """
+    for pattern in patterns:
+        if fnmatch.fnmatch(relpath if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def _scan(root, directory, level, include, exclude, stat):
+    """
+    Scan single directory, returning file paths (or paths and stat
+    results) and subdirectories for further crawling. Subdirectories
+    are returned with the device and inode of the real directory, so
+    that directories reached through symlinks are only crawled once.
+    Dangling symlinks and entries that can't be stat'ed (i.e. files
+    removed during the scan) are skipped.
+    """
+    files, dirs = [], []
+    prefix = os.path.relpath(directory, root)
+    for entry in os.scandir(directory):
+        relpath = entry.name if prefix == '.' else os.path.join(prefix, entry.name)
+        if _match(entry.name, relpath, exclude):
+            continue
+        path = entry.path
+        try:
+            if entry.is_symlink():
+                # stat follows the link, and fails for missing targets
+                entry.stat()
+                path = os.path.realpath(path)
+            if entry.is_dir():
+                info = entry.stat()
+                dirs.append((path, (info.st_dev, info.st_ino)))
+            elif include is None or _match(entry.name, relpath, include):
+                files.append((path, entry.stat()) if stat else path)
+        except OSError:
+            continue
+    return files, dirs, level
+
+
+def crawl(path, include=None, exclude=('.*', '_*'), depth=None, workers=None, stat=False):
+    """
+    Crawl directory for files, scanning subdirectories concurrently. File
+    types are resolved from directory entries, so regular files in the
+    tree are found without issuing additional stat calls. Symlinks to
+    directories are followed, but each real directory is only crawled
+    once, so symlink cycles and symlinks to sibling directories don't
+    produce repeated files. Dangling symlinks are skipped.
+
+    Args:
+        path (str): Directory to crawl.
+        include (list): Glob patterns for files to include. Patterns with
+            a path separator are matched against paths relative to the
+            directory, and other patterns are matched against file names.
+        exclude (list): Glob patterns for files and directories to skip.
+            By default, hidden files and files beginning with an
+            underscore are skipped.
+        depth (int): Maximum depth of subdirectories to crawl, where
+            0 only includes files in the top-level directory.
+        workers (int): Number of threads to use for scanning directories.
+        stat (bool): Whether or not to also yield stat results for each
+            file. Stat calls are issued by the scanning threads.
+
+    Yields:
+        str: Full path for each file found in the directory, or tuple
+            with path and stat result if ``stat`` is specified.
+
+    Examples:
+        >>> # crawl directory for csv files, two levels deep
+        >>> for path in crawl('/path/to/data', include=['*.csv'], depth=2):
+        >>>     print path
+        '/path/to/data/one.csv'
+        '/path/to/data/sub/two.csv'
+    """
+    root = os.path.realpath(path)
+    exclude = [] if exclude is None else exclude
+    info = os.stat(root)
+    visited = {(info.st_dev, info.st_ino)}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan, root, root, 0, include, exclude, stat)}
+        while len(pending) != 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs, level = future.result()
+                if depth is None or level < depth:
+                    for directory, key in dirs:
+                        if key in visited:
+                            continue
+                        visited.add(key)
+                        pending.add(pool.submit(_scan, root, directory, level + 1, include, exclude, stat))
+                for item in files:
+                    yield item
+    return
+
+
+# hashing
+# -------
+def digest(path, algorithm='sha256', chunk_size=1 << 20):
+    """
+    Compute digest of file contents. Files are read in large chunks
+    into a reusable buffer, so memory use is constant for large files.
+
+    Args:
+        path (str): Path to file to hash.
+        algorithm (str): Name of hashlib algorithm to use.
+        chunk_size (int): Number of bytes to read at a time.
+
+    Returns:
+        str: Hex digest for file contents.
+
+    Examples:
+        >>> digest('/path/to/data/one.csv')
+        'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+    """
+    hasher = hashlib.new(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as fh:
+        while True:
+            size = fh.readinto(buf)
+            if not size:
+                break
+            hasher.update(view[:size])
+    return hasher.hexdigest()
 
 
 # files
@@ -22,14 +158,26 @@ class File(object):
         path (list): List of file object to manage.
         metadata (dict): Dictionary with common metadata for collection,
             specified a priori.
+        verify (bool): Whether or not to check that the path exists and
+            resolve it to a real path. This should only be disabled when
+            the path is already known to be a real path to a file.
     """
     __metaclass__ = DocRequire
-
-    def __init__(self, path, metadata={}):
-        assert os.path.exists(path), 'Specified file path does not exist!'
-        assert not os.path.isdir(path), 'Specified file is not a file! Use the Collection object for a directory.'
-        self.path = os.path.realpath(path)
+    __attributes__ = ['_metadata', '_fields', '_synced', '_collection', '_stat', '_checksum', '_loaded', 'path']
+
+    def __init__(self, path, metadata={}, verify=True):
+        if verify:
+            assert os.path.exists(path), 'Specified file path does not exist!'
+            assert not os.path.isdir(path), 'Specified file is not a file! Use the Collection object for a directory.'
+            path = os.path.realpath(path)
+        self.path = path
         self._metadata = composite(metadata)
+        self._fields = None
+        self._synced = False
+        self._collection = None
+        self._stat = None
+        self._checksum = None
+        self._loaded = None
         return
 
     @property
@@ -53,6 +201,16 @@ class File(object):
         """
         return '.' + self.name.split('.')[-1]
 
+    @property
+    def stat(self):
+        """
+        Return stat result for file. The result is cached after
+        the file is first stat'd.
+        """
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
     @property
     def metadata(self):
         """
@@ -139,53 +297,144 @@ class File(object):
             raise TypeError('unsupported operand type(s) for +: \'{}\' and \'{}\''.format(type(self), type(other)))
         return
 
+    @property
+    def partial(self):
+        """
+        Return boolean describing if only a subset of metadata fields
+        has been loaded for the file.
+        """
+        return self._fields is not None
+
     def __getattr__(self, name):
         """
         Proxy for accessing metadata directly as a property on the class.
         """
+        fields = self.__dict__.get('_fields')
+        if fields is not None and name in fields:
+            return self._metadata[name]
         return self.metadata[name]
 
     def __getitem__(self, name):
         """
         Proxy for accessing metadata directly as a property on the class.
         """
+        fields = self.__dict__.get('_fields')
+        if fields is not None and name in fields:
+            return self._metadata[name]
         return self.metadata[name]
 
     def __setattr__(self, name, value):
         """
         Proxy for setting metadata directly as a property on the class.
         """
-        if name not in ['_metadata', 'path']:
+        if name not in self.__attributes__:
             self.metadata[name] = value
         else:
             super(File, self).__setattr__(name, value)
         return
 
 
+# collections
+# -----------
+def _mutates(name):
+    """
+    Wrap list method so that calling it bumps the version
+    of the list.
+    """
+    method = getattr(list, name)
+
+    def _(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+    _.__name__ = name
+    return _
+
+
+class FileList(list):
+    """
+    List of files in collection, with a version that is bumped
+    on every mutation so that indexes built from the list can
+    detect when they're stale (i.e. after in-place replacement
+    of files, which doesn't change the length of the list).
+    """
+    version = 0
+
+
+for _method in [
+    '__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+    'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse'
+]:
+    setattr(FileList, _method, _mutates(_method))
+
+
 class Collection(object):
     """
     Abstract class for collection of file objects.
 
     Args:
         files (list): List of file objects to manage, or path to directory
-            to generate collection from.
+            (or glob pattern) to generate collection from.
         metadata (dict): Dictionary with common metadata for collection,
             specified a priori.
+        include (list): Glob patterns for files to include when generating
+            collection from a directory.
+        exclude (list): Glob patterns for files and directories to skip when
+            generating collection from a directory.
+        depth (int): Maximum depth of subdirectories to crawl when generating
+            collection from a directory.
+        workers (int): Number of threads to use for crawling directory.
     """
     __metaclass__ = DocRequire
     __file_base__ = File
+    __attributes__ = ['_metadata', '_derived', '_stale', '_files', '_index', '_indexed', 'files']
 
-    def __init__(self, files, metadata={}):
+    def __init__(self, files, metadata={}, include=None, exclude=('.*', '_*'), depth=None, workers=None):
+        self._metadata = composite(metadata)
+        self._derived = len(self._metadata) == 0
+        self._stale = self._derived
         if isinstance(files, str):
-            ft = filetree(files)
-            self.files = [self.__file_base__(x) for x in ft.filelist()]
+            if os.path.isdir(files):
+                paths = crawl(files, include=include, exclude=exclude, depth=depth, workers=workers)
+            else:
+                paths = [os.path.realpath(x) for x in glob.glob(files) if not os.path.isdir(x)]
+            self.files = [self.__file_base__(x, verify=False) for x in paths]
             if len(self.files) == 0:
                 raise AssertionError('Could not find any files for collection!')
+            for fi in self.files:
+                fi._collection = self
         else:
             self.files = files
-        self._metadata = composite(metadata)
         return
 
+    @property
+    def files(self):
+        """
+        Return list of files in collection.
+        """
+        return self._files
+
+    @files.setter
+    def files(self, value):
+        self._files = FileList(value)
+        self._index = None
+        self._indexed = None
+        self.invalidate()
+        return
+
+    def _paths(self):
+        """
+        Return insertion-ordered mapping of file paths to files in
+        collection, used for constant-time membership checks. The index
+        is rebuilt if the list of files has been modified since it was built.
+        """
+        files = self.files
+        if self._index is None or self._indexed != files.version:
+            self._index = OrderedDict()
+            for fi in files:
+                self._index.setdefault(fi.path, fi)
+            self._indexed = files.version
+        return self._index
+
     @property
     def filelist(self):
         """
@@ -197,20 +446,69 @@ class Collection(object):
     def metadata(self):
         """
         If no metadata is initially specified for a file, query the database
-        for metadata about the specified file.
-        """
-        if len(self._metadata) == 0:
-            res = self.files[0].metadata
-            for idx in range(1, len(self.files)):
-                res = res.intersection(self.files[idx].metadata)
+        for metadata about the specified file. Metadata common to all
+        files is cached after it's first computed, and is kept up to date
+        as files are added to the collection and metadata is added via
+        add_metadata(). Use invalidate() to force recomputation after
+        changing metadata on individual files.
+        """
+        if self._stale:
+            self.prefetch()
+            res = composite({})
+            if len(self.files) != 0:
+                res = self.files[0].metadata
+                for idx in range(1, len(self.files)):
+                    if len(res) == 0:
+                        break
+                    res = res.intersection(self.files[idx].metadata)
             self._metadata = res
+            self._stale = False
         return self._metadata
 
+    def invalidate(self):
+        """
+        Invalidate cached metadata common to all files in the collection,
+        so that it's recomputed on next access. Metadata specified a priori
+        for the collection is left untouched.
+        """
+        if self._derived:
+            self._stale = True
+        return
+
+    def _extend(self, files):
+        """
+        Return new collection with files added to the files in this
+        collection, updating common metadata incrementally.
+        """
+        res = self.__class__(files=self.files + files, metadata=self._metadata)
+        if self._derived:
+            res._derived = True
+            res._stale = self._stale
+            if not self._stale:
+                metadata = composite(self._metadata.json())
+                if len(metadata) != 0 and len(files) != 0:
+                    self.__class__(files=files).prefetch()
+                    for fi in files:
+                        if len(metadata) == 0:
+                            break
+                        metadata = metadata.intersection(fi.metadata)
+                res._metadata = metadata
+        return res
+
+    def prefetch(self):
+        """
+        Pull metadata for all files in the collection in as few
+        operations as possible. By default, this does nothing -- the
+        database layer replaces this with batched queries.
+        """
+        return self
+
     @keywords
     def add_metadata(self, *args, **kwargs):
         """
         Add metadata for all objects in the collection. 
         """
+        self.prefetch()
         for idx in range(0, len(self.files)):
             for key in kwargs:
                 self.files[idx].metadata[key] = kwargs[key]
@@ -266,7 +564,9 @@ class Collection(object):
         """
         Compare equality for collections.
         """
-        return sorted(self.files) == sorted(other.files)
+        if not isinstance(other, Collection):
+            return False
+        return Counter(self.filelist) == Counter(other.filelist)
 
     def __iter__(self):
         """
@@ -285,6 +585,8 @@ class Collection(object):
         """
         Check if item exists in file set. Input item should be a File object.
         """
+        if isinstance(item, File):
+            return item.path in self._paths()
         return item in self.files
 
     def __add__(self, other):
@@ -316,20 +618,21 @@ class Collection(object):
             '/file/three.txt'
         """
         if isinstance(other, self.__file_base__):
-            res = [x for x in self.files]
-            if other not in self:
-                res += [other]
-            return self.__class__(files=res, metadata=self._metadata)
-        elif isinstance(other, self.__class__):
-            res = [x for x in self.files]
-            for item in other.files:
-                if item not in self:
-                    res += [item]
-            return self.__class__(files=res, metadata=self._metadata)
+            return self._extend([] if other in self else [other])
+        elif isinstance(other, Collection):
+            index = self._paths()
+            return self._extend([x for x in other.files if x.path not in index])
         else:
             raise TypeError('unsupported operand type(s) for +: \'{}\' and \'{}\''.format(type(self), type(other)))
         return
 
+    def __or__(self, other):
+        """
+        Union operator for collections or files. This is an alias
+        for the addition operator.
+        """
+        return self.__add__(other)
+
     def __sub__(self, other):
         """
         Subtraction operator for collections or files. Using this, you can
@@ -355,11 +658,40 @@ class Collection(object):
             '/file/two.txt'
         """
         if isinstance(other, self.__file_base__):
-            return self.__class__(files=[x for x in self.files if x != other])
+            return self.__class__(files=[x for x in self.files if x.path != other.path])
         elif isinstance(other, Collection):
-            return self.__class__(files=[x for x in self.files if x not in other])
+            index = other._paths()
+            return self.__class__(files=[x for x in self.files if x.path not in index])
         else:
-            raise TypeError('unsupported operand type(s) for +: \'{}\' and \'{}\''.format(type(self), type(other)))
+            raise TypeError('unsupported operand type(s) for -: \'{}\' and \'{}\''.format(type(self), type(other)))
+        return
+
+    def __and__(self, other):
+        """
+        Intersection operator for collections or files. Using this, you can
+        intersect Collection objects with other Collection objects to form a
+        Collection with the files common to both, or intersect Collection
+        objects with File objects to check for the File object in the Collection.
+
+        Examples:
+            >>> # add files to create collection
+            >>> one = coda.File('/file/one.txt')
+            >>> two = coda.File('/file/two.txt')
+            >>> three = coda.File('/file/three.txt')
+            >>> onetwo = one + two
+            >>> twothree = two + three
+            >>>
+            >>> # intersect collection objects to create new collection
+            >>> print onetwo & twothree
+            '/file/two.txt'
+        """
+        if isinstance(other, self.__file_base__):
+            return self.__class__(files=[x for x in self.files if x.path == other.path])
+        elif isinstance(other, Collection):
+            index = other._paths()
+            return self.__class__(files=[x for x in self.files if x.path in index])
+        else:
+            raise TypeError('unsupported operand type(s) for &: \'{}\' and \'{}\''.format(type(self), type(other)))
         return
 
     def __getattr__(self, name):
@@ -381,9 +713,109 @@ class Collection(object):
         """
         Proxy for setting metadata directly as a property on the class.
         """
-        if name not in ['_metadata', 'files']:
+        if name not in self.__attributes__:
             self.add_metadata({name: value})
         else:
-            super(self.__class__, self).__setattr__(name, value)
+            super(Collection, self).__setattr__(name, value)
         return
 
+
+class LazyCollection(Collection):
+    """
+    Collection backed by an iterator over file objects (i.e. a database
+    cursor). Files are pulled from the iterator as they are needed, and the
+    full list of files is only materialized when an operation requires it.
+
+    Args:
+        files (iterable): Iterable yielding file objects to manage.
+        metadata (dict): Dictionary with common metadata for collection,
+            specified a priori.
+        count (callable): Function returning the total number of files
+            in the iterable, used for computing length before the
+            collection is materialized.
+    """
+    __attributes__ = Collection.__attributes__ + ['_source', '_count']
+
+    def __init__(self, files, metadata={}, count=None):
+        self._metadata = composite(metadata)
+        self._derived = len(self._metadata) == 0
+        self._stale = self._derived
+        if isinstance(files, (list, tuple)):
+            self._files = FileList(files)
+            self._source = None
+        else:
+            self._files = FileList()
+            self._source = iter(files)
+        self._index = None
+        self._indexed = None
+        self._count = count
+        return
+
+    def _pull(self, size=None):
+        """
+        Pull files from the underlying iterable, until the specified number
+        of files have been loaded or the iterable is exhausted.
+        """
+        while self._source is not None and (size is None or len(self._files) < size):
+            try:
+                self._files.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return
+
+    @property
+    def files(self):
+        """
+        Return list of all files in collection, materializing the
+        collection if necessary.
+        """
+        self._pull()
+        return self._files
+
+    @files.setter
+    def files(self, value):
+        self._files = FileList(value)
+        self._source = None
+        self._index = None
+        self._indexed = None
+        self.invalidate()
+        return
+
+    @property
+    def materialized(self):
+        """
+        Return boolean describing if all files have been pulled from
+        the underlying iterable.
+        """
+        return self._source is None
+
+    def __iter__(self):
+        """
+        Iterator for collection object. Iterates by returning each file,
+        pulling files from the underlying iterable as they are needed.
+        """
+        idx = 0
+        while True:
+            if idx >= len(self._files):
+                self._pull(idx + 1)
+                if idx >= len(self._files):
+                    return
+            yield self._files[idx]
+            idx += 1
+
+    def __len__(self):
+        """
+        Return length of collection object (number of files in collection).
+        """
+        if self._source is not None and self._count is not None:
+            return self._count()
+        return len(self.files)
+
+    def __getitem__(self, item):
+        """
+        Proxy for accessing metadata directly as a property on the class.
+        """
+        if isinstance(item, int) and item >= 0:
+            self._pull(item + 1)
+            return self._files[item]
+        return super(LazyCollection, self).__getitem__(item)
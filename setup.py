@@ -45,7 +45,7 @@ setup(
     author='Blake Printy',
     author_email='bprinty@gmail.com',
     url='https://github.com/bprinty/coda',
-    packages=['coda'],
+    packages=['coda', 'coda.backends'],
     package_dir={'coda': 'coda'},
     entry_points={
         'console_scripts': [
@@ -54,6 +54,7 @@ setup(
     },
     include_package_data=True,
     install_requires=requirements,
+    python_requires='>=3.7',
     license='Apache-2.0',
     zip_safe=False,
     keywords=['coda', 'data', 'science', 'analysis', 'file', 'organization', 'metadata'],
@@ -61,12 +62,13 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
         'Natural Language :: English',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     tests_require=test_requirements,
     setup_requires=test_requirements
@@ -25,6 +25,8 @@ logging.basicConfig(level=logging.ERROR)
 def pytest_addoption(parser):
     parser.addoption("-E", action="store", metavar="NAME",
         help="only run tests matching the environment NAME.")
+    parser.addoption("--backend", action="store", metavar="NAME",
+        help="storage backend to run tests against.")
     return
 
 
@@ -45,12 +47,16 @@ def pytest_runtest_setup(item):
 
 
 @pytest.fixture(autouse=True)
-def bootstrap():
+def bootstrap(request):
     global __user_config__
     cwd = os.path.dirname(os.path.realpath(__file__))
     coda.db.__user_config__ = os.path.join(cwd, 'resources', '.coda')
-    coda.db.options()
-    coda.db.session.db.files.drop()
+    backend = request.config.getoption("--backend")
+    if backend is not None:
+        coda.db.options(backend=backend)
+    else:
+        coda.db.options()
+    coda.db.session.engine.drop()
     coda.add(cl)
     yield
     coda.delete(cl)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# testing for coda
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import unittest
+import os
+import asyncio
+
+import coda
+import coda.aio
+from . import __resources__
+
+
+# helpers
+# -------
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+# aio
+# ---
+class TestAsync(unittest.TestCase):
+
+    def test_find(self):
+        ret = run(coda.aio.find({'type': 'text'}))
+        self.assertEqual(ret, coda.find({'type': 'text'}))
+        ret = run(coda.aio.find({'type': 'text'}, fields=['cohort'], sort='base_name', limit=2))
+        self.assertEqual(len(ret), 2)
+        return
+
+    def test_find_one(self):
+        paths = [x.path for x in coda.find({'type': 'text'})]
+
+        async def lookup():
+            return await asyncio.gather(*[coda.aio.find_one({'path': x}) for x in paths])
+
+        ret = run(lookup())
+        self.assertEqual([x.path for x in ret], paths)
+        self.assertEqual(run(coda.aio.find_one({'type': 'missing'})), None)
+        return
+
+    def test_iterate(self):
+        async def collect(**kwargs):
+            return [fi async for fi in coda.aio.iterate({'type': 'text'}, **kwargs)]
+
+        ret = run(collect(batch_size=3))
+        self.assertEqual(coda.Collection(files=ret), coda.find({'type': 'text'}))
+        ret = run(collect(fields=['cohort'], sort='base_name', skip=1))
+        self.assertEqual(len(ret), 3)
+        self.assertEqual(ret[0].cohort, 'simple')
+        # timings are recorded with synchronous iteration
+        coda.stats(reset=True)
+        run(collect(batch_size=3))
+        self.assertEqual((coda.stats()['iterate']['count'], coda.stats()['iterate']['documents']), (1, 4))
+        return
+
+    def test_add_delete(self):
+        fi = coda.File(os.path.join(__resources__, 'simple', 'one.txt'))
+        fi.group = 'async'
+        self.assertEqual(run(coda.aio.add(fi)), {'inserted': 0, 'updated': 1})
+        self.assertEqual(coda.find_one({'group': 'async'}).path, fi.path)
+        self.assertEqual(run(coda.aio.update({'group': 'async'}, inc={'count': 1})), {'inserted': 0, 'updated': 1})
+        self.assertEqual(coda.find_one({'group': 'async'}).count, 1)
+        self.assertEqual(run(coda.aio.delete(fi)), {'deleted': 1})
+        self.assertEqual(coda.find_one({'group': 'async'}), None)
+        return
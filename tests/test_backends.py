@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# testing for coda
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import unittest
+import os
+import re
+import shutil
+import tempfile
+from parameterized import parameterized
+
+import coda
+from coda import backends
+from coda.backends.mongo import MongoBackend
+from coda.backends import sqlite
+from coda.backends.sqlite import SQLiteBackend
+from coda.backends.memory import MemoryBackend
+from . import cl
+
+
+# config
+# ------
+records = [
+    {'path': '/data/one.txt', 'group': 'train', 'count': 10, 'tags': {'qc': True}},
+    {'path': '/data/two.txt', 'group': 'train', 'count': 25},
+    {'path': '/data/three.csv', 'group': 'test', 'count': 40, 'note': None},
+    {'path': '/other/four.csv', 'group': 'test', 'count': 'many'},
+]
+
+
+# registry
+# --------
+class TestRegistry(unittest.TestCase):
+
+    def test_load(self):
+        self.assertEqual(backends.load('sqlite'), SQLiteBackend)
+        self.assertEqual(backends.load('memory'), MemoryBackend)
+        self.assertEqual(backends.load('coda.backends.sqlite.SQLiteBackend'), SQLiteBackend)
+        with self.assertRaises(AssertionError):
+            backends.load('missing')
+        return
+
+
+# mongo
+# -----
+class TestMongoBackend(unittest.TestCase):
+
+    def test_client_options(self):
+        backend = MongoBackend(pool_size=10, connect_timeout=2.5, compressors=['zstd', 'zlib'], appname='test')
+        self.assertEqual(backend.client_options, {
+            'maxPoolSize': 10,
+            'connectTimeoutMS': 2500,
+            'serverSelectionTimeoutMS': 30000,
+            'compressors': 'zstd,zlib',
+            'appname': 'test'
+        })
+        return
+
+
+# backends
+# --------
+class BackendTests(object):
+    """
+    Tests shared by storage backends.
+    """
+
+    @parameterized.expand([
+        ({}, 4),
+        ({'group': 'train'}, 2),
+        ({'group': {'$eq': 'test'}}, 2),
+        ({'group': {'$ne': 'test'}}, 2),
+        ({'group': {'$in': ['train', 'other']}}, 2),
+        ({'group': {'$nin': ['train']}}, 2),
+        ({'count': {'$lt': 25}}, 1),
+        ({'count': {'$lte': 25}}, 2),
+        ({'count': {'$gt': 10, '$lt': 40}}, 1),
+        ({'count': {'$gte': 0}}, 3),
+        ({'path': {'$regex': '^' + re.escape('/data/')}}, 3),
+        ({'path': {'$regex': r'\.CSV$', '$options': 'i'}}, 2),
+        ({'path': re.compile(r'one|two')}, 2),
+        ({'tags.qc': True}, 1),
+        ({'tags': {'$exists': True}}, 1),
+        ({'note': {'$exists': True}}, 1),
+        ({'note': None}, 4),
+        ({'group': {'$not': {'$in': ['train']}}}, 2),
+        ({'$or': [{'group': 'train'}, {'count': 40}]}, 3),
+        ({'$and': [{'group': 'test'}, {'count': {'$gt': 0}}]}, 1),
+        ({'$nor': [{'group': 'train'}]}, 2),
+    ])
+    def test_find(self, query, count):
+        res = list(self.backend.find(query))
+        self.assertEqual(len(res), count)
+        self.assertEqual(self.backend.count(query), count)
+        return
+
+    @parameterized.expand([
+        ({'labels': 'x'}, ['/data/five.txt', '/data/six.txt']),
+        ({'labels': 'y'}, ['/data/five.txt']),
+        ({'labels': ['x', 'y']}, ['/data/five.txt']),
+        ({'labels': ['y', 'x']}, []),
+        ({'labels': {'$in': ['y', 'z']}}, ['/data/five.txt']),
+        ({'labels': {'$regex': '^y'}}, ['/data/five.txt']),
+        ({'labels': {'$ne': 'x'}}, ['/data/one.txt', '/data/three.csv', '/data/two.txt', '/other/four.csv']),
+        ({'labels': {'$nin': ['y']}}, ['/data/one.txt', '/data/six.txt', '/data/three.csv', '/data/two.txt', '/other/four.csv']),
+        ({'flag': True}, ['/data/five.txt']),
+        ({'flag': 1}, ['/data/six.txt']),
+        ({'flag': {'$in': [True, 'x']}}, ['/data/five.txt']),
+        ({'flag': {'$gte': 1}}, ['/data/six.txt']),
+        ({'size': {'$gt': 0}}, ['/data/five.txt']),
+        ({'size': {'$ne': True}}, ['/data/five.txt', '/data/one.txt', '/data/three.csv', '/data/two.txt', '/other/four.csv']),
+    ])
+    def test_parity(self, query, paths):
+        # matches mongodb semantics for arrays and booleans
+        self.backend.replace([
+            {'path': '/data/five.txt', 'labels': ['x', 'y'], 'flag': True, 'size': 1},
+            {'path': '/data/six.txt', 'labels': 'x', 'flag': 1, 'size': True},
+        ])
+        self.assertEqual(sorted(x['path'] for x in self.backend.find(query)), paths)
+        self.assertEqual(self.backend.count(query), len(paths))
+        return
+
+    def test_find_options(self):
+        res = list(self.backend.find({}, sort=[('path', -1)], limit=2, skip=1))
+        self.assertEqual([x['path'] for x in res], ['/data/two.txt', '/data/three.csv'])
+        res = self.backend.find_one({'group': 'train'}, projection={'path': True, 'count': True}, sort=[('count', -1)])
+        self.assertEqual(res, {'path': '/data/two.txt', 'count': 25})
+        self.assertEqual(self.backend.count({}, limit=3, skip=2), 2)
+        with self.assertRaises(AssertionError):
+            list(self.backend.find({'group': {'$size': 2}}))
+        return
+
+    def test_write(self):
+        res = self.backend.replace([{'path': '/data/one.txt', 'group': 'test'}, {'path': '/data/five.txt'}])
+        self.assertEqual(res, {'inserted': 1, 'updated': 1})
+        self.assertEqual(self.backend.find_one({'path': '/data/one.txt'}), {'path': '/data/one.txt', 'group': 'test'})
+        res = self.backend.update([
+            ('/data/two.txt', {'$set': {'stat.size': 5}, '$unset': {'group': ''}, '$inc': {'count': 1}}),
+            ('/data/six.txt', {'$set': {'group': 'new'}}),
+        ])
+        self.assertEqual(res, {'inserted': 1, 'updated': 1})
+        self.assertEqual(self.backend.find_one({'path': '/data/two.txt'}), {'path': '/data/two.txt', 'count': 26, 'stat': {'size': 5}})
+        res = self.backend.update([
+            ('/data/two.txt', {'$inc': {'count': 1}}),
+            ('/data/seven.txt', {'$set': {'group': 'new'}}),
+        ], upsert=False)
+        self.assertEqual(res, {'inserted': 0, 'updated': 1})
+        self.assertEqual(self.backend.find_one({'path': '/data/seven.txt'}), None)
+        self.assertEqual(self.backend.delete({'path': {'$in': ['/data/five.txt', '/data/six.txt']}}), 2)
+        self.assertEqual(self.backend.delete({'group': 'test'}), 3)
+        self.assertEqual(self.backend.count({}), 1)
+        return
+
+    def test_update_many(self):
+        res = self.backend.update_many({'group': 'train'}, {'$set': {'labels': ['x']}, '$unset': {'group': ''}, '$inc': {'count': 1}})
+        self.assertEqual(res, 2)
+        self.assertEqual(self.backend.find_one({'path': '/data/two.txt'}), {'path': '/data/two.txt', 'count': 26, 'labels': ['x']})
+        self.assertEqual(self.backend.count({'labels': 'x'}), 2)
+        self.assertEqual(self.backend.update_many({'group': 'missing'}, {'$set': {'group': 'new'}}), 0)
+        self.backend.create_index([('count', 1)], unique=True)
+        with self.assertRaises(AssertionError):
+            self.backend.update_many({'group': 'test'}, {'$set': {'count': 0}})
+        return
+
+    def test_index(self):
+        self.assertEqual(self.backend.create_index([('group', 1), ('count', -1)]), 'group_1_count_-1')
+        self.assertEqual(self.backend.create_index([('count', 1)], unique=True, sparse=True), 'count_1')
+        self.assertEqual([x['name'] for x in self.backend.list_indexes()], ['path_1', '_parent_1', 'group_1_count_-1', 'count_1'])
+        self.assertEqual(self.backend.count({'group': 'train', 'count': {'$in': [10, 40]}}), 1)
+        with self.assertRaises(AssertionError):
+            self.backend.replace([{'path': '/data/five.txt', 'count': 10}])
+        self.backend.drop_index([('count', 1)])
+        self.assertEqual(len(self.backend.list_indexes()), 3)
+        with self.assertRaises(AssertionError):
+            self.backend.drop_index([('count', 1)])
+        return
+
+    def test_explain(self):
+        res = self.backend.explain({'group': 'train'})
+        self.assertEqual((res['index'], res['examined'], res['returned']), (None, 4, 2))
+        self.backend.create_index([('group', 1)])
+        res = self.backend.explain({'group': 'train'}, sort=[('count', 1)])
+        self.assertEqual((res['index'], res['returned']), ('group_1', 2))
+        self.assertEqual(self.backend.explain({'path': '/data/one.txt'})['index'], 'path_1')
+        return
+
+    def test_duplicates(self):
+        checksum = {'digest': 'abc', 'algorithm': 'sha256', 'size': 0, 'mtime': 0}
+        self.backend.update([(x, {'$set': {'_checksum': checksum}}) for x in ['/data/one.txt', '/data/two.txt']])
+        res = self.backend.duplicates()
+        self.assertEqual(len(res), 1)
+        self.assertEqual(sorted(res[0]['paths']), ['/data/one.txt', '/data/two.txt'])
+        self.assertEqual(self.backend.duplicates({'count': {'$gt': 10}}), [])
+        return
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(sqlite_path=os.path.join(self.tmp, 'coda.sqlite'))
+        self.backend.replace(records)
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        return
+
+    def test_plan(self):
+        self.backend.create_index([('group', 1)])
+        plan = self.backend.db.execute(
+            'EXPLAIN QUERY PLAN SELECT path FROM files WHERE json_extract(data, \'$."group"\') = ?', ('train',)
+        ).fetchall()
+        self.assertTrue('files_group_1' in str(plan))
+        return
+
+    @parameterized.expand([
+        ('^/data/', ('/data/', True)),
+        ('^/data/[^/]*$', ('/data/', False)),
+        ('^/data/one\\.txt$', ('/data/one.txt', False)),
+        ('^/data/ones*', ('/data/one', False)),
+        ('/data/', ('', False)),
+        ('^/data/|^/other/', ('', False)),
+    ])
+    def test_prefix(self, pattern, expected):
+        self.assertEqual(sqlite._prefix(pattern), expected)
+        return
+
+
+class TestMemoryBackend(BackendTests, unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend(dbname='coda-backend-testing')
+        self.backend.replace(records)
+        return
+
+    def tearDown(self):
+        self.backend.drop()
+        return
+
+    def test_store(self):
+        self.assertTrue(MemoryBackend(dbname='coda-backend-testing').db is self.backend.db)
+        self.backend.find_one({'path': '/data/one.txt'})['group'] = 'changed'
+        self.assertEqual(self.backend.find_one({'path': '/data/one.txt'})['group'], 'train')
+        return
+
+    def test_lookup(self):
+        self.assertEqual(self.backend._lookup({'group': ['train']}), (None, None))
+        self.backend.create_index([('group', 1)])
+        self.assertEqual(self.backend._lookup({'group': ['train']}), ('group_1', set(['/data/one.txt', '/data/two.txt'])))
+        self.backend.update([('/data/one.txt', {'$set': {'group': 'test'}})])
+        self.assertEqual(self.backend._lookup({'group': ['train']})[1], set(['/data/two.txt']))
+        self.assertEqual(self.backend.delete({'group': 'test'}), 3)
+        self.assertEqual(self.backend._lookup({'group': ['test']})[1], set())
+        return
+
+    def test_narrow(self):
+        query = {'$or': [{'group': 'train'}, {'path': '/data/three.csv'}]}
+        self.assertEqual(self.backend.explain(query)['index'], None)
+        self.backend.create_index([('group', 1)])
+        res = self.backend.explain(query)
+        self.assertEqual((res['index'], res['examined'], res['returned']), ('group_1, path_1', 3, 3))
+        res = self.backend.explain({'$and': [{'count': {'$gt': 0}}, {'group': 'test'}]})
+        self.assertEqual((res['index'], res['examined'], res['returned']), ('group_1', 2, 1))
+        self.assertEqual(self.backend.explain({'_parent': '/data'})['index'], '_parent_1')
+        return
+
+
+# session
+# -------
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.session = coda.db.session
+        return
+
+    def tearDown(self):
+        coda.db.session = self.session
+        shutil.rmtree(self.tmp)
+        return
+
+    @parameterized.expand([
+        ('sqlite',),
+        ('memory',),
+    ])
+    def test_api(self, backend):
+        coda.db.session = coda.db.Session(backend=backend, dbname='coda-session-testing',
+                                          sqlite_path=os.path.join(self.tmp, 'coda.sqlite'))
+        coda.db.session.engine.drop()
+        coda.add(cl)
+
+        self.assertEqual(len(coda.find({'type': 'text'})), 4)
+        self.assertEqual(len(coda.find({'type': 'text'}, lazy=True)), 4)
+        fi = coda.find_one({'type': 'text'}, fields=['cohort'], sort=[('base_name', -1)])
+        self.assertEqual(fi.cohort, 'simple')
+        self.assertEqual(fi.type, 'text')
+        self.assertEqual(coda.ensure_index('type'), 'type_1')
+        self.assertEqual(coda.delete_query({'type': 'text'}), {'deleted': 4})
+        self.assertEqual(coda.find({'type': 'text'}), None)
+        return
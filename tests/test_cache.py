@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# testing for coda
+# 
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+from coda.cache import DiskCache, QueryCache
+
+
+# disk cache
+# ----------
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cache.db')
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        return
+
+    def test_get_put(self):
+        cache = DiskCache(self.path)
+        cache.put([{'path': '/one.txt', 'group': 'test'}, {'path': '/two.txt', 'group': 'test'}])
+        res = cache.get(['/one.txt', '/three.txt'])
+        self.assertEqual(res, {'/one.txt': {'path': '/one.txt', 'group': 'test'}})
+        # persistence
+        cache.flush()
+        cache = DiskCache(self.path)
+        self.assertEqual(sorted(cache.get(['/one.txt', '/two.txt'])), ['/one.txt', '/two.txt'])
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses']), (2, 3, 1))
+        # removal
+        cache.delete(['/one.txt'])
+        self.assertEqual(list(cache.get(['/one.txt', '/two.txt'])), ['/two.txt'])
+        cache.clear()
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses']), (0, 0, 0))
+        return
+
+    def test_namespace(self):
+        one = DiskCache(self.path, namespace='one')
+        two = DiskCache(self.path, namespace='two')
+        one.put([{'path': '/one.txt', 'group': 'one'}])
+        self.assertEqual(two.get(['/one.txt']), {})
+        two.put([{'path': '/one.txt', 'group': 'two'}])
+        self.assertEqual(one.get(['/one.txt'])['/one.txt']['group'], 'one')
+        two.delete(['/one.txt'])
+        self.assertEqual(list(one.get(['/one.txt'])), ['/one.txt'])
+        two.put([{'path': '/two.txt'}])
+        two.clear()
+        self.assertEqual(list(one.get(['/one.txt'])), ['/one.txt'])
+        self.assertEqual((one.stats()['entries'], one.stats()['hits']), (1, 3))
+        self.assertEqual((two.stats()['entries'], two.stats()['hits']), (0, 0))
+        # eviction and expiry only apply to entries for the namespace
+        three = DiskCache(self.path, ttl=0, size=1, namespace='three')
+        three.put([{'path': '/two.txt'}, {'path': '/three.txt'}])
+        self.assertEqual(list(one.get(['/one.txt'])), ['/one.txt'])
+        return
+
+    def test_read_only(self):
+        cache = DiskCache(self.path)
+        cache.put([{'path': '/one.txt'}])
+        changes = cache._conn.total_changes
+        cache.get(['/one.txt', '/two.txt'])
+        self.assertEqual(cache._conn.total_changes, changes)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+        return
+
+    def test_ttl(self):
+        cache = DiskCache(self.path, ttl=0.2)
+        cache.put([{'path': '/one.txt', 'group': 'test'}])
+        self.assertEqual(list(cache.get(['/one.txt'])), ['/one.txt'])
+        time.sleep(0.3)
+        self.assertEqual(cache.get(['/one.txt']), {})
+        self.assertEqual(cache.stats()['entries'], 0)
+        return
+
+    def test_eviction(self):
+        cache = DiskCache(self.path, size=2)
+        cache.put([{'path': '/one.txt'}])
+        time.sleep(0.01)
+        cache.put([{'path': '/two.txt'}])
+        time.sleep(0.01)
+        cache.get(['/one.txt'])
+        time.sleep(0.01)
+        cache.put([{'path': '/three.txt'}])
+        res = cache.get(['/one.txt', '/two.txt', '/three.txt'])
+        self.assertEqual(sorted(res), ['/one.txt', '/three.txt'])
+        return
+
+
+# query cache
+# -----------
+class TestQueryCache(unittest.TestCase):
+
+    def test_get_put(self):
+        cache = QueryCache(size=2)
+        key = cache.key('find', {'group': 'test', 'type': 'text'})
+        self.assertEqual(key, cache.key('find', {'type': 'text', 'group': 'test'}))
+        self.assertEqual(cache.get(key), None)
+        cache.put(key, [{'path': '/one.txt'}])
+        res = cache.get(key)
+        self.assertEqual(res, [{'path': '/one.txt'}])
+        # results are copied
+        res[0].pop('path')
+        self.assertEqual(cache.get(key), [{'path': '/one.txt'}])
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (2, 1))
+        cache.clear()
+        self.assertEqual(cache.get(key), None)
+        return
+
+    def test_eviction(self):
+        cache = QueryCache(size=2, documents=3)
+        cache.put('one', [{'path': '/one.txt'}])
+        cache.put('two', [{'path': '/two.txt'}])
+        cache.get('one')
+        cache.put('three', [{'path': '/three.txt'}])
+        self.assertEqual(cache.get('two'), None)
+        self.assertNotEqual(cache.get('one'), None)
+        # bounded by documents
+        cache.put('four', [{'path': '/four.txt'}, {'path': '/five.txt'}])
+        self.assertEqual(cache.stats()['documents'], 3)
+        cache.put('five', [{'path': '/one.txt'}] * 4)
+        self.assertEqual(cache.get('five'), None)
+        return
@@ -11,7 +11,11 @@
 # -------
 import unittest
 import os
+import io
+import sys
+import argparse
 import subprocess
+from contextlib import redirect_stdout
 
 import coda
 
@@ -39,7 +43,9 @@ class TestEntryPoints(unittest.TestCase):
             'type': 'source'
         })
         coda.add(fi)
-        res = self.call('list')
+        res = self.call('list', '-r')
+        self.assertTrue('tests/test_coda.py' in res)
+        res = self.call('list', os.path.dirname(path))
         self.assertTrue('tests/test_coda.py' in res)
         res = self.call('list', path)
         self.assertTrue('"cohort": "testing"' in res)
@@ -60,6 +66,26 @@ class TestEntryPoints(unittest.TestCase):
         self.assertTrue('tests/test_coda.py' in res)
         coda.delete(fi)
         return
+
+    def test_formats(self):
+        path = os.path.realpath(__file__)
+        fi = coda.File(path=path, metadata={
+            'cohort': 'testing',
+            'ext': 'py',
+            'type': 'source'
+        })
+        coda.add(fi)
+        res = self.call('find', 'cohort', 'testing', '--format', 'null')
+        self.assertTrue(path + '\\x00' in res)
+        res = self.call('find', 'cohort', 'testing', '--format', 'jsonl', '--fields', 'ext,missing')
+        self.assertTrue('"ext": "py", "missing": null' in res)
+        self.assertFalse('"type"' in res)
+        res = self.call('find', 'cohort', 'testing', '--format', 'csv')
+        self.assertTrue('path,cohort,ext,type' in res)
+        res = self.call('find', 'type', 'source', '--limit', '1')
+        self.assertEqual(res.count('.py'), 1)
+        coda.delete(fi)
+        return
         
     def test_add(self):
         path = os.path.realpath(__file__)
@@ -86,3 +112,91 @@ class TestEntryPoints(unittest.TestCase):
         coda.delete(fi)
         return
 
+    def test_tag_from(self):
+        wd = os.path.realpath(os.path.join(coda.db.__base__, '..'))
+        paths = [x.path for x in coda.find({'type': 'text'})]
+        proc = subprocess.Popen(
+            'PYTHONPATH=$PYTHONPATH:{} python -m coda -c {} tag group piped --from - -0'.format(wd, coda.db.__user_config__),
+            stdin=subprocess.PIPE, shell=True
+        )
+        proc.communicate('\0'.join(paths).encode())
+        self.assertEqual(len(coda.find({'group': 'piped'})), len(paths))
+        self.assertEqual(len(coda.find({'group': 'piped', 'cohort': 'simple'})), len(paths))
+        coda.db.session.engine.update([(x, {'$unset': {'group': True}}) for x in paths])
+        return
+
+    def test_index(self):
+        res = self.call('index', 'add', 'cohort')
+        self.assertTrue('cohort_1' in res)
+        res = self.call('index', 'list')
+        self.assertTrue('cohort_1: cohort' in res)
+        self.call('index', 'drop', 'cohort')
+        res = self.call('index', 'list')
+        self.assertFalse('cohort_1' in res)
+        return
+
+    def test_explain(self):
+        res = self.call('explain', 'cohort', 'simple')
+        self.assertTrue('index: none (full scan)' in res)
+        self.assertTrue('returned: ' in res)
+        return
+
+    def test_sync(self):
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources', 'simple')
+        res = self.call('sync', path)
+        self.assertTrue('unchanged: 4' in res)
+        return
+
+
+# output
+# ------
+class TestOutput(unittest.TestCase):
+
+    def test_csv(self):
+        from coda.__main__ import output
+        files = [
+            coda.File(os.path.realpath(__file__), metadata={'type': 'source'}),
+            coda.File(os.path.join(os.path.dirname(os.path.realpath(__file__)), '__init__.py'), metadata={'type': 'source', 'ext': 'py'}),
+        ]
+        res = io.StringIO()
+        with redirect_stdout(res):
+            output(files, argparse.Namespace(format='csv', fields=None))
+        lines = res.getvalue().splitlines()
+        self.assertEqual(lines[0], 'path,ext,type')
+        self.assertEqual(lines[1:], [files[0].path + ',,source', files[1].path + ',py,source'])
+        return
+
+
+# startup
+# -------
+class TestStartup(unittest.TestCase):
+    """
+    Test that importing coda and running commands that don't touch
+    the database doesn't load configuration or database drivers.
+    Wall-clock startup time is held to a budget by the ``cli.version``
+    case in the benchmark suite.
+    """
+    modules = ['coda.db', 'coda.backends', 'pymongo', 'bson', 'gems']
+
+    def run_python(self, *args):
+        wd = os.path.realpath(os.path.join(coda.db.__base__, '..'))
+        proc = subprocess.Popen([sys.executable] + list(args), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=wd)
+        return proc.communicate()[0]
+
+    def test_import(self):
+        res = self.run_python('-c', 'import sys, coda; print([x for x in ["coda.db", "pymongo"] if x in sys.modules])')
+        self.assertEqual(res.decode().strip(), '[]')
+        return
+
+    def test_version(self):
+        res = self.run_python('-c', '\n'.join([
+            'import sys',
+            'from coda.__main__ import main',
+            'try:',
+            '    main(["version"])',
+            'except SystemExit as exe:',
+            '    print(exe.code)',
+            'print([x for x in {} if x in sys.modules])'.format(self.modules),
+        ]))
+        self.assertEqual(res.decode().split(), [coda.__version__, '[]'])
+        return
@@ -11,11 +11,15 @@
 # -------
 import unittest
 import os
+import re
 import json
+import shutil
+import tempfile
 import subprocess
 from parameterized import parameterized
 
 import coda
+from . import __resources__
 
 
 # session
@@ -23,12 +27,22 @@ import coda
 class TestSession(unittest.TestCase):
 
     def test_properties(self):
-        coda.options()
+        coda.options({'backend': coda.db.session.backend})
         self.assertEqual(coda.db.session.host, 'localhost')
         self.assertEqual(coda.db.session.port, 27017)
         self.assertEqual(coda.db.session.write, True)
         self.assertEqual(coda.db.session.dbname, 'coda-testing')
-        self.assertEqual(coda.db.session.db.__class__.__name__, 'Database')
+        if coda.db.session.backend == 'mongo':
+            self.assertEqual(coda.db.session.db.__class__.__name__, 'Database')
+        return
+
+    def test_fork(self):
+        engine = coda.db.session.engine
+        self.assertTrue(coda.db.session.engine is engine)
+        # simulate running in child process
+        coda.db.session._pid = -1
+        self.assertFalse(coda.db.session.engine is engine)
+        self.assertEqual(coda.db.session._pid, os.getpid())
         return
 
 
@@ -41,7 +55,7 @@ class TestFind(unittest.TestCase):
 
     @parameterized.expand([
         ({'type': 'text'}, 4),
-        ({'type': 'source'}, 2),
+        ({'type': 'source'}, 8),
     ])
     def test_find(self, query, count):
         ret = coda.find(query)
@@ -49,6 +63,22 @@ class TestFind(unittest.TestCase):
         self.assertEqual(len(ret), count)
         return
 
+    @parameterized.expand([
+        ({'type': 'text'}, 4),
+        ({'type': 'source'}, 8),
+    ])
+    def test_find_lazy(self, query, count):
+        ret = coda.find(query, lazy=True)
+        self.assertTrue(isinstance(ret, coda.LazyCollection))
+        self.assertEqual(len(ret), count)
+        self.assertFalse(ret.materialized)
+        self.assertTrue(isinstance(ret[0], coda.File))
+        self.assertEqual(len(list(ret)), count)
+        self.assertTrue(ret.materialized)
+        self.assertEqual(ret, coda.find(query))
+        self.assertEqual(coda.find({'type': 'missing'}, lazy=True), None)
+        return
+
     @parameterized.expand([
         ({'type': 'text'}, 'one.txt'),
         ({'type': 'source'}, 'db.py'),
@@ -60,6 +90,377 @@ class TestFind(unittest.TestCase):
         return
 
 
+    def test_find_options(self):
+        # sorting and paging
+        names = sorted(['one.txt', 'two.txt', 'three.txt', 'four.txt'])
+        ret = coda.find({'type': 'text'}, sort='base_name')
+        self.assertEqual([x.name for x in ret], names)
+        ret = coda.find({'type': 'text'}, sort=[('base_name', -1)], skip=1, limit=2)
+        self.assertEqual([x.name for x in ret], names[::-1][1:3])
+        ret = coda.find({'type': 'text'}, sort='base_name', skip=1, limit=2, batch_size=1, lazy=True)
+        self.assertEqual(len(ret), 2)
+        self.assertEqual([x.name for x in ret], names[1:3])
+        ret = coda.find_one({'type': 'text'}, sort='base_name', skip=1)
+        self.assertEqual(ret.name, names[1])
+        # projection
+        ret = coda.find_one({'base_name': 'one.txt'}, fields=['cohort'])
+        self.assertTrue(ret.partial)
+        self.assertEqual(ret.cohort, 'simple')
+        self.assertNotIn('type', ret._metadata)
+        self.assertEqual(ret.type, 'text')
+        self.assertFalse(ret.partial)
+        ret = coda.find({'type': 'text'}, fields=[])
+        self.assertEqual(len(ret), 4)
+        self.assertEqual(ret.cohort, 'simple')
+        return
+
+    def test_slow_query(self):
+        threshold = coda.db.session.slow_query
+        try:
+            coda.db.session.slow_query = 1e-9
+            with self.assertLogs('coda', 'WARNING') as logs:
+                coda.find({'type': 'text', 'base_name': {'$in': ['one.txt']}})
+                coda.find_one({'type': 'text'})
+                list(coda.iterate({'type': 'text'}))
+            self.assertEqual(len(logs.output), 3)
+            self.assertIn('1 documents): find {"base_name": {"$in": "?"}, "type": "?"}', logs.output[0])
+            self.assertIn('find_one {"type": "?"}', logs.output[1])
+            self.assertIn('4 documents): iterate {"type": "?"}', logs.output[2])
+        finally:
+            coda.db.session.slow_query = threshold
+        return
+
+
+class TestAdd(unittest.TestCase):
+    """
+    Test bulk add functionality for coda.
+    """
+
+    @parameterized.expand([
+        (1, True),
+        (3, False),
+    ])
+    def test_add_collection(self, batch_size, ordered):
+        cl = coda.find({'type': 'text'})
+        cl.add_metadata(batch='bulk')
+        ret = coda.add(cl, batch_size=batch_size, ordered=ordered)
+        self.assertEqual(ret, {'inserted': 0, 'updated': 4})
+        self.assertEqual(len(coda.find({'batch': 'bulk'})), 4)
+        return
+
+    def test_add_files(self):
+        # files that haven't been loaded are pulled in one query
+        cl = coda.Collection(files=[coda.File(x.path) for x in coda.find({'type': 'text'})])
+        coda.stats(reset=True)
+        cl.add_metadata(batch='files')
+        ret = coda.add(cl)
+        self.assertEqual(ret, {'inserted': 0, 'updated': 4})
+        res = coda.stats()
+        self.assertNotIn('load', res)
+        self.assertEqual(res['prefetch']['count'], 1)
+        self.assertEqual(len(coda.find({'batch': 'files'})), 4)
+        return
+
+
+class TestUpdate(unittest.TestCase):
+    """
+    Test field-level updates for coda.
+    """
+
+    def setUp(self):
+        self.path = coda.find_one({'base_name': 'one.txt'}).path
+        return
+
+    def tearDown(self):
+        coda.db.session.engine.update([(self.path, {'$unset': {'group': True, 'count': True, 'stats': True}})])
+        return
+
+    def test_add_dirty(self):
+        one, two = coda.File(self.path), coda.File(self.path)
+        self.assertEqual((one.cohort, two.cohort), ('simple', 'simple'))
+        one.group = 'one'
+        two.count = 2
+        coda.add(one)
+        coda.add(two)
+        fi = coda.find_one({'path': self.path})
+        self.assertEqual((fi.group, fi.count, fi.cohort), ('one', 2, 'simple'))
+        # removed keys
+        del two.metadata['count']
+        coda.add(two)
+        fi = coda.find_one({'path': self.path})
+        self.assertEqual((fi.group, fi.metadata.get('count')), ('one', None))
+        return
+
+    def test_update(self):
+        fi = coda.File(self.path)
+        fi.count = 1
+        coda.add(fi)
+        ret = coda.update(fi, set={'group': 'test', 'stats.size': 10}, inc={'count': 2})
+        self.assertEqual(ret, {'inserted': 0, 'updated': 1})
+        self.assertEqual((fi.group, fi.count, fi.stats.size), ('test', 3, 10))
+        db = coda.find_one({'path': self.path})
+        self.assertEqual((db.group, db.count, db.stats.size, db.cohort), ('test', 3, 10, 'simple'))
+        # local updates aren't sent again
+        other = coda.File(self.path)
+        other.count
+        coda.update(other, inc={'count': 1})
+        coda.add(fi)
+        self.assertEqual(coda.find_one({'path': self.path}).count, 4)
+        coda.update(fi, unset=['group'])
+        self.assertEqual(fi.metadata.get('group'), None)
+        self.assertEqual(coda.find_one({'path': self.path}).metadata.get('group'), None)
+        return
+
+    def test_update_collection(self):
+        cl = coda.find({'type': 'text'})
+        self.assertEqual(cl.metadata.get('group'), None)
+        coda.update(cl, set={'group': 'text'})
+        self.assertEqual(cl.group, 'text')
+        coda.update(cl, unset=['group'])
+        self.assertEqual(cl.metadata.get('group'), None)
+        return
+
+    def test_update_query(self):
+        ret = coda.update({'type': 'text'}, set={'group': 'text'})
+        self.assertEqual(ret, {'inserted': 0, 'updated': 4})
+        self.assertEqual(len(coda.find({'group': 'text'})), 4)
+        coda.update({'group': 'text'}, unset=['group'])
+        self.assertEqual(coda.find({'group': 'text'}), None)
+        return
+
+    def test_errors(self):
+        fi = coda.File(self.path)
+        with self.assertRaises(AssertionError):
+            coda.update(fi)
+        with self.assertRaises(AssertionError):
+            coda.update(fi, set={'_checksum': None})
+        with self.assertRaises(TypeError):
+            coda.update('group', set={'group': 'test'})
+        return
+
+
+class TestTag(unittest.TestCase):
+    """
+    Test tagging files with metadata for coda.
+    """
+
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp())
+        self.new = os.path.join(self.path, 'new.txt')
+        with open(self.new, 'w') as fh:
+            fh.write('new')
+        return
+
+    def tearDown(self):
+        paths = [x.path for x in coda.find({'type': 'text'})]
+        coda.db.session.engine.update([(x, {'$unset': {'tagged': True}}) for x in paths])
+        coda.delete_query({'path': self.new})
+        shutil.rmtree(self.path)
+        return
+
+    @parameterized.expand([
+        (1, True),
+        (3, False),
+    ])
+    def test_tag(self, batch_size, ordered):
+        paths = [x.path for x in coda.find({'type': 'text'})]
+        ret = coda.tag(iter(paths + [self.new]), {'tagged': 'yes'}, batch_size=batch_size, ordered=ordered)
+        self.assertEqual(ret, {'inserted': 1, 'updated': 4})
+        cl = coda.find({'tagged': 'yes'})
+        self.assertEqual(len(cl), 5)
+        self.assertEqual(len(cl.filter(lambda x: x.metadata.get('cohort') == 'simple')), 4)
+        self.assertEqual(list(coda.listdir(self.path))[0].tagged, 'yes')
+        return
+
+    def test_reserved(self):
+        with self.assertRaises(AssertionError):
+            coda.tag([self.new], {'_stat.size': 10})
+        return
+
+
+class TestCache(unittest.TestCase):
+    """
+    Test local disk cache for coda.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        coda.db.session.cache = True
+        coda.db.session.cache_path = os.path.join(self.tmp, 'cache.db')
+        return
+
+    def tearDown(self):
+        coda.db.session.cache = False
+        coda.db.session._disk_cache = None
+        shutil.rmtree(self.tmp)
+        return
+
+    def test_read_through(self):
+        cache = coda.db.session.disk_cache
+        fi = coda.find_one({'base_name': 'one.txt'})
+        # miss, then hit
+        self.assertEqual(coda.find_one({'path': fi.path}).cohort, 'simple')
+        self.assertEqual(coda.find_one({'path': fi.path}).cohort, 'simple')
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+        # write-through on add
+        fi.group = 'cached'
+        coda.add(fi)
+        coda.db.session.engine.delete({'path': fi.path})
+        self.assertEqual(coda.find_one({'path': fi.path}).group, 'cached')
+        self.assertEqual(coda.File(fi.path).group, 'cached')
+        # removal on delete
+        coda.delete(fi)
+        self.assertEqual(coda.find_one({'path': fi.path}), None)
+        return
+
+    def test_namespace(self):
+        fi = coda.find_one({'base_name': 'one.txt'})
+        self.assertEqual(coda.File(fi.path).cohort, 'simple')
+        # records aren't shared with other databases
+        coda.options(
+            backend=coda.db.session.backend, dbname='coda-testing-other', cache=True,
+            cache_path=os.path.join(self.tmp, 'cache.db'), sqlite_path=os.path.join(self.tmp, 'other.sqlite')
+        )
+        try:
+            self.assertEqual(coda.find_one({'path': fi.path}), None)
+            self.assertEqual(coda.File(fi.path).metadata, {})
+        finally:
+            coda.db.session.engine.drop()
+        return
+
+
+class TestQueryCache(unittest.TestCase):
+    """
+    Test in-memory query result cache for coda.
+    """
+
+    def setUp(self):
+        coda.db.session.query_cache = 8
+        return
+
+    def tearDown(self):
+        coda.db.session.query_cache = 0
+        coda.db.session._result_cache = None
+        return
+
+    def test_invalidation(self):
+        cache = coda.db.session.result_cache
+        self.assertEqual(len(coda.find({'type': 'text'})), 4)
+        self.assertEqual(len(coda.find({'type': 'text'})), 4)
+        self.assertEqual(coda.find_one({'base_name': 'one.txt'}).cohort, 'simple')
+        self.assertEqual(coda.find_one({'base_name': 'one.txt'}).cohort, 'simple')
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (2, 2))
+        # invalidated by writes
+        fi = coda.find_one({'base_name': 'one.txt'})
+        fi.type = 'other'
+        coda.add(fi)
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(len(coda.find({'type': 'text'})), 3)
+        coda.delete(coda.find({'type': 'text'}))
+        self.assertEqual(coda.find({'type': 'text'}), None)
+        return
+
+
+class TestIndex(unittest.TestCase):
+    """
+    Test index management for coda.
+    """
+
+    def test_indexes(self):
+        # add
+        name = coda.ensure_index('cohort')
+        self.assertEqual(name, 'cohort_1')
+        name = coda.ensure_index(['base_name', 'cohort'], unique=True)
+        self.assertEqual(name, 'base_name_1_cohort_1')
+        indexes = {x['name']: x for x in coda.list_indexes()}
+        self.assertEqual(indexes['cohort_1']['keys'], [('cohort', 1)])
+        self.assertFalse(indexes['cohort_1']['unique'])
+        self.assertTrue(indexes['base_name_1_cohort_1']['unique'])
+        # drop
+        coda.drop_index('cohort')
+        coda.drop_index(['base_name', 'cohort'])
+        indexes = [x['name'] for x in coda.list_indexes()]
+        self.assertNotIn('cohort_1', indexes)
+        self.assertNotIn('base_name_1_cohort_1', indexes)
+        with self.assertRaises(AssertionError):
+            coda.drop_index('path')
+        with self.assertRaises(AssertionError):
+            coda.drop_index('_parent')
+        with self.assertRaises(AssertionError):
+            coda.drop_index('cohort')
+        return
+
+    def test_explain(self):
+        res = coda.explain({'type': 'text'})
+        self.assertEqual(res['index'], None)
+        self.assertEqual(res['returned'], 4)
+        self.assertEqual(res['query'], {'type': '?'})
+        coda.ensure_index('type')
+        try:
+            res = coda.explain({'type': 'text'}, sort='base_name')
+            self.assertEqual(res['index'], 'type_1')
+            self.assertEqual(res['returned'], 4)
+        finally:
+            coda.drop_index('type')
+        return
+
+
+class TestListdir(unittest.TestCase):
+    """
+    Test directory listing for coda.
+    """
+
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp(suffix='[a+b]'))
+        os.makedirs(os.path.join(self.path, 'sub.dir'))
+        for name in ['one.txt', os.path.join('sub.dir', 'two.txt')]:
+            with open(os.path.join(self.path, name), 'w') as fh:
+                fh.write(name)
+        return
+
+    def tearDown(self):
+        coda.delete_query({'path': {'$regex': '^' + re.escape(self.path)}})
+        shutil.rmtree(self.path)
+        return
+
+    @parameterized.expand([
+        ('simple', False, ['one.txt']),
+        ('simple', True, ['one.txt', 'four.txt', 'three.txt', 'two.txt']),
+        ('simple/three', False, ['three.txt']),
+        ('simple/three', True, ['four.txt', 'three.txt']),
+        ('simple/missing', True, []),
+    ])
+    def test_listdir(self, path, recursive, names):
+        path = os.path.join(__resources__, path)
+        res = list(coda.listdir(path, recursive=recursive, fields=[]))
+        self.assertEqual(sorted(os.path.basename(x.path) for x in res), sorted(names))
+        return
+
+    def test_metacharacters(self):
+        coda.sync(self.path)
+        res = [x.path for x in coda.listdir(self.path)]
+        self.assertEqual(res, [os.path.join(self.path, 'one.txt')])
+        res = [x.path for x in coda.listdir(self.path, recursive=True)]
+        self.assertEqual(len(res), 2)
+        self.assertEqual(len(list(coda.listdir(self.path[:-1]))), 0)
+        return
+
+    def test_legacy(self):
+        coda.sync(self.path)
+        sub = os.path.join(self.path, 'sub.dir')
+        coda.db.session.engine.update([
+            (os.path.join(sub, 'two.txt'), {'$unset': {'_parent': True}})
+        ])
+        self.assertEqual(coda.db.session.engine.count({'_parent': sub}), 0)
+        # records are upgraded on connect
+        coda.db._backfill(coda.db.session.engine, 100)
+        self.assertEqual(coda.db.session.engine.count({'_parent': sub}), 1)
+        res = [x.path for x in coda.listdir(sub)]
+        self.assertEqual(res, [os.path.join(sub, 'two.txt')])
+        self.assertEqual(len(list(coda.listdir(self.path))), 1)
+        return
+
+
 class TestDeletes(unittest.TestCase):
     """
     Test search functionality for coda.
@@ -92,4 +493,133 @@ class TestDeletes(unittest.TestCase):
         self.assertEqual(cl, None)
         return
 
+    def test_delete_collection(self):
+        cl = coda.find({'type': 'text'})
+        ret = coda.delete(cl, batch_size=3)
+        self.assertEqual(ret, {'deleted': 4})
+        self.assertEqual(coda.find({'type': 'text'}), None)
+        self.assertEqual(len(coda.find({'type': 'source'})), 8)
+        return
+
+    def test_delete_query(self):
+        ret = coda.delete_query({'type': 'source'})
+        self.assertEqual(ret, {'deleted': 8})
+        self.assertEqual(coda.find({'type': 'source'}), None)
+        self.assertEqual(len(coda.find({'type': 'text'})), 4)
+        return
+
 
+class TestSync(unittest.TestCase):
+    """
+    Test directory synchronization for coda.
+    """
+
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp())
+        os.makedirs(os.path.join(self.path, 'sub'))
+        for name in ['one.txt', 'two.txt', os.path.join('sub', 'three.txt')]:
+            with open(os.path.join(self.path, name), 'w') as fh:
+                fh.write(name)
+        return
+
+    def tearDown(self):
+        coda.delete_query({'path': {'$regex': '^' + self.path}})
+        shutil.rmtree(self.path)
+        return
+
+    def test_sync(self):
+        # initial sync
+        ret = coda.sync(self.path)
+        self.assertEqual(ret['inserted'], 3)
+        self.assertEqual(len(coda.find({'path': {'$regex': '^' + self.path}})), 3)
+        # unchanged
+        one = os.path.join(self.path, 'one.txt')
+        coda.add(coda.File(one, metadata={'group': 'test'}))
+        ret = coda.sync(self.path)
+        self.assertEqual((ret['inserted'], ret['updated'], ret['unchanged']), (0, 0, 3))
+        # modified
+        with open(one, 'a') as fh:
+            fh.write('more data')
+        ret = coda.sync(self.path)
+        self.assertEqual((ret['inserted'], ret['updated'], ret['unchanged']), (0, 1, 2))
+        self.assertEqual(coda.find_one({'path': one}).group, 'test')
+        # removed
+        os.remove(os.path.join(self.path, 'two.txt'))
+        ret = coda.sync(self.path)
+        self.assertEqual(ret['deleted'], 0)
+        ret = coda.sync(self.path, delete=True)
+        self.assertEqual((ret['unchanged'], ret['deleted']), (2, 1))
+        self.assertEqual(len(coda.find({'path': {'$regex': '^' + self.path}})), 2)
+        return
+
+    def test_sync_symlink(self):
+        # files outside the directory are tracked by their real path
+        outside = os.path.realpath(tempfile.mkdtemp())
+        try:
+            with open(os.path.join(outside, 'four.txt'), 'w') as fh:
+                fh.write('four.txt')
+            os.symlink(outside, os.path.join(self.path, 'link'))
+            ret = coda.sync(self.path)
+            self.assertEqual(ret['inserted'], 4)
+            ret = coda.sync(self.path, delete=True)
+            self.assertEqual((ret['inserted'], ret['updated'], ret['unchanged'], ret['deleted']), (0, 0, 4, 0))
+        finally:
+            coda.delete_query({'path': {'$regex': '^' + outside}})
+            shutil.rmtree(outside)
+        return
+
+    def test_add_modified(self):
+        one = os.path.join(self.path, 'one.txt')
+        fi = coda.File(one, metadata={'group': 'test'})
+        coda.add(fi)
+        with open(one, 'a') as fh:
+            fh.write('more data')
+        fi.group = 'train'
+        coda.add(fi)
+        ret = coda.sync(self.path)
+        self.assertEqual((ret['inserted'], ret['updated'], ret['unchanged']), (2, 0, 1))
+        return
+
+    def test_sync_checksum(self):
+        with open(os.path.join(self.path, 'sub', 'copy.txt'), 'w') as fh:
+            fh.write('one.txt')
+        ret = coda.sync(self.path, checksum=True)
+        self.assertEqual((ret['inserted'], ret['hashed']), (4, 4))
+        ret = coda.sync(self.path, checksum=True)
+        self.assertEqual(ret['hashed'], 0)
+        # duplicates
+        dupes = coda.duplicates({'path': {'$regex': '^' + self.path}})
+        self.assertEqual(len(dupes), 1)
+        self.assertEqual(dupes[0]['paths'], [
+            os.path.join(self.path, 'one.txt'),
+            os.path.join(self.path, 'sub', 'copy.txt')
+        ])
+        return
+
+
+class TestChecksum(unittest.TestCase):
+    """
+    Test checksum functionality for coda.
+    """
+
+    @parameterized.expand([
+        ('sha256', False),
+        ('md5', True),
+    ])
+    def test_checksum(self, algorithm, processes):
+        cl = coda.find({'type': 'text'})
+        ret = coda.checksum(cl, algorithm=algorithm, processes=processes)
+        self.assertEqual(ret, {'hashed': 4, 'skipped': 0})
+        ret = coda.checksum(cl, algorithm=algorithm)
+        self.assertEqual(ret, {'hashed': 0, 'skipped': 4})
+        # checksums are kept when metadata is updated
+        cl.add_metadata(group='test')
+        coda.add(cl)
+        ret = coda.checksum(coda.find({'type': 'text'}), algorithm=algorithm)
+        self.assertEqual(ret, {'hashed': 0, 'skipped': 4})
+        # resource files are all empty
+        dupes = coda.duplicates({'type': 'text'})
+        self.assertEqual(len(dupes), 1)
+        self.assertEqual(dupes[0]['algorithm'], algorithm)
+        self.assertEqual(dupes[0]['paths'], sorted(cl.filelist))
+        return
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# testing for coda
+#
+# @author <bprinty@gmail.com>
+# ------------------------------------------------
+
+
+# imports
+# -------
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+import coda
+from coda.metrics import Metrics, metrics
+from coda.backends.mongo import CommandMetrics
+
+
+# metrics
+# -------
+class TestMetrics(unittest.TestCase):
+
+    def test_record(self):
+        registry = Metrics(samples=100)
+        for idx in range(1, 101):
+            registry.record('find', idx / 1000.0, documents=2)
+        with registry.timer('add') as timer:
+            timer.documents = 5
+        res = registry.summary()
+        self.assertEqual((res['find']['count'], res['find']['documents']), (100, 200))
+        self.assertAlmostEqual(res['find']['total'], 5.05)
+        self.assertEqual((res['find']['p50'], res['find']['p90'], res['find']['p99']), (0.05, 0.09, 0.099))
+        self.assertEqual(res['add']['documents'], 5)
+        registry.enabled = False
+        registry.record('find', 1.0)
+        self.assertEqual(registry.summary()['find']['count'], 100)
+        registry.reset()
+        self.assertEqual(registry.summary(), {})
+        return
+
+    def test_dump(self):
+        tmp = tempfile.mkdtemp()
+        registry = Metrics()
+        registry.timed('double', documents=len)(lambda x: x * 2)([1, 2])
+        registry.dump(os.path.join(tmp, 'stats.json'))
+        with open(os.path.join(tmp, 'stats.json'), 'r') as fh:
+            self.assertEqual(json.load(fh)['double']['documents'], 4)
+        self.assertTrue('double' in registry.table())
+        shutil.rmtree(tmp)
+        return
+
+    def test_commands(self):
+        listener = CommandMetrics()
+        listener.succeeded(SimpleNamespace(
+            command_name='find', duration_micros=1500,
+            reply={'cursor': {'firstBatch': [{}, {}, {}]}}
+        ))
+        listener.succeeded(SimpleNamespace(command_name='update', duration_micros=500, reply={'n': 2}))
+        res = coda.stats(reset=True)
+        self.assertEqual((res['command.find']['documents'], res['command.find']['max']), (3, 0.0015))
+        self.assertEqual(res['command.update']['documents'], 2)
+        return
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        return
+
+    def test_operations(self):
+        cl = coda.find({'type': 'text'})
+        coda.find_one({'type': 'missing'})
+        coda.add(cl)
+        fi = coda.File(cl[0].path)
+        fi.metadata
+        self.assertEqual(len(list(coda.iterate({'type': 'text'}))), 4)
+        res = coda.stats()
+        self.assertEqual((res['find']['count'], res['find']['documents']), (1, 4))
+        self.assertEqual((res['find_one']['count'], res['find_one']['documents']), (1, 0))
+        self.assertEqual(res['add']['documents'], 4)
+        self.assertEqual(res['load']['documents'], 1)
+        self.assertEqual(res['iterate']['documents'], 4)
+        self.assertEqual(sorted(coda.stats(reset=True)), sorted(res))
+        self.assertEqual(coda.stats(), {})
+        return
@@ -12,6 +12,8 @@
 import unittest
 import os
 import json
+import shutil
+import tempfile
 import subprocess
 from parameterized import parameterized
 
@@ -125,6 +127,57 @@ class TestCollection(unittest.TestCase):
         )
         return
 
+    def test_prefetch(self):
+        # automatic prefetch on first metadata access
+        cl = coda.Collection(os.path.join(__resources__, 'simple'))
+        self.assertFalse(any([x._synced for x in cl]))
+        self.assertEqual(cl.files[0].cohort, 'simple')
+        self.assertTrue(all([x._synced for x in cl]))
+        self.assertEqual(
+            sorted([x.base_name for x in cl.filter(lambda x: x.type == 'text')]),
+            sorted(['one.txt', 'four.txt', 'three.txt', 'two.txt'])
+        )
+        # explicit prefetch
+        one = os.path.join(__resources__, 'simple', 'one.txt')
+        two = os.path.join(__resources__, 'simple', 'two', 'two.txt')
+        cl = coda.File(one) + coda.File(two)
+        cl.prefetch()
+        self.assertTrue(all([x._synced for x in cl]))
+        self.assertEqual(cl.cohort, 'simple')
+        return
+
+    @parameterized.expand([
+        ({}, ['one.txt', 'four.txt', 'three.txt', 'two.txt']),
+        ({'depth': 0}, ['one.txt']),
+        ({'depth': 1, 'workers': 1}, ['one.txt', 'three.txt', 'two.txt']),
+        ({'include': ['t*.txt']}, ['three.txt', 'two.txt']),
+        ({'include': ['three/*']}, ['four.txt', 'three.txt']),
+        ({'exclude': ['three']}, ['one.txt', 'two.txt']),
+    ])
+    def test_properties_crawl(self, options, names):
+        cl = coda.Collection(os.path.join(__resources__, 'simple'), **options)
+        self.assertEqual(sorted([x.name for x in cl.files]), sorted(names))
+        self.assertTrue(all([os.path.isfile(x.path) for x in cl.files]))
+        return
+
+    def test_crawl_symlinks(self):
+        tmp = os.path.realpath(tempfile.mkdtemp())
+        try:
+            for name in ['a', 'b']:
+                os.makedirs(os.path.join(tmp, name))
+                with open(os.path.join(tmp, name, name + '.txt'), 'w') as fh:
+                    fh.write(name)
+            os.symlink('..', os.path.join(tmp, 'a', 'up'))
+            os.symlink(os.path.join(tmp, 'b'), os.path.join(tmp, 'a', 'sibling'))
+            os.symlink(os.path.join(tmp, 'missing.txt'), os.path.join(tmp, 'b', 'broken.txt'))
+            paths = list(coda.objects.crawl(tmp))
+            self.assertEqual(sorted(paths), [os.path.join(tmp, 'a', 'a.txt'), os.path.join(tmp, 'b', 'b.txt')])
+            paths = [path for path, info in coda.objects.crawl(tmp, stat=True)]
+            self.assertEqual(sorted(paths), [os.path.join(tmp, 'a', 'a.txt'), os.path.join(tmp, 'b', 'b.txt')])
+        finally:
+            shutil.rmtree(tmp)
+        return
+
     def test_filter(self):
         cl = coda.Collection(os.path.join(__resources__, 'simple'))
         cl2 = cl.filter(lambda x: 'o' in x.name)
@@ -155,6 +208,21 @@ class TestCollection(unittest.TestCase):
         # subtraction
         self.assertEqual(cl, cl2 - f3)
         self.assertEqual(cl2 - cl, coda.Collection(files=[f3]))
+        # union and intersection
+        self.assertEqual((cl | f3).files, [f1, f2, f3])
+        self.assertEqual((cl | cl2).files, [f1, f2, f3])
+        self.assertEqual((cl2 & cl).files, [f1, f2])
+        self.assertEqual((cl2 & f3).files, [f3])
+        self.assertEqual(len(cl & f3), 0)
+        # membership after modifying files
+        cl4 = coda.Collection(files=[f1])
+        self.assertFalse(f2 in cl4)
+        cl4.files.append(f2)
+        self.assertTrue(f2 in cl4)
+        cl4.files[1] = f3
+        self.assertFalse(f2 in cl4)
+        self.assertTrue(f3 in cl4)
+        self.assertEqual((cl4 - cl).files, [f3])
         # equality
         self.assertNotEqual(f1, f2)
         self.assertEqual(f1, cl[0])
@@ -165,6 +233,33 @@ class TestCollection(unittest.TestCase):
         self.assertEqual([i for i in cl], [i for i in cl.files])
         return
 
+    def test_metadata_cache(self):
+        one = os.path.join(__resources__, 'simple', 'one.txt')
+        two = os.path.join(__resources__, 'simple', 'two', 'two.txt')
+        three = os.path.join(__resources__, 'simple', 'three', 'four', 'four.txt')
+        f1 = coda.File(one, metadata={'filetype': 'text', 'content': 'data'})
+        f2 = coda.File(two, metadata={'filetype': 'text', 'content': 'data'})
+        f3 = coda.File(three, metadata={'filetype': 'text', 'content': {'some': 'data'}})
+        cl = f1 + f2
+        self.assertEqual(cl.metadata.json(), {'filetype': 'text', 'content': 'data'})
+        # incremental update on addition
+        cl2 = cl + f3
+        self.assertFalse(cl2._stale)
+        self.assertEqual(cl2.metadata.json(), {'filetype': 'text'})
+        # incremental update on add_metadata
+        cl2.add_metadata(group='test')
+        self.assertEqual(cl2.metadata.json(), {'filetype': 'text', 'group': 'test'})
+        # explicit invalidation
+        f1.metadata.filetype = 'binary'
+        self.assertEqual(cl.filetype, 'text')
+        cl.invalidate()
+        self.assertEqual(cl.metadata.json(), {'content': 'data', 'group': 'test'})
+        # a priori metadata
+        cl3 = coda.Collection(files=[f1, f2], metadata={'group': 'other'})
+        cl3.invalidate()
+        self.assertEqual(cl3.metadata.json(), {'group': 'other'})
+        return
+
     def test_add_metadata(self):
         one = os.path.join(__resources__, 'simple', 'one.txt')
         two = os.path.join(__resources__, 'simple', 'two', 'two.txt')
@@ -189,3 +284,27 @@ class TestCollection(unittest.TestCase):
         self.assertEqual(cl.newestproperty, 'newestvalue')
         self.assertEqual(list(map(lambda x: x.newestproperty, cl)), ['newestvalue']*len(cl))
         return
+
+
+class TestLazyCollection(unittest.TestCase):
+
+    def test_lazy(self):
+        one = os.path.join(__resources__, 'simple', 'one.txt')
+        two = os.path.join(__resources__, 'simple', 'two', 'two.txt')
+        three = os.path.join(__resources__, 'simple', 'three', 'four', 'four.txt')
+        f1 = coda.File(one, metadata={'filetype': 'text', 'content': 'data'})
+        f2 = coda.File(two, metadata={'filetype': 'text', 'content': 'nothing'})
+        f3 = coda.File(three, metadata={'filetype': 'text', 'content': {'some': 'data'}})
+        cl = coda.LazyCollection(files=(x for x in [f1, f2, f3]), count=lambda: 3)
+        # length and indexing without materializing
+        self.assertEqual(len(cl), 3)
+        self.assertEqual(cl[1], f2)
+        self.assertFalse(cl.materialized)
+        # iteration
+        self.assertEqual([x for x in cl], [f1, f2, f3])
+        self.assertTrue(cl.materialized)
+        # operators
+        self.assertEqual(cl - f3, f1 + f2)
+        self.assertEqual(cl, (f1 + f2) + cl)
+        self.assertEqual(cl.filetype, 'text')
+        return